@@ -4,11 +4,24 @@ build_and_run.py
 このスクリプトはすべてのym2151-emulator-examplesアプリをビルドし、一つずつ実行できるようにします。
 用途：物理スピーカーでの人力テストを効率化します。
 Windows専用です。
+
+--bench を指定すると、対話メニューの代わりにヘッドレスのベンチマークを実行します。
+共通のレジスタスクリプトを各実装でraw PCMにレンダリングし、処理時間と
+Python版（基準）との一致（ビット一致またはSNR）を表にして表示します。
 """
 
+import argparse
+import math
 import os
+import random
+import re
 import subprocess
+import sys
+import tempfile
+import time
+from array import array
 from pathlib import Path
+from typing import List, NamedTuple, Optional
 
 # Directory and path constants
 DIR_PYTHON = "src/python"
@@ -17,6 +30,14 @@ DIR_GO = "src/go"
 DIR_TYPESCRIPT = "src/typescript_deno"
 PATH_RUST_RELEASE = "target/release"
 
+# Benchmark settings: native rate of a 4 MHz YM2151 (clock / 64)
+BENCH_SAMPLE_RATE = 62500
+BENCH_SECONDS = 10.0
+# Largest output delay (in samples) searched when aligning for the SNR
+BENCH_MAX_LAG = 64
+# Samples used to find the alignment
+BENCH_ALIGN_WINDOW = 8192
+
 
 class Colors:
     """ANSI color codes for terminal output"""
@@ -133,7 +154,7 @@ def build_go(script_dir: Path) -> None:
     env["CGO_ENABLED"] = "1"
     
     result = subprocess.run(
-        ["go", "build", "-o", "ym2151-example.exe", "main.go"],
+        ["go", "build", "-o", "ym2151-example.exe", "."],
         cwd=go_dir,
         env=env,
         check=False,
@@ -279,14 +300,231 @@ def run_application(choice: str, script_dir: Path) -> bool:
         return True
 
 
+class BenchResult(NamedTuple):
+    """Result of one implementation in the benchmark"""
+
+    name: str
+    error: Optional[str] = None
+    wall: float = 0.0  # process wall time including startup [s]
+    render: float = 0.0  # render time reported by the implementation [s]
+    exact: bool = False  # bit-exact with the reference
+    snr: Optional[float] = None  # SNR against the reference [dB]
+    lag: int = 0  # output delay relative to the reference [samples]
+
+
+def write_bench_script(path: Path, num_samples: int) -> int:
+    """
+    Write the fixed register script used by the benchmark.
+
+    Format (shared by all front ends): one "<sample> <address> <data>" write
+    per line, sample in decimal at the native rate, address and data in hex.
+    The content only depends on num_samples, so runs are reproducible.
+
+    Returns:
+        Number of register writes
+    """
+    rng = random.Random(2151)
+    lines = ["# YM2151 benchmark register script", "# <sample> <address> <data>"]
+
+    def write(sample: int, address: int, data: int) -> None:
+        lines.append(f"{sample} {address:02X} {data:02X}")
+
+    # One voice per channel, each with a different algorithm
+    write(0, 0x18, 0xC0)  # LFO frequency
+    write(0, 0x19, 0x90)  # PMD
+    write(0, 0x1B, 0x02)  # LFO waveform: triangle
+    for channel in range(8):
+        write(0, 0x20 + channel, 0xC0 | (channel % 4) << 3 | channel)  # RL, FB, CON
+        write(0, 0x38 + channel, 0x10 if channel % 2 else 0x00)  # PMS
+        for op in range(4):
+            slot = channel + op * 8
+            write(0, 0x40 + slot, rng.randint(1, 4))  # DT1=0, MUL
+            write(0, 0x60 + slot, rng.randint(0x08, 0x28))  # TL
+            write(0, 0x80 + slot, 0x1F)  # KS=0, AR=31
+            write(0, 0xA0 + slot, rng.randint(0, 8))  # D1R
+            write(0, 0xC0 + slot, rng.randint(0, 4))  # D2R
+            write(0, 0xE0 + slot, 0x37)  # D1L=3, RR=7
+
+    # A note every 1/8 s, cycling through the channels
+    notes = [0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14]
+    step = BENCH_SAMPLE_RATE // 8
+    for index, sample in enumerate(range(step, num_samples, step)):
+        channel = index % 8
+        write(sample, 0x08, channel)  # key off
+        write(sample, 0x28 + channel, rng.randint(2, 6) << 4 | rng.choice(notes))  # KC
+        write(sample, 0x08, 0x78 | channel)  # key on
+
+    path.write_text("\n".join(lines) + "\n")
+    return len(lines) - 2
+
+
+def bench_commands(script_dir: Path) -> List[tuple]:
+    """
+    Headless render commands of the implementations that have been built.
+
+    Returns:
+        (name, command prefix, working directory) tuples; the script, output
+        and sample count are appended to the command. Python comes first and
+        is the reference.
+    """
+    commands = [("Python", [sys.executable, "script_render.py"], script_dir / DIR_PYTHON)]
+
+    rust_dir = script_dir / DIR_RUST / PATH_RUST_RELEASE
+    for exe in ("ym2151-example.exe", "ym2151-example"):
+        if (rust_dir / exe).exists():
+            commands.append(("Rust", [str(rust_dir / exe), "--render"], script_dir))
+            break
+    else:
+        log_warning("Rust版の実行ファイルが見つかりません。スキップします。")
+
+    go_exe = script_dir / DIR_GO / "ym2151-example.exe"
+    if go_exe.exists():
+        commands.append(("Go", [str(go_exe), "--render"], script_dir))
+    else:
+        log_warning("Go版の実行ファイルが見つかりません。スキップします。")
+
+    ts_dir = script_dir / DIR_TYPESCRIPT
+    if (ts_dir / "dist" / "index-render.js").exists() and command_exists("node"):
+        commands.append(("TypeScript", ["node", "dist/index-render.js"], ts_dir))
+    else:
+        log_warning("TypeScript版のビルド済みファイルが見つかりません。スキップします。")
+
+    return commands
+
+
+def read_pcm(path: Path) -> array:
+    """Read interleaved little-endian int32 PCM"""
+    samples = array("i")
+    if samples.itemsize != 4:
+        samples = array("l")
+    samples.frombytes(path.read_bytes())
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def _error_energy(ref: array, out: array, lag: int, start: int, end: int) -> float:
+    """Squared error of out delayed by lag frames over ref[start:end]"""
+    offset = lag * 2
+    begin = max(start, -offset)
+    stop = min(end, len(out) - offset)
+    return float(sum((ref[i] - out[i + offset]) ** 2 for i in range(begin, stop)))
+
+
+def compare_pcm(ref: array, out: array) -> tuple:
+    """
+    Compare an output against the reference.
+
+    Returns:
+        (bit-exact, SNR in dB or None for silence, lag in frames); the SNR
+        is taken at the delay that best aligns the two outputs
+    """
+    if ref == out:
+        return True, math.inf, 0
+    length = min(len(ref), len(out))
+    # Align on the start of the sound rather than on leading silence
+    start = next((i for i in range(length) if ref[i]), 0)
+    end = min(length, start + BENCH_ALIGN_WINDOW * 2)
+    lag = min(range(-BENCH_MAX_LAG, BENCH_MAX_LAG + 1),
+              key=lambda lag: _error_energy(ref, out, lag, start, end))
+    signal = float(sum(value * value for value in ref[:length]))
+    noise = _error_energy(ref, out, lag, 0, length)
+    if signal == 0:
+        return False, None, lag
+    if noise == 0:
+        return False, math.inf, lag
+    return False, 10 * math.log10(signal / noise), lag
+
+
+def run_benchmark(script_dir: Path, seconds: float) -> int:
+    """
+    Render the benchmark script with every built implementation.
+
+    Returns:
+        Exit code (1 if the reference could not be rendered)
+    """
+    num_samples = int(seconds * BENCH_SAMPLE_RATE)
+    print("=" * 50)
+    print("  ベンチマーク（ヘッドレスレンダリング）")
+    print("=" * 50)
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        script = tmp_dir / "script.txt"
+        writes = write_bench_script(script, num_samples)
+        log_info(f"{seconds}秒（{num_samples}サンプル、{BENCH_SAMPLE_RATE}Hz）、レジスタ書き込み{writes}回")
+
+        results = []
+        reference = None
+        for name, command, cwd in bench_commands(script_dir):
+            output = tmp_dir / f"{name.lower()}.raw"
+            log_info(f"{name}版をレンダリング中...")
+            start = time.perf_counter()
+            proc = subprocess.run(
+                command + [str(script), str(output), str(num_samples)],
+                cwd=cwd, capture_output=True, text=True, check=False,
+            )
+            wall = time.perf_counter() - start
+            match = re.search(r"elapsed:\s*([0-9.]+)", proc.stdout)
+            if proc.returncode != 0 or not match or not output.exists():
+                message = (proc.stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]
+                log_error(f"{name}版: {message}")
+                results.append(BenchResult(name, error=message))
+                continue
+
+            pcm = read_pcm(output)
+            if reference is None:
+                reference = pcm
+            exact, snr, lag = compare_pcm(reference, pcm)
+            results.append(BenchResult(name, None, wall, float(match.group(1)), exact, snr, lag))
+
+    print()
+    print(f"{'impl':<11} {'wall[s]':>8} {'render[s]':>10} {'x realtime':>11} "
+          f"{'match':>10} {'SNR[dB]':>8} {'lag':>5}")
+    for result in results:
+        if result.error:
+            print(f"{result.name:<11} {'failed':>8}")
+            continue
+        if result.exact:
+            match, snr = "bit-exact", "inf"
+        else:
+            match = "differs"
+            snr = "-" if result.snr is None else f"{result.snr:.1f}"
+        realtime = seconds / result.render if result.render else math.inf
+        print(f"{result.name:<11} {result.wall:>8.3f} {result.render:>10.3f} {realtime:>11.1f} "
+              f"{match:>10} {snr:>8} {result.lag:>5}")
+    print()
+    print("基準: Python版。TypeScript版はymfm（別のエミュレータ）のためビット一致しません。")
+
+    return 0 if results and not results[0].error else 1
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="YM2151 Emulator Examples ビルド＆実行")
+    parser.add_argument("--bench", action="store_true",
+                        help="対話メニューの代わりにヘッドレスのベンチマークを実行")
+    parser.add_argument("--seconds", type=float, default=BENCH_SECONDS,
+                        help=f"ベンチマークでレンダリングする秒数（デフォルト: {BENCH_SECONDS}）")
+    parser.add_argument("--no-build", action="store_true", help="ビルドを省略")
+    return parser.parse_args()
+
+
 def main() -> None:
     """Main function"""
+    args = parse_args()
+
     # Get script directory
     script_dir = Path(__file__).parent.resolve()
     os.chdir(script_dir)
 
     # Build all applications
-    build_all(script_dir)
+    if not args.no_build:
+        build_all(script_dir)
+
+    if args.bench:
+        sys.exit(run_benchmark(script_dir, args.seconds))
 
     # Interactive menu loop
     while True:
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Nuked-OPM Shared Library Builder for the Python wrapper
+このスクリプトは、同梱のNuked-OPMソース(src/rust/nuked-opm/opm.c)と
+src/python/opm_render.c から、Python版用の最適化済み共有ライブラリをビルドします
+（opm_render.c が opm.c をインクルードするため、コンパイルするのは opm_render.c のみです）
+
+出力ファイル（src/python/ に配置）:
+  Windows: ym2151.dll
+  macOS:   libym2151.dylib
+  Linux:   libym2151.so
+
+コンパイラは環境変数 CC で指定できます（例: "zig cc"）。
+未指定の場合は zig cc, cc, gcc, clang の順に探します。
+"""
+
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+# スクリプトのディレクトリ
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+
+PYTHON_DIR = PROJECT_ROOT / "src" / "python"
+NUKED_OPM_DIR = PROJECT_ROOT / "src" / "rust" / "nuked-opm"
+
+# opm_render.c は opm.c をインクルードする（静的関数を使うため）
+SOURCES = [
+    PYTHON_DIR / "opm_render.c",
+]
+
+OPTIMIZE_FLAGS = ["-O3"]
+
+
+def library_name(platform: str = sys.platform) -> str:
+    """プラットフォームごとの共有ライブラリ名を返す"""
+    if platform.startswith("win"):
+        return "ym2151.dll"
+    if platform == "darwin":
+        return "libym2151.dylib"
+    return "libym2151.so"
+
+
+def find_compiler() -> list:
+    """Cコンパイラのコマンドを探す"""
+    env_cc = os.environ.get("CC")
+    if env_cc:
+        return shlex.split(env_cc)
+
+    if shutil.which("zig"):
+        return ["zig", "cc"]
+    for name in ("cc", "gcc", "clang"):
+        if shutil.which(name):
+            return [name]
+    return []
+
+
+def build_command(compiler: list, output_path: Path, platform: str = sys.platform) -> list:
+    """コンパイルコマンドを組み立てる"""
+    cmd = list(compiler) + OPTIMIZE_FLAGS + ["-shared"]
+    if not platform.startswith("win"):
+        cmd += ["-fPIC"]
+    cmd += ["-I", str(NUKED_OPM_DIR)]
+    cmd += [str(src) for src in SOURCES]
+    cmd += ["-o", str(output_path)]
+    return cmd
+
+
+def build(output_path: Path) -> bool:
+    """共有ライブラリをビルドする"""
+    compiler = find_compiler()
+    if not compiler:
+        print("✗ Cコンパイラが見つかりません（環境変数 CC で指定できます）")
+        return False
+
+    cmd = build_command(compiler, output_path)
+    print(f"Building: {output_path}")
+    print(f"   using: {' '.join(cmd)}")
+
+    try:
+        result = subprocess.run(cmd, check=False)
+    except FileNotFoundError as e:
+        print(f"✗ Failed to run compiler: {e}")
+        return False
+
+    if result.returncode != 0:
+        print("✗ Build failed")
+        return False
+
+    print("✓ Built successfully")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Nuked-OPM Shared Library Builder (Python)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=Path,
+        default=PYTHON_DIR / library_name(),
+        help=f"出力先 (デフォルト: src/python/{library_name()})"
+    )
+    args = parser.parse_args()
+
+    print("=========================================")
+    print("Nuked-OPM Shared Library Builder")
+    print("=========================================")
+    print()
+
+    success = build(args.output)
+
+    print()
+    print("=========================================")
+    if success:
+        print("ライブラリのビルドが完了しました！")
+    else:
+        print("ライブラリのビルドに失敗しました")
+        print("詳細は上記のログを確認してください")
+    print("=========================================")
+    print()
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,7 @@ package main
 import "C"
 import (
 	"fmt"
+	"os"
 	"time"
 
 	"github.com/gordonklaus/portaudio"
@@ -21,6 +22,15 @@ const (
 )
 
 func main() {
+	// Headless mode for build_and_run.py --bench
+	if len(os.Args) > 1 && os.Args[1] == "--render" {
+		if err := runRender(os.Args[2:]); err != nil {
+			fmt.Fprintf(os.Stderr, "Error: %v\n", err)
+			os.Exit(1)
+		}
+		return
+	}
+
 	fmt.Println("YM2151 (OPM) Emulator Example - Go + Nuked-OPM")
 	fmt.Println("===============================================")
 
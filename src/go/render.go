@@ -0,0 +1,144 @@
+package main
+
+// Headless render of a register script to raw PCM.
+//
+// Used by build_and_run.py --bench to compare the front ends. The script
+// and output formats are shared with src/python/script_render.py:
+//
+//   - script: one "<sample> <address> <data>" write per line (decimal native
+//     sample, hexadecimal address and data), '#' starts a comment
+//   - output: interleaved stereo little-endian int32 at the native rate
+//     (clock / 64), exactly as returned by OPM_Clock
+
+/*
+#include "opm.h"
+*/
+import "C"
+import (
+	"bufio"
+	"encoding/binary"
+	"fmt"
+	"os"
+	"strconv"
+	"strings"
+	"time"
+)
+
+const (
+	// OPM_Clock calls per native sample (one sample every 64 master clocks)
+	nativeClocksPerSample = 32
+	// Clocks between two port writes: the address byte must be latched
+	// before the data byte overwrites the shared data bus
+	writeDelay = 2
+)
+
+// renderEvent is a register write scheduled at an absolute chip clock
+type renderEvent struct {
+	cycle   uint64
+	address uint8
+	data    uint8
+}
+
+func loadScript(path string) ([]renderEvent, error) {
+	file, err := os.Open(path)
+	if err != nil {
+		return nil, err
+	}
+	defer file.Close()
+
+	var events []renderEvent
+	scanner := bufio.NewScanner(file)
+	for number := 1; scanner.Scan(); number++ {
+		line := strings.TrimSpace(strings.SplitN(scanner.Text(), "#", 2)[0])
+		if line == "" {
+			continue
+		}
+		fields := strings.Fields(line)
+		if len(fields) != 3 {
+			return nil, fmt.Errorf("%s:%d: expected '<sample> <address> <data>'", path, number)
+		}
+		sample, err1 := strconv.ParseUint(fields[0], 10, 64)
+		address, err2 := strconv.ParseUint(fields[1], 16, 8)
+		data, err3 := strconv.ParseUint(fields[2], 16, 8)
+		if err1 != nil || err2 != nil || err3 != nil {
+			return nil, fmt.Errorf("%s:%d: expected '<sample> <address> <data>'", path, number)
+		}
+		events = append(events, renderEvent{sample * nativeClocksPerSample, uint8(address), uint8(data)})
+	}
+	return events, scanner.Err()
+}
+
+// renderScript renders samples native samples of the script and returns the render time
+func renderScript(events []renderEvent, samples uint64, out *bufio.Writer) (time.Duration, error) {
+	var chip C.opm_t
+	C.OPM_Reset(&chip)
+
+	var output [2]C.int32_t
+	var cycle uint64
+	var wait int
+	var pending bool
+	var pendingData uint8
+	next := 0
+	frame := make([]byte, 8)
+
+	start := time.Now()
+	for i := uint64(0); i < samples; i++ {
+		for j := 0; j < nativeClocksPerSample; j++ {
+			// Same write timing as the Python scheduler (opm_render.c)
+			if wait == 0 {
+				if pending {
+					C.OPM_Write(&chip, 1, C.uint8_t(pendingData))
+					pending = false
+					wait = writeDelay
+				} else if next < len(events) && events[next].cycle <= cycle && C.OPM_Read(&chip, 0)&0x80 == 0 {
+					C.OPM_Write(&chip, 0, C.uint8_t(events[next].address))
+					pendingData = events[next].data
+					pending = true
+					wait = writeDelay
+					next++
+				}
+			}
+			C.OPM_Clock(&chip, &output[0], nil, nil, nil)
+			cycle++
+			if wait > 0 {
+				wait--
+			}
+		}
+		binary.LittleEndian.PutUint32(frame[0:], uint32(output[0]))
+		binary.LittleEndian.PutUint32(frame[4:], uint32(output[1]))
+		if _, err := out.Write(frame); err != nil {
+			return 0, err
+		}
+	}
+	if err := out.Flush(); err != nil {
+		return 0, err
+	}
+	return time.Since(start), nil
+}
+
+// runRender is the entry point for "ym2151-example --render <script> <output> <samples>"
+func runRender(args []string) error {
+	if len(args) != 3 {
+		return fmt.Errorf("usage: ym2151-example --render <script> <output> <samples>")
+	}
+	samples, err := strconv.ParseUint(args[2], 10, 64)
+	if err != nil {
+		return fmt.Errorf("invalid sample count: %s", args[2])
+	}
+	events, err := loadScript(args[0])
+	if err != nil {
+		return err
+	}
+	file, err := os.Create(args[1])
+	if err != nil {
+		return err
+	}
+	defer file.Close()
+
+	elapsed, err := renderScript(events, samples, bufio.NewWriter(file))
+	if err != nil {
+		return err
+	}
+	fmt.Printf("elapsed: %.6f\n", elapsed.Seconds())
+	return nil
+}
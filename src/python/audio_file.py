@@ -0,0 +1,184 @@
+"""
+Incremental audio file output for offline rendering.
+
+AudioFileWriter appends blocks to a WAV (standard library wave) or FLAC
+(optional soundfile package) file as they are rendered, so long renders
+never hold more than one block in memory.
+"""
+import os
+import wave
+from contextlib import ExitStack
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+# Supported formats by file extension
+FORMATS = {'.wav': 'wav', '.flac': 'flac'}
+
+
+def format_for_path(path: str) -> str:
+    """
+    Pick the output format from the file extension
+
+    Raises:
+        ValueError: If the extension is not supported
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported output format: {ext or path} (use .wav or .flac)")
+    return FORMATS[ext]
+
+
+def to_pcm16(block: np.ndarray) -> np.ndarray:
+    """
+    Convert a block to int16
+
+    Integer blocks are chip output (approximately 16-bit range) and are
+    clipped; float blocks are in [-1.0, 1.0] as produced for playback and
+    are scaled, rounded and clipped.
+    """
+    if np.issubdtype(block.dtype, np.floating):
+        block = np.rint(block * 32768.0)
+    return np.clip(block, -32768, 32767).astype('<i2')
+
+
+class AudioFileWriter:
+    """Writes 16-bit PCM blocks to a WAV or FLAC file"""
+
+    def __init__(self, path: str, sample_rate: float, channels: int = 2,
+                 format: Optional[str] = None):
+        """
+        Open an output file
+
+        Args:
+            path: Output path
+            sample_rate: Sample rate in Hz (rounded to an integer)
+            channels: Number of channels per frame
+            format: 'wav' or 'flac' (default: from the file extension)
+
+        Raises:
+            ValueError: If the format is not supported
+            ImportError: If FLAC is requested and soundfile is not installed
+        """
+        self.path = path
+        self.format = format or format_for_path(path)
+        self.sample_rate = round(sample_rate)
+        self.channels = channels
+        # Frames written so far
+        self.frames = 0
+
+        if self.format == 'wav':
+            self._file = wave.open(path, 'wb')
+            self._file.setnchannels(channels)
+            self._file.setsampwidth(2)
+            self._file.setframerate(self.sample_rate)
+        elif self.format == 'flac':
+            if sf is None:
+                raise ImportError("FLAC output requires soundfile (pip install soundfile)")
+            self._file = sf.SoundFile(path, 'w', samplerate=self.sample_rate,
+                                      channels=channels, format='FLAC', subtype='PCM_16')
+        else:
+            raise ValueError(f"Unsupported output format: {self.format}")
+
+    def write(self, block: np.ndarray):
+        """
+        Append a block
+
+        Args:
+            block: Integer (chip output) or float ([-1.0, 1.0]) array of
+                shape (n, channels)
+        """
+        pcm = to_pcm16(block)
+        if self.format == 'wav':
+            self._file.writeframes(pcm.tobytes())
+        else:
+            self._file.write(pcm)
+        self.frames += len(pcm)
+
+    def close(self):
+        """Finish the file (updates the WAV header)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def render_to_file(render_block: Callable[[int], np.ndarray], path: str, sample_rate: float,
+                   block_size: int = 8192, format: Optional[str] = None) -> int:
+    """
+    Render a block source to a file until it ends
+
+    Args:
+        render_block: Function returning up to n stereo frames (int32 chip
+            output or float32 playback frames); fewer (or none) at the end
+            of the stream
+        path: Output path
+        sample_rate: Sample rate of the source in Hz
+        block_size: Frames requested per block
+        format: 'wav' or 'flac' (default: from the file extension)
+
+    Returns:
+        Number of frames written
+    """
+    with AudioFileWriter(path, sample_rate, format=format) as writer:
+        while True:
+            block = render_block(block_size)
+            if len(block):
+                writer.write(block)
+            if len(block) < block_size:
+                break
+    return writer.frames
+
+
+def stem_paths(path: str, count: int) -> List[str]:
+    """
+    Output paths for per-channel stems
+
+    'song.wav' becomes 'song_ch1.wav' ... 'song_ch<count>.wav'.
+    """
+    base, ext = os.path.splitext(path)
+    return [f"{base}_ch{i + 1}{ext}" for i in range(count)]
+
+
+def render_stems_to_files(render_block: Callable[[int], Tuple[np.ndarray, np.ndarray]],
+                          path: str, sample_rate: float, block_size: int = 8192,
+                          format: Optional[str] = None) -> List[str]:
+    """
+    Render per-channel stems to one file per channel until the source ends
+
+    Args:
+        render_block: Function returning (mix, stems) for up to n frames,
+            stems of shape (frames, channels, 2); fewer (or none) at the
+            end of the stream
+        path: Output path, expanded with stem_paths()
+        sample_rate: Sample rate of the source in Hz
+        block_size: Frames requested per block
+        format: 'wav' or 'flac' (default: from the file extension)
+
+    Returns:
+        Paths of the written files
+    """
+    with ExitStack() as files:
+        writers = None
+        while True:
+            _, stems = render_block(block_size)
+            if writers is None:
+                paths = stem_paths(path, stems.shape[1])
+                writers = [files.enter_context(AudioFileWriter(p, sample_rate, format=format))
+                           for p in paths]
+            if len(stems):
+                for channel, writer in enumerate(writers):
+                    writer.write(stems[:, channel])
+            if len(stems) < block_size:
+                break
+    return paths
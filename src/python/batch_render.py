@@ -0,0 +1,153 @@
+"""
+Parallel batch rendering of independent YM2151 jobs.
+
+Each job (initial registers + timed register writes + length) is rendered
+by a worker process that owns one NukedOPM instance. Workers write their
+output straight into one shared memory block, so results are never
+pickled back to the parent.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nuked_opm import NukedOPM
+
+# Bytes per rendered stereo int32 sample
+FRAME_BYTES = 2 * np.dtype(np.int32).itemsize
+
+
+class RenderJob(NamedTuple):
+    """One independent render"""
+    num_samples: int
+    # (address, data) pairs written before rendering starts
+    registers: Sequence[Tuple[int, int]] = ()
+    # (cycle offset, address, data) writes during the render
+    events: Sequence[Tuple[int, int, int]] = ()
+
+
+class BatchResult:
+    """Rendered outputs backed by a shared memory block"""
+
+    def __init__(self, shm: Optional[shared_memory.SharedMemory], outputs: List[np.ndarray]):
+        self._shm = shm
+        self.outputs = outputs
+
+    def __len__(self) -> int:
+        return len(self.outputs)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.outputs[index]
+
+    def close(self):
+        """
+        Release the shared memory
+
+        Copy any output that must outlive the result first; views still
+        held elsewhere keep the mapping alive until they are dropped.
+        """
+        self.outputs = []
+        if self._shm is not None:
+            self._shm.unlink()
+            try:
+                self._shm.close()
+            except BufferError:
+                pass
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def render_job(chip: NukedOPM, job: RenderJob, out: np.ndarray):
+    """
+    Render one job into out
+
+    Args:
+        chip: Chip to use; it is reset first
+        job: Job description
+        out: int32 array of shape (job.num_samples, 2)
+    """
+    chip.reset()
+    render_job_from(chip, job, out)
+
+
+def render_job_from(chip: NukedOPM, job: RenderJob, out: np.ndarray):
+    """
+    Render one job into out, starting from the chip's current state
+
+    Args:
+        chip: Chip to use, e.g. restored from a snapshot
+        job: Job description
+        out: int32 array of shape (job.num_samples, 2)
+    """
+    chip.schedule([(0, address, data) for address, data in job.registers])
+    if len(job.events):
+        chip.schedule(job.events)
+    chip.render(job.num_samples, out=out)
+
+
+# Per-process worker state (set by _init_worker)
+_worker_shm = None
+_worker_chip = None
+
+
+def _init_worker(shm_name: str):
+    """Attach to the output block and create this worker's chip"""
+    global _worker_shm, _worker_chip
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_chip = NukedOPM()
+
+
+def _run_job(task: Tuple[int, RenderJob]) -> int:
+    """Render one job into its slice of the shared output block"""
+    offset, job = task
+    out = np.ndarray((job.num_samples, 2), dtype=np.int32, buffer=_worker_shm.buf, offset=offset)
+    render_job(_worker_chip, job, out)
+    return job.num_samples
+
+
+def render_batch(jobs: Sequence[RenderJob], workers: Optional[int] = None) -> BatchResult:
+    """
+    Render many jobs in parallel
+
+    Args:
+        jobs: Jobs to render
+        workers: Number of worker processes (default: CPU count)
+
+    Returns:
+        BatchResult whose outputs[i] is the int32 (n, 2) render of jobs[i];
+        close it (or use it as a context manager) to free the memory
+    """
+    offsets = []
+    total = 0
+    for job in jobs:
+        offsets.append(total)
+        total += job.num_samples * FRAME_BYTES
+
+    if total == 0:
+        return BatchResult(None, [np.empty((0, 2), dtype=np.int32) for _ in jobs])
+
+    shm = shared_memory.SharedMemory(create=True, size=total)
+    try:
+        # Longest jobs first so the pool finishes evenly
+        order = sorted(range(len(jobs)), key=lambda i: jobs[i].num_samples, reverse=True)
+        tasks = [(offsets[i], jobs[i]) for i in order]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name,)) as pool:
+            for _ in pool.map(_run_job, tasks):
+                pass
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+    outputs = [
+        np.ndarray((job.num_samples, 2), dtype=np.int32, buffer=shm.buf, offset=offset)
+        for job, offset in zip(jobs, offsets)
+    ]
+    return BatchResult(shm, outputs)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Nuked-OPM Python wrapper.
+
+Each benchmark runs a fixed workload several times and reports the best
+time, so results are comparable across commits on the same machine:
+
+- clock: per-cycle NukedOPM.clock() calls from Python
+- generate_samples: NukedOPM.generate_samples() (one sample per clock)
+- render: NukedOPM.render() at the native rate (32 clocks per sample)
+- generate_audio: main.generate_audio() at 48 kHz, including resampling
+- register_write: NukedOPM.write_register() calls (one ctypes call each)
+- bulk_write: the same writes in one NukedOPM.write_registers() call
+- scheduled_write: timestamped writes applied inside the native render
+- reset: NukedOPM.reset() (a copy of the post-reset image) and, for
+  comparison, the OPM_Reset call it replaces
+- threads: render throughput with one chip per thread; render() releases
+  the GIL inside the native loop, so the aggregate throughput should grow
+  with the number of threads up to the number of CPU cores
+
+Peak memory is measured with tracemalloc (Python and numpy allocations)
+in a separate, untimed run. Use --json to save the results.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from main import SAMPLE_RATE, generate_audio, setup_ym2151_basic_sound
+from nuked_opm import CLOCKS_PER_SAMPLE, HAS_NATIVE_EVENTS, HAS_NATIVE_RENDER, NukedOPM, _lib
+
+# Native sample rate used to express results in seconds of audio (4 MHz / 64)
+CHIP_SAMPLE_RATE = 62500
+
+# Chip clock cycles per second of audio
+CHIP_CYCLE_RATE = CHIP_SAMPLE_RATE * CLOCKS_PER_SAMPLE
+
+# Default workload sizes
+DEFAULT_CLOCK_CYCLES = 200_000
+DEFAULT_REGISTER_WRITES = 20_000
+DEFAULT_RESETS = 2_000
+DEFAULT_SECONDS = 1.0
+DEFAULT_REPEAT = 3
+
+
+def _new_chip() -> NukedOPM:
+    """Create a chip with a tone keyed on channel 0"""
+    chip = NukedOPM()
+    chip.write_register(0x20, 0xC7)
+    chip.write_register(0x28, 0x4A)
+    chip.write_register(0x08, 0x78)
+    return chip
+
+
+def _measure(setup: Callable[[], object], run: Callable[[object], None], repeat: int,
+             memory: bool = True) -> Dict[str, float]:
+    """
+    Time run(setup()) and measure its peak memory
+
+    Setup is excluded from both measurements.
+
+    Returns:
+        Dict with the best elapsed time and the peak traced bytes
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - start)
+
+    result = {"elapsed": best}
+    if memory:
+        arg = setup()
+        tracemalloc.start()
+        try:
+            run(arg)
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def bench_clock(cycles: int = DEFAULT_CLOCK_CYCLES, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of per-cycle clock() calls"""
+    def run(chip):
+        clock = chip.clock
+        for _ in range(cycles):
+            clock()
+
+    result = _measure(_new_chip, run, repeat)
+    result["cycles"] = cycles
+    result["cycles_per_sec"] = cycles / result["elapsed"]
+    result["realtime_factor"] = result["cycles_per_sec"] / CHIP_CYCLE_RATE
+    return result
+
+
+def bench_generate_samples(seconds: float = DEFAULT_SECONDS, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of generate_samples(), which returns one sample per clock"""
+    cycles = int(seconds * CHIP_CYCLE_RATE)
+    result = _measure(_new_chip, lambda chip: chip.generate_samples(cycles), repeat)
+    result["samples"] = cycles
+    result["samples_per_sec"] = cycles / result["elapsed"]
+    result["cycles_per_sec"] = result["samples_per_sec"]
+    result["realtime_factor"] = result["cycles_per_sec"] / CHIP_CYCLE_RATE
+    return result
+
+
+def bench_render(seconds: float = DEFAULT_SECONDS, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of render() at the native sample rate"""
+    num_samples = int(seconds * CHIP_SAMPLE_RATE)
+    result = _measure(_new_chip, lambda chip: chip.render(num_samples), repeat)
+    result["samples"] = num_samples
+    result["samples_per_sec"] = num_samples / result["elapsed"]
+    result["cycles_per_sec"] = result["samples_per_sec"] * CLOCKS_PER_SAMPLE
+    result["realtime_factor"] = result["samples_per_sec"] / CHIP_SAMPLE_RATE
+    return result
+
+
+def bench_generate_audio(seconds: float = DEFAULT_SECONDS, repeat: int = DEFAULT_REPEAT,
+                         sample_rate: int = SAMPLE_RATE) -> dict:
+    """Real-time factor of main.generate_audio() (render + resample)"""
+    def setup():
+        chip = NukedOPM()
+        setup_ym2151_basic_sound(chip)
+        return chip
+
+    def run(chip):
+        # generate_audio reports its progress on stdout
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                generate_audio(chip, seconds, sample_rate)
+            finally:
+                sys.stdout = stdout
+
+    result = _measure(setup, run, repeat)
+    result["sample_rate"] = sample_rate
+    result["samples"] = int(seconds * sample_rate)
+    result["samples_per_sec"] = result["samples"] / result["elapsed"]
+    result["realtime_factor"] = seconds / result["elapsed"]
+    return result
+
+
+def bench_register_write(writes: int = DEFAULT_REGISTER_WRITES,
+                         repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of write_register() calls"""
+    def run(chip):
+        write_register = chip.write_register
+        for i in range(writes):
+            write_register(0x28, i & 0x7F)
+
+    result = _measure(_new_chip, run, repeat)
+    result["writes"] = writes
+    result["writes_per_sec"] = writes / result["elapsed"]
+    return result
+
+
+def bench_bulk_write(writes: int = DEFAULT_REGISTER_WRITES,
+                     repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of write_registers() with all writes in one call"""
+    pairs = np.empty((writes, 2), dtype=np.uint8)
+    pairs[:, 0] = 0x28
+    pairs[:, 1] = np.arange(writes) & 0x7F
+
+    def run(chip):
+        chip.write_registers(pairs)
+
+    result = _measure(_new_chip, run, repeat)
+    result["writes"] = writes
+    result["writes_per_sec"] = writes / result["elapsed"]
+    return result
+
+
+def bench_scheduled_write(writes: int = DEFAULT_REGISTER_WRITES,
+                          repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of timestamped writes applied by the render loop"""
+    # One write per native sample, the densest useful rate
+    events = np.empty((writes, 3), dtype=np.int64)
+    events[:, 0] = np.arange(writes) * CLOCKS_PER_SAMPLE
+    events[:, 1] = 0x28
+    events[:, 2] = np.arange(writes) & 0x7F
+
+    def run(chip):
+        chip.schedule(events)
+        chip.render(writes)
+
+    result = _measure(_new_chip, run, repeat)
+    result["writes"] = writes
+    result["writes_per_sec"] = writes / result["elapsed"]
+    return result
+
+
+def bench_reset(resets: int = DEFAULT_RESETS, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Throughput of reset() compared with calling OPM_Reset directly"""
+    def run(chip):
+        reset = chip.reset
+        for _ in range(resets):
+            reset()
+
+    def run_native(chip):
+        # OPM_Reset is far slower; a tenth of the calls is enough to time it
+        for _ in range(max(resets // 10, 1)):
+            _lib.OPM_Reset(chip._chip_ref)
+
+    result = _measure(_new_chip, run, repeat)
+    native = _measure(_new_chip, run_native, repeat, memory=False)
+    result["resets"] = resets
+    result["resets_per_sec"] = resets / result["elapsed"]
+    result["native_resets_per_sec"] = max(resets // 10, 1) / native["elapsed"]
+    return result
+
+
+def _render_chip(num_samples: int) -> int:
+    """Render num_samples on a fresh chip in the calling thread"""
+    chip = _new_chip()
+    chip.render(num_samples)
+    return num_samples
+
+
+def bench_thread_scaling(thread_counts: List[int], seconds: float) -> List[dict]:
+    """
+    Measure render throughput with several chips on separate threads
+
+    Args:
+        thread_counts: Numbers of threads to test
+        seconds: Seconds of audio rendered per thread
+
+    Returns:
+        One result dict per thread count
+    """
+    num_samples = int(seconds * CHIP_SAMPLE_RATE)
+    results = []
+    baseline = None
+    for threads in thread_counts:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            start = time.perf_counter()
+            total = sum(pool.map(_render_chip, [num_samples] * threads))
+            elapsed = time.perf_counter() - start
+        samples_per_sec = total / elapsed
+        if baseline is None:
+            baseline = samples_per_sec
+        results.append({
+            "threads": threads,
+            "elapsed": elapsed,
+            "samples_per_sec": samples_per_sec,
+            "cycles_per_sec": samples_per_sec * CLOCKS_PER_SAMPLE,
+            "realtime_factor": samples_per_sec / CHIP_SAMPLE_RATE,
+            "scaling": samples_per_sec / baseline,
+        })
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    """Current commit hash, if run from a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """Machine and build information stored with the results"""
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "native_render": HAS_NATIVE_RENDER,
+        "native_events": HAS_NATIVE_EVENTS,
+    }
+
+
+# Benchmarks run by default, in order
+BENCHMARKS = ["clock", "generate_samples", "render", "generate_audio",
+              "register_write", "bulk_write", "scheduled_write", "reset", "threads"]
+
+
+def run_benchmarks(names: List[str], seconds: float = DEFAULT_SECONDS,
+                   repeat: int = DEFAULT_REPEAT, thread_counts: Optional[List[int]] = None,
+                   clock_cycles: int = DEFAULT_CLOCK_CYCLES,
+                   register_writes: int = DEFAULT_REGISTER_WRITES,
+                   resets: int = DEFAULT_RESETS) -> dict:
+    """
+    Run the selected benchmarks
+
+    Args:
+        names: Benchmark names from BENCHMARKS
+        seconds: Seconds of audio for the render benchmarks
+        repeat: Timed runs per benchmark (the best is reported)
+        thread_counts: Thread counts for the thread scaling benchmark
+        clock_cycles: Cycles for the clock() benchmark
+        register_writes: Writes for the register write benchmarks
+        resets: Resets for the reset benchmark
+
+    Returns:
+        Dict with "environment" and one "results" entry per benchmark
+    """
+    runners = {
+        "clock": lambda: bench_clock(clock_cycles, repeat),
+        "generate_samples": lambda: bench_generate_samples(seconds, repeat),
+        "render": lambda: bench_render(seconds, repeat),
+        "generate_audio": lambda: bench_generate_audio(seconds, repeat),
+        "register_write": lambda: bench_register_write(register_writes, repeat),
+        "bulk_write": lambda: bench_bulk_write(register_writes, repeat),
+        "scheduled_write": lambda: bench_scheduled_write(register_writes, repeat),
+        "reset": lambda: bench_reset(resets, repeat),
+        "threads": lambda: bench_thread_scaling(thread_counts or [1, 2, 4], seconds),
+    }
+    unknown = [name for name in names if name not in runners]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+    return {
+        "environment": environment(),
+        "results": {name: runners[name]() for name in names},
+    }
+
+
+def print_results(report: dict):
+    """Print a human readable summary"""
+    env = report["environment"]
+    print("=" * 60)
+    print("Nuked-OPM Python wrapper benchmarks")
+    print(f"Python {env['python']}, numpy {env['numpy']}, CPU cores: {env['cpu_count']}, "
+          f"native render: {env['native_render']}")
+    print("=" * 60)
+    for name, result in report["results"].items():
+        if name == "threads":
+            print(f"{'threads':>8} {'elapsed[s]':>11} {'samples/s':>12} {'x realtime':>11} {'scaling':>8}")
+            for row in result:
+                print(f"{row['threads']:>8} {row['elapsed']:>11.3f} "
+                      f"{row['samples_per_sec']:>12.0f} {row['realtime_factor']:>11.2f} "
+                      f"{row['scaling']:>8.2f}")
+            continue
+        if "resets_per_sec" in result:
+            rate = f"{result['resets_per_sec']:>14.0f} resets/s"
+            realtime = f"OPM_Reset {result['native_resets_per_sec']:.0f}/s"
+            memory = result["peak_memory_bytes"] / 1024
+            print(f"{name:<17} {rate} {realtime:>17}  peak {memory:10.1f} KiB")
+            continue
+        if "writes_per_sec" in result:
+            rate = f"{result['writes_per_sec']:>14.0f} writes/s"
+        elif "cycles_per_sec" in result:
+            rate = f"{result['cycles_per_sec']:>14.0f} cycles/s"
+        else:
+            rate = f"{result['samples_per_sec']:>14.0f} samples/s"
+        realtime = result.get("realtime_factor")
+        realtime = f"{realtime:8.2f}x realtime" if realtime is not None else ""
+        memory = result["peak_memory_bytes"] / 1024
+        print(f"{name:<17} {rate} {realtime:>17}  peak {memory:10.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nuked-OPM wrapper benchmarks")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"Comma separated benchmarks (default: {','.join(BENCHMARKS)})")
+    parser.add_argument("--threads", default="1,2,4",
+                        help="Comma separated thread counts (default: 1,2,4)")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                        help=f"Seconds of audio per render benchmark (default: {DEFAULT_SECONDS})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Timed runs per benchmark, best is kept (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write the results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    names = [name for name in args.only.split(",") if name]
+    thread_counts = [int(n) for n in args.threads.split(",")]
+    try:
+        report = run_benchmarks(names, args.seconds, args.repeat, thread_counts)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_results(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Wrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+"""
+pytest fixtures for the YM2151 wrapper tests.
+"""
+import pytest
+
+from nuked_opm import NukedOPM
+
+
+@pytest.fixture
+def chip():
+    """Freshly reset NukedOPM instance"""
+    return NukedOPM()
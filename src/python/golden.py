@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Golden-output regression corpus.
+
+golden/ holds register scripts (the script_render.py format) covering
+every algorithm, the LFO waveforms, noise, CSM and the timers, and
+golden/golden.json their expected output: a SHA-256 of the whole int32
+PCM, a CRC-32 per block of BLOCK_SIZE samples, and a SHA-256 of the final
+chip state (which catches changes that are not audible, such as timer
+status). A mismatch is reported as the first divergent block.
+
+    python golden.py            # check the corpus
+    python golden.py --update   # re-record after an intended change
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from nuked_opm import NukedOPM
+from script_render import load_script
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+GOLDEN_FILE = os.path.join(GOLDEN_DIR, "golden.json")
+
+# Samples per checksummed block
+BLOCK_SIZE = 1024
+
+# Native samples rendered per script when recording
+DEFAULT_SAMPLES = 8192
+
+
+def case_names() -> List[str]:
+    """Names of the scripts in the corpus, sorted"""
+    return sorted(name[:-4] for name in os.listdir(GOLDEN_DIR) if name.endswith(".txt"))
+
+
+def render_case(name: str, num_samples: int) -> Tuple[np.ndarray, bytes]:
+    """
+    Render one script on a fresh chip
+
+    Returns:
+        (int32 PCM of shape (num_samples, 2), final chip state)
+    """
+    chip = NukedOPM()
+    chip.schedule(load_script(os.path.join(GOLDEN_DIR, name + ".txt")))
+    pcm = chip.render(num_samples)
+    return pcm, chip.snapshot()
+
+
+def fingerprint(pcm: np.ndarray, state: bytes) -> dict:
+    """
+    Hashes of a render
+
+    Args:
+        pcm: int32 array of shape (n, 2)
+        state: Final chip state from NukedOPM.snapshot()
+    """
+    data = np.ascontiguousarray(pcm, dtype='<i4').tobytes()
+    block_bytes = BLOCK_SIZE * 8
+    return {
+        "samples": len(pcm),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "blocks": [f"{zlib.crc32(data[i:i + block_bytes]):08x}"
+                   for i in range(0, len(data), block_bytes)],
+        "state_sha256": hashlib.sha256(state).hexdigest(),
+    }
+
+
+def compare(expected: dict, actual: dict) -> Optional[str]:
+    """
+    Describe the first difference between two fingerprints
+
+    Returns:
+        None if they match
+    """
+    if expected["samples"] != actual["samples"]:
+        return f"length {actual['samples']} != {expected['samples']}"
+    for index, (want, got) in enumerate(zip(expected["blocks"], actual["blocks"])):
+        if want != got:
+            start = index * BLOCK_SIZE
+            end = min(start + BLOCK_SIZE, expected["samples"]) - 1
+            return f"first divergent block {index} (samples {start}-{end})"
+    if expected["sha256"] != actual["sha256"]:
+        return "PCM hash differs"
+    if expected["state_sha256"] != actual["state_sha256"]:
+        return "final chip state differs"
+    return None
+
+
+def load_golden() -> Dict[str, dict]:
+    """Recorded fingerprints by case name"""
+    with open(GOLDEN_FILE) as f:
+        return json.load(f)["cases"]
+
+
+def check_corpus(names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Render the corpus and compare it with the recorded fingerprints
+
+    Args:
+        names: Cases to check (default: all recorded cases)
+
+    Returns:
+        Mismatch description (or None) per case
+    """
+    golden = load_golden()
+    results = {}
+    for name in names or sorted(golden):
+        expected = golden[name]
+        results[name] = compare(expected, fingerprint(*render_case(name, expected["samples"])))
+    return results
+
+
+def update_corpus(num_samples: int = DEFAULT_SAMPLES) -> Dict[str, dict]:
+    """Record fingerprints for every script in the corpus"""
+    cases = {}
+    for name in case_names():
+        cases[name] = fingerprint(*render_case(name, num_samples))
+    with open(GOLDEN_FILE, "w") as f:
+        json.dump({"block_size": BLOCK_SIZE, "cases": cases}, f, indent=1)
+        f.write("\n")
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the golden-output corpus")
+    parser.add_argument("--update", action="store_true",
+                        help="Re-record golden.json from the current build")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"Samples per script when recording (default: {DEFAULT_SAMPLES})")
+    args = parser.parse_args()
+
+    if args.update:
+        cases = update_corpus(args.samples)
+        print(f"Recorded {len(cases)} cases in {GOLDEN_FILE}")
+        return 0
+
+    failures = 0
+    for name, mismatch in check_corpus().items():
+        if mismatch:
+            failures += 1
+            print(f"✗ {name}: {mismatch}")
+        else:
+            print(f"✓ {name}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+MIDI front end: Standard MIDI File player and live MIDI input.
+
+MIDI channel messages drive up to 8 YM2151 voices through MidiDriver:
+notes are assigned to chip channels by VoiceAllocator (stealing the
+oldest note when all are busy), patches come from a .opm voice bank
+selected by program change, and pitches come from the chip's own
+KC/KF frequency table for its master clock (pitch.py). Every message turns
+into register writes scheduled at its exact native sample, so timing is
+sample accurate regardless of the render block size.
+
+    python midi.py song.mid                  # play a file
+    python midi.py song.mid -o song.wav      # render a file
+    python midi.py --live [PORT]             # play from a MIDI input (needs mido)
+"""
+import argparse
+import math
+import os
+import queue
+import struct
+import sys
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import mido
+except ImportError:
+    # Only live input needs mido; file playback works without it
+    mido = None
+
+from audio_file import render_to_file
+from nuked_opm import CLOCKS_PER_SAMPLE, NukedOPM
+from pitch import pitch_table
+from resampler import Resampler
+from stream_player import StreamingPlayer, native_source
+from voice_bank import OPERATOR_NAMES, OPERATOR_OFFSETS, VoiceBank
+
+# Master clock assumed when none is given
+DEFAULT_CLOCK = 4_000_000
+
+# Voice bank used when none is given
+DEFAULT_BANK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voices", "basic.opm")
+
+# Native samples rendered per block
+RENDER_BLOCK = 1024
+
+# Number of chip channels (voices)
+NUM_VOICES = 8
+
+# Pitch bend range in semitones (MIDI default)
+BEND_RANGE = 2.0
+
+# Carrier operators (file order indices: M1, C1, M2, C2) per algorithm;
+# their TL follows the note velocity
+CARRIERS = ((3,), (3,), (3,), (3,), (1, 3), (1, 2, 3), (1, 2, 3), (0, 1, 2, 3))
+
+# TL steps (0.75 dB each) added at velocity 0, scaled linearly to none at 127
+VELOCITY_TL_RANGE = 32
+
+# One channel message at an absolute time in seconds
+MIDI_EVENT_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('status', np.uint8),
+    ('data1', np.uint8),
+    ('data2', np.uint8),
+])
+
+
+def _read_varlen(data: bytes, pos: int) -> Tuple[int, int]:
+    """Read a variable-length quantity; returns (value, new position)"""
+    value = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated variable-length value")
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _parse_track(data: bytes) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (tick, status, data) for the channel and tempo events of a track"""
+    pos = 0
+    tick = 0
+    status = 0
+    while pos < len(data):
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        if data[pos] & 0x80:
+            status = data[pos]
+            pos += 1
+        elif not status:
+            raise ValueError("Running status without a previous status byte")
+        if status == 0xFF:
+            kind = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            if kind == 0x2F:
+                return
+            yield tick, status, bytes([kind]) + data[pos:pos + length]
+            pos += length
+            status = 0
+        elif status in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos)
+            pos += length
+            status = 0
+        else:
+            size = 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+            yield tick, status, data[pos:pos + size]
+            pos += size
+
+
+def parse_smf(data: bytes) -> np.ndarray:
+    """
+    Parse a Standard MIDI File (format 0 or 1)
+
+    Tempo changes from any track are applied to all of them.
+
+    Returns:
+        MIDI_EVENT_DTYPE array of channel messages sorted by time
+
+    Raises:
+        ValueError: If the data is not a supported MIDI file
+    """
+    if data[:4] != b'MThd' or len(data) < 14:
+        raise ValueError("Not a Standard MIDI File")
+    header_size, fmt, num_tracks, division = struct.unpack_from('>IHHH', data, 4)
+    if fmt not in (0, 1):
+        raise ValueError(f"Unsupported MIDI file format {fmt}")
+
+    events = []  # (tick, track, order, status, data)
+    pos = 8 + header_size
+    for track in range(num_tracks):
+        if data[pos:pos + 4] != b'MTrk':
+            raise ValueError(f"Missing track {track}")
+        length = struct.unpack_from('>I', data, pos + 4)[0]
+        track_data = data[pos + 8:pos + 8 + length]
+        try:
+            events += [(tick, track, order, status, body)
+                       for order, (tick, status, body) in enumerate(_parse_track(track_data))]
+        except IndexError:
+            raise ValueError(f"Truncated track {track}")
+        pos += 8 + length
+    events.sort(key=lambda event: event[:3])
+
+    if division & 0x8000:
+        # SMPTE: frames per second (negative int8) x ticks per frame
+        frames = 256 - (division >> 8)
+        seconds_per_tick = 1.0 / (frames * (division & 0xFF))
+        tempo_scale = None
+    else:
+        tempo_scale = 1e-6 / division
+        seconds_per_tick = 500_000 * tempo_scale  # 120 BPM until a tempo event
+
+    messages = np.empty(len(events), dtype=MIDI_EVENT_DTYPE)
+    count = 0
+    last_tick = 0
+    seconds = 0.0
+    for tick, _, _, status, body in events:
+        seconds += (tick - last_tick) * seconds_per_tick
+        last_tick = tick
+        if status == 0xFF:
+            if body[0] == 0x51 and len(body) == 4 and tempo_scale is not None:
+                seconds_per_tick = int.from_bytes(body[1:4], 'big') * tempo_scale
+            continue
+        messages[count] = (seconds, status, body[0], body[1] if len(body) > 1 else 0)
+        count += 1
+    return messages[:count]
+
+
+def read_smf(path: str) -> np.ndarray:
+    """Read a Standard MIDI File; see parse_smf()"""
+    with open(path, 'rb') as f:
+        return parse_smf(f.read())
+
+
+class VoiceAllocator:
+    """
+    Assigns notes to chip channels
+
+    A new note takes the voice that has been free the longest. When every
+    voice is playing, the oldest note is stolen. A note that is already
+    playing on the same MIDI channel is retriggered on its voice.
+    """
+
+    def __init__(self, voices: int = NUM_VOICES):
+        self.owners: List[Optional[Tuple[int, int]]] = [None] * voices  # (channel, note)
+        self._stamps = [0] * voices  # order of the last note on / off
+        self._clock = 0
+
+    def _stamp(self, voice: int):
+        self._clock += 1
+        self._stamps[voice] = self._clock
+
+    def note_on(self, channel: int, note: int) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """
+        Allocate a voice
+
+        Returns:
+            (voice, (channel, note) of a stolen or retriggered note, or None)
+        """
+        key = (channel, note)
+        if key in self.owners:
+            voice = self.owners.index(key)
+            previous = key
+        else:
+            free = [v for v, owner in enumerate(self.owners) if owner is None]
+            candidates = free or range(len(self.owners))
+            voice = min(candidates, key=self._stamps.__getitem__)
+            previous = self.owners[voice]
+        self.owners[voice] = key
+        self._stamp(voice)
+        return voice, previous
+
+    def note_off(self, channel: int, note: int) -> Optional[int]:
+        """Free the voice playing a note; returns it, or None if not playing"""
+        key = (channel, note)
+        if key not in self.owners:
+            return None
+        voice = self.owners.index(key)
+        self.owners[voice] = None
+        self._stamp(voice)
+        return voice
+
+    def voices(self, channel: int) -> List[Tuple[int, int]]:
+        """(voice, note) pairs playing on a MIDI channel"""
+        return [(voice, owner[1]) for voice, owner in enumerate(self.owners)
+                if owner is not None and owner[0] == channel]
+
+    def release_all(self, channel: Optional[int] = None) -> List[int]:
+        """Free every voice (of one MIDI channel, if given); returns them"""
+        released = [voice for voice, owner in enumerate(self.owners)
+                    if owner is not None and (channel is None or owner[0] == channel)]
+        for voice in released:
+            self.owners[voice] = None
+            self._stamp(voice)
+        return released
+
+
+class MidiDriver:
+    """
+    Turns MIDI channel messages into scheduled register writes
+
+    Writes are collected by handle() at sample offsets from the chip's
+    current cycle and handed to the chip by flush() in one schedule()
+    call. MIDI channel 10 is not treated specially.
+    """
+
+    def __init__(self, chip: NukedOPM, bank: VoiceBank, clock: float = DEFAULT_CLOCK,
+                 voices: int = NUM_VOICES):
+        """
+        Args:
+            chip: Chip to drive
+            bank: Voice bank; program N selects patch N (or the first patch
+                if the bank has no patch N)
+            clock: Chip master clock in Hz (for the pitch table)
+            voices: Number of chip channels to use (1-8)
+        """
+        self.chip = chip
+        self.bank = bank
+        self.pitch = pitch_table(clock)
+        self.allocator = VoiceAllocator(voices)
+        self.programs = [0] * 16
+        self.bends = [0.0] * 16  # semitones
+        self._loaded: List[Optional[int]] = [None] * voices  # patch per voice
+        self._writes: List[Tuple[int, int, int]] = []
+        self.notes_on = 0
+        self.notes_stolen = 0
+
+    def _patch_number(self, channel: int) -> int:
+        program = self.programs[channel]
+        return program if program in self.bank.patches else next(iter(self.bank.patches))
+
+    def _pitch(self, cycle: int, voice: int, channel: int, note: int):
+        kc, kf = self.pitch.from_note(note + self.bends[channel])
+        self._writes += [(cycle, 0x28 + voice, int(kc)), (cycle, 0x30 + voice, int(kf))]
+
+    def note_on(self, offset: int, channel: int, note: int, velocity: int):
+        """Start a note at a sample offset"""
+        cycle = offset * CLOCKS_PER_SAMPLE
+        voice, previous = self.allocator.note_on(channel, note)
+        if previous is not None:
+            if previous != (channel, note):
+                self.notes_stolen += 1
+            self._writes.append((cycle, 0x08, voice))
+        number = self._patch_number(channel)
+        patch = self.bank[number]
+        if self._loaded[voice] != number:
+            self._writes += [(cycle, address, data)
+                             for address, data in self.bank.registers(number, voice).tolist()]
+            self._loaded[voice] = number
+        self._pitch(cycle, voice, channel, note)
+        attenuation = (127 - velocity) * VELOCITY_TL_RANGE // 127
+        for index in CARRIERS[patch.con]:
+            tl = min(patch.operators[index].tl + attenuation, 127)
+            slot = voice + OPERATOR_OFFSETS[OPERATOR_NAMES[index]]
+            self._writes.append((cycle, 0x60 + slot, tl))
+        self._writes.append((cycle, 0x08, patch.key_on(voice)))
+        self.notes_on += 1
+
+    def note_off(self, offset: int, channel: int, note: int):
+        """Release a note at a sample offset"""
+        voice = self.allocator.note_off(channel, note)
+        if voice is not None:
+            self._writes.append((offset * CLOCKS_PER_SAMPLE, 0x08, voice))
+
+    def all_notes_off(self, offset: int, channel: Optional[int] = None):
+        """Release every note (of one MIDI channel, if given)"""
+        for voice in self.allocator.release_all(channel):
+            self._writes.append((offset * CLOCKS_PER_SAMPLE, 0x08, voice))
+
+    def handle(self, offset: int, status: int, data1: int = 0, data2: int = 0):
+        """
+        Apply one channel message
+
+        Args:
+            offset: Native samples from the chip's current position
+            status: Status byte (0x80-0xEF); other messages are ignored
+            data1, data2: Data bytes
+        """
+        kind, channel = status & 0xF0, status & 0x0F
+        if kind == 0x90 and data2:
+            self.note_on(offset, channel, data1, data2)
+        elif kind in (0x80, 0x90):
+            self.note_off(offset, channel, data1)
+        elif kind == 0xC0:
+            self.programs[channel] = data1
+        elif kind == 0xE0:
+            self.bends[channel] = ((data2 << 7 | data1) - 8192) / 8192 * BEND_RANGE
+            for voice, note in self.allocator.voices(channel):
+                self._pitch(offset * CLOCKS_PER_SAMPLE, voice, channel, note)
+        elif kind == 0xB0 and data1 in (120, 123):
+            # All sound off / all notes off
+            self.all_notes_off(offset, channel)
+
+    def flush(self):
+        """Schedule the writes collected since the last flush"""
+        if self._writes:
+            self.chip.schedule(self._writes)
+            self._writes = []
+
+
+class SmfPlayer:
+    """Renders a MIDI file in native-rate blocks"""
+
+    def __init__(self, events: np.ndarray, bank: VoiceBank, chip: Optional[NukedOPM] = None,
+                 clock: float = DEFAULT_CLOCK, tail: float = 1.0):
+        """
+        Args:
+            events: Messages from read_smf() / parse_smf()
+            bank: Voice bank
+            chip: Chip to render with (default: a new NukedOPM)
+            clock: Chip master clock in Hz
+            tail: Seconds rendered after the last message (release tails)
+        """
+        self.chip = chip if chip is not None else NukedOPM()
+        self.driver = MidiDriver(self.chip, bank, clock)
+        self.sample_rate = clock / 64
+        self._samples = np.rint(events['time'] * self.sample_rate).astype(np.int64)
+        self._events = events
+        self._next = 0
+        self.position = 0
+        last = int(self._samples[-1]) if len(events) else 0
+        self.total_samples = last + int(tail * self.sample_rate)
+
+    def render(self, num_samples: int) -> np.ndarray:
+        """
+        Render the next block at the native rate
+
+        Returns:
+            int32 array of shape (n, 2), shorter (possibly empty) at the end
+        """
+        num_samples = max(min(num_samples, self.total_samples - self.position), 0)
+        end = self.position + num_samples
+        stop = int(np.searchsorted(self._samples, end, side='left'))
+        for index in range(self._next, stop):
+            event = self._events[index]
+            self.driver.handle(int(self._samples[index]) - self.position,
+                               int(event['status']), int(event['data1']), int(event['data2']))
+        self._next = stop
+        self.driver.flush()
+        self.position = end
+        return self.chip.render(num_samples)
+
+
+class VirtualPort:
+    """
+    In-process stand-in for a MIDI input port
+
+    Has the polling interface of a mido input port (iter_pending()) and
+    records when each message was sent, so tests and demos can drive
+    LiveInput without MIDI hardware.
+    """
+
+    def __init__(self):
+        self._queue: 'queue.Queue[Tuple[float, bytes]]' = queue.Queue()
+
+    def send(self, message: Iterable[int]):
+        """Queue a message (status and data bytes)"""
+        self._queue.put((time.perf_counter(), bytes(message)))
+
+    def iter_pending(self) -> Iterator[Tuple[float, bytes]]:
+        """Yield (send time, message bytes) for every queued message"""
+        while True:
+            try:
+                yield self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class LiveInput:
+    """
+    Renders from a live MIDI input
+
+    Pending messages are polled at the start of every block and scheduled
+    at its first sample, so a message waits at most one block before it is
+    rendered. on_note is called with the native sample and arrival time of
+    every note on; main() passes them to StreamingPlayer.mark(), which
+    measures the latency when the player takes the note's block.
+    """
+
+    def __init__(self, port, bank: VoiceBank, chip: Optional[NukedOPM] = None,
+                 clock: float = DEFAULT_CLOCK):
+        """
+        Args:
+            port: VirtualPort, or a mido input port (arrival is then the
+                time the message was polled)
+            bank: Voice bank
+            chip: Chip to render with (default: a new NukedOPM)
+            clock: Chip master clock in Hz
+        """
+        self.port = port
+        self.chip = chip if chip is not None else NukedOPM()
+        self.driver = MidiDriver(self.chip, bank, clock)
+        self.sample_rate = clock / 64
+        self.position = 0  # native samples rendered
+        self.on_note: Optional[Callable[[int, float], None]] = None
+
+    def _pending(self) -> Iterator[Tuple[float, bytes]]:
+        if isinstance(self.port, VirtualPort):
+            yield from self.port.iter_pending()
+            return
+        for message in self.port.iter_pending():
+            yield time.perf_counter(), bytes(message.bytes())
+
+    def render(self, num_samples: int) -> np.ndarray:
+        """Render the next block with the messages received so far"""
+        arrivals = []
+        for arrival, message in self._pending():
+            if not message or not 0x80 <= message[0] < 0xF0:
+                continue
+            status, data = message[0], list(message[1:3]) + [0, 0]
+            self.driver.handle(0, status, data[0], data[1])
+            if status & 0xF0 == 0x90 and data[1]:
+                arrivals.append(arrival)
+        self.driver.flush()
+        if self.on_note is not None:
+            for arrival in arrivals:
+                self.on_note(self.position, arrival)
+        block = self.chip.render(num_samples)
+        self.position += len(block)
+        return block
+
+
+def live_frame(sample: int, resampler: Resampler) -> int:
+    """Output frame of a native sample after resampling"""
+    return math.ceil(sample * resampler.ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YM2151 MIDI player")
+    parser.add_argument("path", nargs="?", help="Standard MIDI File")
+    parser.add_argument("-o", "--output", help="Write a WAV or FLAC file instead of playing")
+    parser.add_argument("--bank", default=DEFAULT_BANK, help="Voice bank (.opm)")
+    parser.add_argument("--rate", type=int, default=48000,
+                        help="Playback sample rate (default: 48000)")
+    parser.add_argument("--live", nargs="?", const="", metavar="PORT",
+                        help="Play from a MIDI input port (default: the first one; needs mido)")
+    parser.add_argument("--block", type=int, default=256,
+                        help="Playback block size in frames for --live (default: 256)")
+    args = parser.parse_args()
+
+    if args.path is None and args.live is None:
+        parser.error("give a MIDI file or --live")
+    try:
+        bank = VoiceBank.load(args.bank)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.live is not None:
+        if mido is None:
+            print("Error: live input requires mido (pip install mido python-rtmidi)",
+                  file=sys.stderr)
+            return 1
+        with mido.open_input(args.live or None) as port:
+            live = LiveInput(port, bank)
+            resampler = Resampler(live.sample_rate, args.rate)
+            # Blocks are rendered in the audio callback, so a note is heard
+            # in the first block the device takes after it arrives
+            player = StreamingPlayer(native_source(live.render, resampler=resampler), args.rate,
+                                     block_size=args.block, buffer_blocks=0)
+            live.on_note = lambda sample, arrival: player.mark(
+                live_frame(sample, resampler), arrival)
+            print(f"Listening on {port.name} (Ctrl+C to stop)")
+            try:
+                with player:
+                    player.wait()
+            except KeyboardInterrupt:
+                pass
+        latency = player.event_latency
+        print(f"Note-on latency: mean {latency.mean * 1000:.2f} ms, "
+              f"max {latency.max * 1000:.2f} ms (until the device took the note's block)")
+        return 0
+
+    try:
+        events = read_smf(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    player = SmfPlayer(events, bank)
+    print(f"{len(events)} MIDI events, {player.total_samples / player.sample_rate:.1f} s")
+    if args.output:
+        render_to_file(player.render, args.output, player.sample_rate)
+        print(f"Wrote {args.output}")
+    else:
+        resampler = Resampler(player.sample_rate, args.rate)
+        source = native_source(lambda n: player.render(max(n, RENDER_BLOCK)), resampler=resampler)
+        try:
+            with StreamingPlayer(source, args.rate) as stream:
+                stream.wait()
+        except KeyboardInterrupt:
+            print("\nPlayback interrupted by user")
+    print(f"Notes: {player.driver.notes_on}, stolen: {player.driver.notes_stolen}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
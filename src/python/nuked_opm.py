@@ -2,37 +2,73 @@
 Python wrapper for Nuked-OPM YM2151 emulator using ctypes.
 """
 import ctypes
+import hashlib
 import os
-from typing import Tuple
+import sys
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+import numpy as np
+
+from opm_struct import (EVENT_DTYPE, NUM_CHANNELS, OPM_DTYPE, OPM_Channels, OPM_Stream, OPM_t,
+                        state_view)
 
 # Get the directory of this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Load the Nuked-OPM shared library
-# Windows専用：ym2151.dllを使用
-_lib_name = 'ym2151.dll'
-_lib_path = os.path.join(SCRIPT_DIR, _lib_name)
-_lib = None
-
-if os.path.exists(_lib_path):
-    try:
-        _lib = ctypes.CDLL(_lib_path)
-    except OSError as e:
-        raise OSError(f"Failed to load {_lib_name}: {e}")
-else:
+# Environment variable that overrides the shared library path
+LIB_PATH_ENV = 'YM2151_LIB'
+
+
+def _library_candidates(platform: str = sys.platform) -> List[str]:
+    """Return the shared library file names to try for a platform"""
+    if platform.startswith('win'):
+        return ['ym2151.dll']
+    if platform == 'darwin':
+        return ['libym2151.dylib', 'libym2151.so']
+    return ['libym2151.so']
+
+
+def _find_library() -> str:
+    """Locate the Nuked-OPM shared library"""
+    override = os.environ.get(LIB_PATH_ENV)
+    if override:
+        if not os.path.exists(override):
+            raise FileNotFoundError(
+                f"Nuked-OPM library not found: {override} (from {LIB_PATH_ENV})"
+            )
+        return override
+
+    candidates = _library_candidates()
+    for name in candidates:
+        path = os.path.join(SCRIPT_DIR, name)
+        if os.path.exists(path):
+            return path
+
+    if sys.platform.startswith('win'):
+        hint = (
+            "Please run: python scripts\\download_libs.py\n"
+            "Or download ym2151.dll from: https://github.com/cat2151/ym2151-emu-win-bin\n"
+            "Or build it from source: python scripts\\build_python_lib.py"
+        )
+    else:
+        hint = "Please run: python scripts/build_python_lib.py"
     raise FileNotFoundError(
-        f"Nuked-OPM library not found: {_lib_path}\n"
-        f"Please run: python scripts\\download_libs.py\n"
-        f"Or download ym2151.dll from: https://github.com/cat2151/ym2151-emu-win-bin"
+        f"Nuked-OPM library not found: {os.path.join(SCRIPT_DIR, candidates[0])}\n"
+        f"{hint}\n"
+        f"Or set {LIB_PATH_ENV} to the library path"
     )
 
 
-# Define the opm_t structure (simplified, we'll treat it as opaque)
-class OPM_t(ctypes.Structure):
-    """OPM chip state structure (opaque)"""
-    # We don't need to define all fields since we'll treat it as opaque
-    # The structure is large and complex, so we allocate enough space
-    _fields_ = [("_data", ctypes.c_byte * 4096)]
+# Load the Nuked-OPM shared library
+_lib_path = _find_library()
+_lib_name = os.path.basename(_lib_path)
+try:
+    _lib = ctypes.CDLL(_lib_path)
+except OSError as e:
+    raise OSError(f"Failed to load {_lib_name}: {e}")
 
 
 # Define function signatures
@@ -51,18 +87,343 @@ _lib.OPM_Clock.argtypes = [
 ]
 _lib.OPM_Clock.restype = None
 
+_lib.OPM_Read.argtypes = [ctypes.POINTER(OPM_t), ctypes.c_uint32]
+_lib.OPM_Read.restype = ctypes.c_uint8
+
+_lib.OPM_ReadIRQ.argtypes = [ctypes.POINTER(OPM_t)]
+_lib.OPM_ReadIRQ.restype = ctypes.c_uint8
+
+# Verify the ctypes mirror of opm_t against the library when it can tell us
+# the real size (opm_render.c builds only).
+if hasattr(_lib, 'OPM_StateSize'):
+    _lib.OPM_StateSize.argtypes = []
+    _lib.OPM_StateSize.restype = ctypes.c_uint32
+    if _lib.OPM_StateSize() != ctypes.sizeof(OPM_t):
+        raise ImportError(
+            f"opm_t size mismatch: {_lib_name} has {_lib.OPM_StateSize()} bytes, "
+            f"OPM_t has {ctypes.sizeof(OPM_t)} bytes (is opm_struct.py in sync with opm.h?)"
+        )
+
+# Batch render helper from opm_render.c. Libraries built without it (such as
+# the prebuilt ym2151.dll) fall back to a Python loop over OPM_Clock.
+HAS_NATIVE_RENDER = hasattr(_lib, 'OPM_RenderSamples')
+if HAS_NATIVE_RENDER:
+    _lib.OPM_RenderSamples.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_uint32,
+        ctypes.c_uint32
+    ]
+    _lib.OPM_RenderSamples.restype = None
+
+HAS_NATIVE_EVENTS = hasattr(_lib, 'OPM_RenderEvents')
+if HAS_NATIVE_EVENTS:
+    _lib.OPM_RenderEvents.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(OPM_Stream),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_uint32,
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.c_uint32
+    ]
+    _lib.OPM_RenderEvents.restype = ctypes.c_uint32
+
+HAS_NATIVE_WRITES = hasattr(_lib, 'OPM_WriteRegisters')
+if HAS_NATIVE_WRITES:
+    _lib.OPM_WriteRegisters.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(OPM_Stream),
+        ctypes.c_void_p,
+        ctypes.c_uint32
+    ]
+    _lib.OPM_WriteRegisters.restype = ctypes.c_uint32
+
+HAS_SILENCE_SKIP = hasattr(_lib, 'OPM_RenderEventsSkipSilence')
+if HAS_SILENCE_SKIP:
+    _lib.OPM_IsSilent.argtypes = [ctypes.POINTER(OPM_t), ctypes.POINTER(OPM_Stream)]
+    _lib.OPM_IsSilent.restype = ctypes.c_uint32
+    _lib.OPM_RenderEventsSkipSilence.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(OPM_Stream),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_uint32,
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_uint32)
+    ]
+    _lib.OPM_RenderEventsSkipSilence.restype = ctypes.c_uint32
+
+HAS_NATIVE_CHANNELS = hasattr(_lib, 'OPM_RenderEventsChannels')
+if HAS_NATIVE_CHANNELS:
+    _lib.OPM_RenderEventsChannels.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(OPM_Stream),
+        ctypes.POINTER(OPM_Channels),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_uint32,
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_uint32)
+    ]
+    _lib.OPM_RenderEventsChannels.restype = ctypes.c_uint32
+
+HAS_NATIVE_IRQ = hasattr(_lib, 'OPM_RenderUntilIRQ')
+if HAS_NATIVE_IRQ:
+    _lib.OPM_RenderUntilIRQ.argtypes = [
+        ctypes.POINTER(OPM_t),
+        ctypes.POINTER(OPM_Stream),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_uint32,
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_uint32),
+        ctypes.POINTER(ctypes.c_uint32)
+    ]
+    _lib.OPM_RenderUntilIRQ.restype = ctypes.c_uint32
+
+# Number of OPM_Clock calls per output sample. One OPM_Clock call processes
+# one of the 32 operator slots, so the chip produces one stereo sample every
+# 32 calls (= 64 master clocks, i.e. clock / 64 Hz).
+CLOCKS_PER_SAMPLE = 32
+
+# Clocks between two port writes (OPM_WRITE_DELAY in opm_render.c)
+WRITE_DELAY = 2
+
+# Size in bytes of a chip snapshot (chip state + write scheduler state)
+STATE_SIZE = ctypes.sizeof(OPM_t) + ctypes.sizeof(OPM_Stream)
+
+# Timer flags in the status register (read_status()) and in the flags
+# returned by render_until_irq()
+TIMER_A = 0x01
+TIMER_B = 0x02
+
+# Idle chips kept by a ChipPool by default
+DEFAULT_POOL_SIZE = 8
+
+
+@lru_cache(maxsize=None)
+def reset_image() -> bytes:
+    """
+    The opm_t state right after OPM_Reset
+    
+    OPM_Reset clears the struct and then clocks the chip 2048 times with
+    IC asserted, which is deterministic and costs a few hundred times more
+    than copying the result. The image is computed once per process and
+    copied by NukedOPM.reset().
+    """
+    chip = OPM_t()
+    _lib.OPM_Reset(ctypes.byref(chip))
+    return ctypes.string_at(ctypes.addressof(chip), ctypes.sizeof(OPM_t))
+
+
+@lru_cache(maxsize=None)
+def library_digest() -> str:
+    """
+    SHA-256 of the loaded shared library file
+    
+    Identifies the emulator build (opm.c and opm_render.c), e.g. to
+    invalidate cached renders when the library is rebuilt.
+    """
+    with open(_lib_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def as_events(events, clocks_per_tick: int = 1) -> np.ndarray:
+    """
+    Convert register writes to an EVENT_DTYPE array
+    
+    Args:
+        events: EVENT_DTYPE array or sequence of (time, address, data)
+        clocks_per_tick: Chip clocks per time unit (1 for cycle offsets,
+            CLOCKS_PER_SAMPLE for sample offsets)
+            
+    Returns:
+        EVENT_DTYPE array with times converted to cycles
+    """
+    if isinstance(events, np.ndarray) and events.dtype == EVENT_DTYPE:
+        result = events.copy()
+    else:
+        rows = np.asarray(events, dtype=np.int64).reshape(-1, 3)
+        if (rows[:, 0] < 0).any():
+            raise ValueError("Event times must not be negative")
+        result = np.empty(len(rows), dtype=EVENT_DTYPE)
+        result['cycle'] = rows[:, 0]
+        result['address'] = rows[:, 1]
+        result['data'] = rows[:, 2]
+    if clocks_per_tick != 1:
+        result['cycle'] *= np.uint64(clocks_per_tick)
+    return result
+
+
 
 class NukedOPM:
-    """High-level wrapper for Nuked-OPM YM2151 emulator"""
+    """
+    High-level wrapper for Nuked-OPM YM2151 emulator
     
-    def __init__(self):
-        """Initialize the YM2151 chip"""
+    Thread safety:
+        An instance is not thread-safe; call its methods from one thread at
+        a time. Separate instances share no mutable state (opm.c only has
+        read-only tables), so they can be driven from separate threads.
+        The library is loaded with ctypes.CDLL, which releases the GIL for
+        the duration of every native call, so render() of different
+        instances runs in parallel when opm_render.c is built in. The
+        Python fallback and clock() hold the GIL between cycles and do not
+        scale across threads.
+    
+    Silence skipping:
+        With skip_silence set, render() fills the output with zeros up to
+        the next scheduled write while every envelope has fully released,
+        the timers and noise are stopped and the LFO modulates no channel.
+        Meanwhile only the chip's free-running stages (envelope timer,
+        phase generator, timers, LFO and noise) are clocked, and a couple
+        of full samples before the write refresh the rest, so the output
+        and the chip state are identical to full emulation.
+        compare_silence_skip() checks this.
+    
+    Recording:
+        With a recorder attached (recorder.WriteRecorder.attach()), every
+        write passed to write_registers(), write_register() or schedule()
+        is logged with its chip time, e.g. for export as a VGM file.
+    """
+    
+    def __init__(self, snapshot: bytes = None, skip_silence: bool = False):
+        """
+        Initialize the YM2151 chip
+        
+        Args:
+            snapshot: Optional state from snapshot() to start from instead
+                of resetting the chip
+            skip_silence: Skip emulation while the chip is silent (needs
+                opm_render.c; see the class docstring)
+        """
+        self.skip_silence = skip_silence
+        self.skipped_samples = 0  # Samples zero-filled by silence skipping
+        self._skipped = ctypes.c_uint32()
         self.chip = OPM_t()
-        self.reset()
+        self._chip_ref = ctypes.byref(self.chip)
+        self._output = (ctypes.c_int32 * 2)()  # Stereo output array
+        self._sh1 = ctypes.c_uint8()
+        self._sh2 = ctypes.c_uint8()
+        self._so = ctypes.c_uint8()
+        self.stream = OPM_Stream()
+        self._stream_ref = ctypes.byref(self.stream)
+        self._channels = OPM_Channels()
+        self._channels_ref = ctypes.byref(self._channels)
+        self._events = np.empty(0, dtype=EVENT_DTYPE)
+        self._state = None
+        self.recorder = None  # see recorder.WriteRecorder
+        if snapshot is None:
+            self.reset()
+        else:
+            self.restore(snapshot)
     
     def reset(self):
-        """Reset the chip to initial state"""
-        _lib.OPM_Reset(ctypes.byref(self.chip))
+        """
+        Reset the chip to initial state and drop scheduled writes
+        
+        Copies reset_image() instead of running OPM_Reset.
+        """
+        if self.recorder is not None:
+            self.recorder.rebase(self.stream.cycle, 0)
+        ctypes.memmove(ctypes.addressof(self.chip), reset_image(), ctypes.sizeof(OPM_t))
+        ctypes.memset(self._stream_ref, 0, ctypes.sizeof(OPM_Stream))
+        ctypes.memset(self._channels_ref, 0, ctypes.sizeof(OPM_Channels))
+        self._events = np.empty(0, dtype=EVENT_DTYPE)
+    
+    @property
+    def cycle(self) -> int:
+        """Number of OPM_Clock calls since reset"""
+        return self.stream.cycle
+    
+    @property
+    def pending_events(self) -> int:
+        """Number of scheduled register writes not yet started"""
+        return len(self._events)
+    
+    def snapshot(self) -> bytes:
+        """
+        Save the complete chip state
+        
+        Scheduled events that have not started yet are not included.
+        
+        Returns:
+            Immutable copy of the opm_t struct and write scheduler state,
+            usable with restore() on this or any other NukedOPM instance
+        """
+        return (ctypes.string_at(ctypes.addressof(self.chip), ctypes.sizeof(OPM_t))
+                + ctypes.string_at(ctypes.addressof(self.stream), ctypes.sizeof(OPM_Stream)))
+    
+    def restore(self, snapshot: bytes):
+        """
+        Restore a chip state saved by snapshot()
+        
+        Args:
+            snapshot: State bytes (bytes, bytearray or memoryview)
+        """
+        if len(snapshot) != STATE_SIZE:
+            raise ValueError(f"Snapshot must be {STATE_SIZE} bytes, got {len(snapshot)}")
+        if not isinstance(snapshot, bytes):
+            snapshot = bytes(snapshot)
+        chip_size = ctypes.sizeof(OPM_t)
+        before = self.stream.cycle
+        ctypes.memmove(ctypes.addressof(self.chip), snapshot, chip_size)
+        ctypes.memmove(ctypes.addressof(self.stream), snapshot[chip_size:], ctypes.sizeof(OPM_Stream))
+        if self.recorder is not None:
+            self.recorder.rebase(before, self.stream.cycle)
+        ctypes.memset(self._channels_ref, 0, ctypes.sizeof(OPM_Channels))
+    
+    def fork(self) -> 'NukedOPM':
+        """
+        Clone this chip
+        
+        Returns:
+            New NukedOPM with an independent copy of the current state
+        """
+        return NukedOPM(self.snapshot(), skip_silence=self.skip_silence)
+    
+    def is_silent(self) -> bool:
+        """
+        Whether the chip stays silent until the next register write
+        
+        True when every envelope is fully released with no key on, the
+        timers are stopped, the output is zero and no write is in flight.
+        Always False without opm_render.c.
+        """
+        if not HAS_SILENCE_SKIP:
+            return False
+        return bool(_lib.OPM_IsSilent(self._chip_ref, self._stream_ref))
+    
+    def read_status(self) -> int:
+        """
+        Read the status register (OPM_Read)
+        
+        Returns:
+            Bit 7 write busy, bit 1 timer B flag (TIMER_B), bit 0 timer A
+            flag (TIMER_A)
+        """
+        return _lib.OPM_Read(self._chip_ref, 0)
+    
+    def irq(self) -> bool:
+        """Whether the IRQ output is asserted (a timer flag is set)"""
+        return bool(_lib.OPM_ReadIRQ(self._chip_ref))
+    
+    @property
+    def state(self) -> np.ndarray:
+        """
+        Zero-copy numpy view of the chip state
+        
+        Fields mirror opm_t (e.g. state['ch_kc'], state['sl_tl'],
+        state['eg_level']) and always reflect the live chip. Copy a field
+        before keeping it across render calls.
+        """
+        if self._state is None:
+            self._state = state_view(self.chip)
+        return self._state
     
     def write(self, port: int, data: int):
         """
@@ -72,44 +433,379 @@ class NukedOPM:
             port: Register port (0 for address, 1 for data)
             data: Data byte to write
         """
-        _lib.OPM_Write(ctypes.byref(self.chip), port, data)
+        _lib.OPM_Write(self._chip_ref, port, data)
     
-    def write_register(self, address: int, data: int):
+    def write_register(self, address: int, data: int) -> int:
         """
-        Write to a specific register (convenience method)
+        Write to a specific register and wait until it has landed
         
         Args:
             address: Register address (0x00-0xFF)
             data: Data value (0x00-0xFF)
+        
+        Returns:
+            Number of chip clocks run; see write_registers()
         """
-        self.write(0, address)  # Write address
-        self.write(1, data)     # Write data
+        return self.write_registers(((address, data),))
+    
+    def write_registers(self, pairs) -> int:
+        """
+        Write many registers in one native call
+        
+        The chip is clocked between the writes with the same timing as
+        scheduled writes (address, data after WRITE_DELAY clocks, then
+        until write_busy clears), so every write has reached the register
+        file on return. The chip time advances by the clocks this takes
+        (about one native sample per write) and the output produced
+        meanwhile is discarded. A scheduled write already in progress is
+        completed first; scheduled writes that fall due meanwhile are
+        applied by the next render().
+        
+        Args:
+            pairs: (address, data) pairs as bytes (address, data,
+                address, data, ...), a uint8 array of shape (n, 2) or a
+                sequence of tuples
+        
+        Returns:
+            Number of chip clocks run
+        """
+        if isinstance(pairs, (bytes, bytearray, memoryview)):
+            pairs = np.frombuffer(pairs, dtype=np.uint8)
+        pairs = np.ascontiguousarray(pairs, dtype=np.uint8).reshape(-1, 2)
+        if self.recorder is not None:
+            self.recorder.record_pairs(self.stream.cycle, pairs)
+        
+        if HAS_NATIVE_WRITES:
+            return _lib.OPM_WriteRegisters(self._chip_ref, self._stream_ref,
+                                           pairs.ctypes.data, len(pairs))
+        
+        stream = self.stream
+        clocks = 0
+        index = 0
+        while index < len(pairs) or stream.wait or stream.data_pending or self.chip.write_busy:
+            if not stream.wait and not stream.data_pending and not self.chip.write_busy \
+                    and index < len(pairs):
+                _lib.OPM_Write(self._chip_ref, 0, int(pairs[index, 0]))
+                stream.data = int(pairs[index, 1])
+                stream.data_pending = 1
+                stream.wait = WRITE_DELAY
+                index += 1
+            elif not stream.wait and stream.data_pending:
+                _lib.OPM_Write(self._chip_ref, 1, stream.data)
+                stream.data_pending = 0
+                stream.wait = WRITE_DELAY
+            _lib.OPM_Clock(self._chip_ref, None, None, None, None)
+            self._stream_advance()
+            clocks += 1
+        return clocks
     
     def clock(self) -> Tuple[int, int, int, int, int]:
         """
         Clock the chip once and get output
         
+        This is one ctypes call per chip cycle and is intended for debugging.
+        Use render() for bulk audio generation.
+        
         Returns:
             Tuple of (left_sample, right_sample, sh1, sh2, so)
         """
-        output = (ctypes.c_int32 * 2)()  # Stereo output array
-        sh1 = ctypes.c_uint8()
-        sh2 = ctypes.c_uint8()
-        so = ctypes.c_uint8()
+        output = self._output
+        sh1 = self._sh1
+        sh2 = self._sh2
+        so = self._so
         
+        self._stream_write()
         _lib.OPM_Clock(
-            ctypes.byref(self.chip),
+            self._chip_ref,
             output,
             ctypes.byref(sh1),
             ctypes.byref(sh2),
             ctypes.byref(so)
         )
+        self._stream_advance()
         
         return output[0], output[1], sh1.value, sh2.value, so.value
     
+    def schedule(self, events, clocks_per_tick: int = 1):
+        """
+        Queue register writes to be applied during rendering
+        
+        Each write is applied inside the render loop at its exact cycle, or
+        as soon as the chip's write-busy window allows. Timing therefore
+        does not depend on how the render is split into chunks.
+        
+        Args:
+            events: EVENT_DTYPE array or sequence of (time, address, data),
+                with times as offsets from the current cycle
+            clocks_per_tick: Chip clocks per time unit (CLOCKS_PER_SAMPLE
+                for sample offsets)
+        """
+        events = as_events(events, clocks_per_tick)
+        events['cycle'] += np.uint64(self.stream.cycle)
+        if self.recorder is not None:
+            self.recorder.record(events)
+        if len(self._events):
+            events = np.concatenate((self._events, events))
+        order = np.argsort(events['cycle'], kind='stable')
+        self._events = np.ascontiguousarray(events[order])
+    
+    def _stream_write(self):
+        """Python version of OPM_StreamWrite for clock() and fallback rendering"""
+        stream = self.stream
+        if stream.wait:
+            return
+        if stream.data_pending:
+            _lib.OPM_Write(self._chip_ref, 1, stream.data)
+            stream.data_pending = 0
+            stream.wait = WRITE_DELAY
+        elif (len(self._events) and self._events[0]['cycle'] <= stream.cycle
+              and not self.chip.write_busy):
+            event = self._events[0]
+            _lib.OPM_Write(self._chip_ref, 0, int(event['address']))
+            stream.data = int(event['data'])
+            stream.data_pending = 1
+            stream.wait = WRITE_DELAY
+            self._events = self._events[1:]
+    
+    def _stream_advance(self):
+        """Account for one OPM_Clock call in the scheduler state"""
+        stream = self.stream
+        stream.cycle += 1
+        if stream.wait:
+            stream.wait -= 1
+    
+    def render(self, num_samples: int, clocks_per_sample: int = CLOCKS_PER_SAMPLE,
+               out: np.ndarray = None, events=None, stems: np.ndarray = None) -> np.ndarray:
+        """
+        Render stereo samples in one native call
+        
+        Args:
+            num_samples: Number of stereo samples to render
+            clocks_per_sample: OPM_Clock calls per sample (default: one
+                chip sample, i.e. 32 clocks at clock / 64 Hz)
+            out: Optional C-contiguous int32 array of shape (num_samples, 2)
+                to render into instead of allocating a new one
+            events: Optional register writes to schedule first, as
+                (cycle offset, address, data); see schedule()
+            stems: Optional C-contiguous int32 array of shape
+                (num_samples, 8, 2) that receives each channel's
+                contribution in the same pass; see render_stems()
+            
+        Returns:
+            int32 numpy array of shape (num_samples, 2) with (left, right)
+        
+        Raises:
+            RuntimeError: If stems is given and the library lacks
+                opm_render.c
+        """
+        if events is not None:
+            self.schedule(events)
+        if out is None:
+            out = np.empty((num_samples, 2), dtype=np.int32)
+        elif (out.dtype != np.int32 or out.shape != (num_samples, 2)
+              or not out.flags.c_contiguous):
+            raise ValueError("out must be a C-contiguous int32 array of shape (num_samples, 2)")
+        if stems is not None:
+            if (stems.dtype != np.int32 or stems.shape != (num_samples, NUM_CHANNELS, 2)
+                    or not stems.flags.c_contiguous):
+                raise ValueError(
+                    "stems must be a C-contiguous int32 array of shape (num_samples, 8, 2)")
+            if not HAS_NATIVE_CHANNELS:
+                raise RuntimeError(f"{_lib_name} was built without opm_render.c; "
+                                   "per-channel capture is not available")
+        
+        if num_samples == 0:
+            return out
+        
+        stream = self.stream
+        idle = not len(self._events) and not stream.wait and not stream.data_pending
+        if stems is not None:
+            skipped = self._skipped
+            skipped.value = 0
+            consumed = _lib.OPM_RenderEventsChannels(
+                self._chip_ref,
+                self._stream_ref,
+                self._channels_ref,
+                out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                stems.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                num_samples,
+                clocks_per_sample,
+                self._events.ctypes.data,
+                len(self._events),
+                ctypes.byref(skipped) if self.skip_silence else None
+            )
+            self._events = self._events[consumed:]
+            self.skipped_samples += skipped.value
+        elif self.skip_silence and HAS_SILENCE_SKIP:
+            skipped = self._skipped
+            skipped.value = 0
+            consumed = _lib.OPM_RenderEventsSkipSilence(
+                self._chip_ref,
+                self._stream_ref,
+                out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                num_samples,
+                clocks_per_sample,
+                self._events.ctypes.data,
+                len(self._events),
+                ctypes.byref(skipped)
+            )
+            self._events = self._events[consumed:]
+            self.skipped_samples += skipped.value
+        elif HAS_NATIVE_RENDER and idle:
+            _lib.OPM_RenderSamples(
+                self._chip_ref,
+                out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                num_samples,
+                clocks_per_sample
+            )
+            stream.cycle += num_samples * clocks_per_sample
+        elif HAS_NATIVE_EVENTS:
+            consumed = _lib.OPM_RenderEvents(
+                self._chip_ref,
+                self._stream_ref,
+                out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                num_samples,
+                clocks_per_sample,
+                self._events.ctypes.data,
+                len(self._events)
+            )
+            self._events = self._events[consumed:]
+        else:
+            output = self._output
+            for i in range(num_samples):
+                for _ in range(clocks_per_sample):
+                    self._stream_write()
+                    _lib.OPM_Clock(self._chip_ref, output, None, None, None)
+                    self._stream_advance()
+                out[i, 0] = output[0]
+                out[i, 1] = output[1]
+        return out
+    
+    def render_until_irq(self, num_samples: int, clocks_per_sample: int = CLOCKS_PER_SAMPLE,
+                         out: np.ndarray = None) -> Tuple[np.ndarray, int]:
+        """
+        Render until a timer raises its flag, in one native call
+        
+        Stops at the end of the sample in which the timer A or B flag went
+        from clear to set (the emulated timer interrupt; the IRQ enable
+        bits of register 0x14 do not matter). A flag that is already set
+        does not stop the render again until it has been cleared.
+        
+        Args:
+            num_samples: Largest number of stereo samples to render
+            clocks_per_sample: OPM_Clock calls per sample
+            out: Optional C-contiguous int32 array of shape (num_samples, 2)
+            
+        Returns:
+            (rendered samples, a view of out; raised flags, a mask of
+            TIMER_A and TIMER_B that is 0 if no flag was raised)
+        """
+        if out is None:
+            out = np.empty((num_samples, 2), dtype=np.int32)
+        elif (out.dtype != np.int32 or out.shape != (num_samples, 2)
+              or not out.flags.c_contiguous):
+            raise ValueError("out must be a C-contiguous int32 array of shape (num_samples, 2)")
+        
+        if HAS_NATIVE_IRQ:
+            rendered = ctypes.c_uint32()
+            raised = ctypes.c_uint32()
+            consumed = _lib.OPM_RenderUntilIRQ(
+                self._chip_ref,
+                self._stream_ref,
+                out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                num_samples,
+                clocks_per_sample,
+                self._events.ctypes.data,
+                len(self._events),
+                ctypes.byref(rendered),
+                ctypes.byref(raised)
+            )
+            self._events = self._events[consumed:]
+            return out[:rendered.value], raised.value
+        
+        output = self._output
+        status = self.read_status() & (TIMER_A | TIMER_B)
+        flags = 0
+        for i in range(num_samples):
+            for _ in range(clocks_per_sample):
+                self._stream_write()
+                _lib.OPM_Clock(self._chip_ref, output, None, None, None)
+                self._stream_advance()
+                current = self.read_status() & (TIMER_A | TIMER_B)
+                flags |= current & ~status
+                status = current
+            out[i, 0] = output[0]
+            out[i, 1] = output[1]
+            if flags:
+                return out[:i + 1], flags
+        return out, 0
+    
+    def render_stems(self, num_samples: int, clocks_per_sample: int = CLOCKS_PER_SAMPLE,
+                     events=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Render the mix and each channel's contribution in one pass
+        
+        The contributions are the per-channel sums that the chip's mixer
+        feeds to its DAC, aligned with the mixed output. They add up to the
+        sum the DAC converts, but the conversion is not exact: opm.c's
+        floating-point converter (OPM_Mixer2) latches each exponent while
+        the four lowest mantissa bits of the side are already on their
+        way out, so those bits are taken with the exponent of the value
+        converted before it (the right side of the same sample for the
+        left output, the left side of the previous sample for the right
+        output). The output can therefore differ from the sum of the
+        stems by up to 15 steps of the DAC's resolution at that level,
+        besides the rounding to that resolution; a side whose exponent
+        matches the previous value's is only rounded.
+        Capture state is not part of snapshot(); after restore() the first
+        two samples of each channel may be incomplete.
+        
+        Args:
+            num_samples: Number of stereo samples to render
+            clocks_per_sample: OPM_Clock calls per sample
+            events: Optional register writes to schedule first
+        
+        Returns:
+            (mix, stems): int32 arrays of shape (num_samples, 2) and
+            (num_samples, 8, 2), stems indexed [sample, channel, side]
+        """
+        stems = np.empty((num_samples, NUM_CHANNELS, 2), dtype=np.int32)
+        mix = self.render(num_samples, clocks_per_sample, events=events, stems=stems)
+        return mix, stems
+    
+    def compare_silence_skip(self, num_samples: int,
+                             clocks_per_sample: int = CLOCKS_PER_SAMPLE) -> dict:
+        """
+        Check silence skipping against full emulation
+        
+        Renders the next num_samples from the current state (including
+        scheduled writes) twice, with and without skipping. This chip is
+        left untouched.
+        
+        Returns:
+            Dict with 'samples', 'skipped' (samples zero-filled by the
+            skipping render), 'first_difference' (index of the first
+            differing sample, or None) and 'max_difference' (largest
+            absolute sample difference)
+        """
+        renders = []
+        for skip in (False, True):
+            chip = NukedOPM(self.snapshot(), skip_silence=skip)
+            chip._events = self._events.copy()
+            renders.append((chip.render(num_samples, clocks_per_sample), chip.skipped_samples))
+        (full, _), (fast, skipped) = renders
+        difference = np.abs(full.astype(np.int64) - fast)
+        mismatched = np.flatnonzero(difference.any(axis=1))
+        return {
+            "samples": num_samples,
+            "skipped": skipped,
+            "first_difference": int(mismatched[0]) if len(mismatched) else None,
+            "max_difference": int(difference.max()) if num_samples else 0,
+        }
+    
     def generate_samples(self, num_samples: int) -> list:
         """
-        Generate audio samples
+        Generate audio samples (one sample per chip clock)
         
         Args:
             num_samples: Number of samples to generate
@@ -117,8 +813,128 @@ class NukedOPM:
         Returns:
             List of stereo samples (left, right) tuples
         """
-        samples = []
-        for _ in range(num_samples):
-            left, right, _, _, _ = self.clock()
-            samples.append((left, right))
-        return samples
+        samples = self.render(num_samples, clocks_per_sample=1)
+        return list(map(tuple, samples.tolist()))
+
+
+class SnapshotPool:
+    """
+    Named chip snapshots for branching renders
+    
+    Render a shared prefix once, save() it, then branch() as many chips as
+    needed. Snapshots are immutable bytes, so every branch shares the
+    stored copy and only pays for its own chip state.
+    """
+    
+    def __init__(self):
+        """Create an empty pool"""
+        self._snapshots: Dict[Hashable, bytes] = {}
+    
+    def save(self, key: Hashable, chip: NukedOPM) -> bytes:
+        """
+        Store the current state of a chip
+        
+        Args:
+            key: Name of the snapshot
+            chip: Chip to snapshot
+            
+        Returns:
+            The stored snapshot
+        """
+        snapshot = chip.snapshot()
+        self._snapshots[key] = snapshot
+        return snapshot
+    
+    def get(self, key: Hashable) -> bytes:
+        """Return a stored snapshot"""
+        return self._snapshots[key]
+    
+    def branch(self, key: Hashable) -> NukedOPM:
+        """
+        Create a new chip starting from a stored snapshot
+        
+        Args:
+            key: Name of the snapshot
+            
+        Returns:
+            New NukedOPM instance
+        """
+        return NukedOPM(self._snapshots[key])
+    
+    def discard(self, key: Hashable):
+        """Remove a snapshot if present"""
+        self._snapshots.pop(key, None)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._snapshots
+    
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+
+class ChipPool:
+    """
+    Bounded pool of idle, reset chips
+    
+    A render service checks a chip out per job and back in when the job
+    is done, instead of creating one per job. Checked-in chips are reset
+    and kept for the next checkout, up to max_idle; further chips are
+    dropped. checkout() never blocks: with no idle chip it creates one.
+    The pool is thread-safe; the chips themselves are not (see NukedOPM).
+    """
+    
+    def __init__(self, max_idle: int = DEFAULT_POOL_SIZE, prefill: int = 0):
+        """
+        Args:
+            max_idle: Largest number of idle chips kept
+            prefill: Chips to create up front (at most max_idle)
+        """
+        if max_idle < 0:
+            raise ValueError(f"max_idle must not be negative, got {max_idle}")
+        self.max_idle = max_idle
+        self.created = 0   # Chips created by checkout() or prefill
+        self.reused = 0    # Checkouts served from the idle chips
+        self._idle: List[NukedOPM] = []
+        self._lock = threading.Lock()
+        for _ in range(min(prefill, max_idle)):
+            self._idle.append(NukedOPM())
+            self.created += 1
+    
+    def checkout(self, skip_silence: bool = False) -> NukedOPM:
+        """
+        Take a chip in its reset state
+        
+        Args:
+            skip_silence: Silence skipping setting for the chip
+        """
+        with self._lock:
+            chip = self._idle.pop() if self._idle else None
+            if chip is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if chip is None:
+            chip = NukedOPM()
+        chip.skip_silence = skip_silence
+        chip.skipped_samples = 0
+        return chip
+    
+    def checkin(self, chip: NukedOPM):
+        """Return a chip; it is reset, and dropped if the pool is full"""
+        chip.reset()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(chip)
+    
+    @contextmanager
+    def chip(self, skip_silence: bool = False) -> Iterator[NukedOPM]:
+        """Check a chip out for the duration of a with block"""
+        chip = self.checkout(skip_silence)
+        try:
+            yield chip
+        finally:
+            self.checkin(chip)
+    
+    def __len__(self) -> int:
+        """Number of idle chips"""
+        return len(self._idle)
@@ -0,0 +1,517 @@
+/*
+ * Native render helpers for the Python Nuked-OPM wrapper (nuked_opm.py).
+ *
+ * These functions run the OPM_Clock loop in C so that Python only has to
+ * cross the ctypes boundary once per block instead of once per chip cycle.
+ *
+ * opm.c is compiled as part of this file (build it on its own, not next to
+ * it) so that silence skipping can run the chip's free-running stages,
+ * which are static functions there, without the rest of OPM_Clock.
+ */
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#include "opm.c"
+
+/*
+ * Clocks between two port writes. The address byte is latched by the
+ * clock after the write and consumed by the one after that, so the data
+ * byte (which shares write_data) must not be written earlier.
+ */
+#define OPM_WRITE_DELAY 2
+
+/* Register write scheduled at an absolute clock (mirrors EVENT_DTYPE). */
+typedef struct
+{
+    uint64_t cycle;
+    uint8_t address;
+    uint8_t data;
+} opm_event_t;
+
+/*
+ * Write scheduler state carried across render calls (mirrors OPM_Stream).
+ * Keeping it outside the call makes event timing independent of how a
+ * render is split into chunks.
+ */
+typedef struct
+{
+    uint64_t cycle;       /* OPM_Clock calls since reset */
+    uint32_t wait;        /* clocks left before the next port write */
+    uint8_t data_pending; /* address written, data byte still to write */
+    uint8_t data;
+} opm_stream_t;
+
+/* Number of FM channels. */
+#define OPM_CHANNELS 8
+
+/*
+ * Values of chip->cycles at which the mixer starts a new sum for the right
+ * and the left output (see OPM_Mixer in opm.c).
+ */
+#define OPM_MIX_START_RIGHT 13
+#define OPM_MIX_START_LEFT 29
+
+/*
+ * Per-channel capture state carried across render calls (mirrors
+ * OPM_Channels). Sums are indexed [channel][side] with side 0 = left and
+ * 1 = right, the layout of one stems frame.
+ */
+typedef struct
+{
+    int32_t sum[OPM_CHANNELS][2];     /* sums being accumulated */
+    int32_t done[OPM_CHANNELS][2];    /* last completed sums */
+    int32_t serial[OPM_CHANNELS][2];  /* completed sums on their way to the DAC */
+    int32_t output[OPM_CHANNELS][2];  /* sums behind the current DAC output */
+} opm_channels_t;
+
+/*
+ * Size of opm_t as compiled into this library, used by the Python side to
+ * verify its ctypes mirror of the struct.
+ */
+uint32_t OPM_StateSize(void)
+{
+    return (uint32_t)sizeof(opm_t);
+}
+
+/*
+ * Advance a register write in progress for the upcoming clock (the data
+ * byte follows the address byte after OPM_WRITE_DELAY clocks). Returns
+ * nonzero if a new register write may start on this clock: the previous
+ * one has been fully handed over and the chip no longer reports
+ * write_busy.
+ */
+static uint32_t OPM_StreamReady(opm_t *chip, opm_stream_t *stream)
+{
+    if (stream->wait)
+    {
+        return 0;
+    }
+    if (stream->data_pending)
+    {
+        OPM_Write(chip, 1, stream->data);
+        stream->data_pending = 0;
+        stream->wait = OPM_WRITE_DELAY;
+        return 0;
+    }
+    return !chip->write_busy;
+}
+
+/* Start a register write: the address byte now, the data byte later. */
+static void OPM_StreamStart(opm_t *chip, opm_stream_t *stream, uint8_t address, uint8_t data)
+{
+    OPM_Write(chip, 0, address);
+    stream->data = data;
+    stream->data_pending = 1;
+    stream->wait = OPM_WRITE_DELAY;
+}
+
+/*
+ * Issue at most one port write for the upcoming clock. A new register
+ * write starts only when its time has come and OPM_StreamReady() allows.
+ * Returns the index of the next unconsumed event.
+ */
+static uint32_t OPM_StreamWrite(opm_t *chip, opm_stream_t *stream, const opm_event_t *events,
+                                uint32_t num_events, uint32_t next)
+{
+    if (next < num_events && events[next].cycle <= stream->cycle)
+    {
+        if (OPM_StreamReady(chip, stream))
+        {
+            OPM_StreamStart(chip, stream, events[next].address, events[next].data);
+            next++;
+        }
+    }
+    else
+    {
+        OPM_StreamReady(chip, stream);
+    }
+    return next;
+}
+
+static void OPM_StreamClock(opm_t *chip, opm_stream_t *stream, int32_t *output)
+{
+    OPM_Clock(chip, output, NULL, NULL, NULL);
+    stream->cycle++;
+    if (stream->wait)
+    {
+        stream->wait--;
+    }
+}
+
+/*
+ * Split the mixer input of the upcoming clock by channel.
+ *
+ * The mixer adds op_mix (the slot output, or the noise on slot 31) to the
+ * left and right sums once per clock; the slot mixed on a clock was
+ * selected by the previous one, so it belongs to channel
+ * ((cycles + 18) % 32) % 8. Each side restarts its sum once per sample,
+ * and the completed sum reaches the DAC output 40 clocks later: it is the
+ * one before the most recently completed sum at the DAC latch.
+ */
+static void OPM_ChannelsMix(const opm_t *chip, opm_channels_t *channels)
+{
+    uint32_t channel = ((chip->cycles + 18) % 32) % OPM_CHANNELS;
+
+    if (chip->cycles == OPM_MIX_START_RIGHT || chip->cycles == OPM_MIX_START_LEFT)
+    {
+        uint32_t side = chip->cycles == OPM_MIX_START_RIGHT;
+        uint32_t ch;
+        for (ch = 0; ch < OPM_CHANNELS; ch++)
+        {
+            channels->serial[ch][side] = channels->done[ch][side];
+            channels->done[ch][side] = channels->sum[ch][side];
+            channels->sum[ch][side] = 0;
+        }
+    }
+    channels->sum[channel][0] += chip->op_mix * chip->op_mixl;
+    channels->sum[channel][1] += chip->op_mix * chip->op_mixr;
+}
+
+/*
+ * Latch the channel sums behind the DAC output on the clocks where the DAC
+ * updates it (falling edge of the sample-and-hold signals, as in OPM_DAC).
+ */
+static void OPM_ChannelsLatch(const opm_t *chip, opm_channels_t *channels, uint8_t sh1,
+                              uint8_t sh2)
+{
+    uint32_t ch;
+
+    for (ch = 0; ch < OPM_CHANNELS; ch++)
+    {
+        if (sh2 && !chip->smp_sh2)
+        {
+            channels->output[ch][0] = channels->serial[ch][0];
+        }
+        if (sh1 && !chip->smp_sh1)
+        {
+            channels->output[ch][1] = channels->serial[ch][1];
+        }
+    }
+}
+
+/* Envelope attenuation of a slot that has fully decayed. */
+#define OPM_EG_SILENT 0x3ff
+
+/* Clocks in one pass over all 32 slots. */
+#define OPM_SLOT_CLOCKS 32
+
+/*
+ * Full samples rendered after each skip. They refresh the operator,
+ * envelope and mixer pipelines that OPM_ClockCounters leaves out.
+ */
+#define OPM_SETTLE_SAMPLES 2
+
+/*
+ * Whether the chip provably produces silence until the next register
+ * write: every envelope is at maximum attenuation in release with no key
+ * on (including CSM), the timers are stopped, the noise generator is off,
+ * the LFO cannot modulate any channel, the output is zero and no write is
+ * in flight.
+ */
+uint32_t OPM_IsSilent(const opm_t *chip, const opm_stream_t *stream)
+{
+    uint32_t slot, ch;
+
+    if (chip->ic || chip->dac_output[0] || chip->dac_output[1])
+    {
+        return 0;
+    }
+    if (chip->timer_loada || chip->timer_loadb || chip->timer_a_load || chip->mode_csm
+        || chip->kon_csm || chip->kon_csm_lock)
+    {
+        return 0;
+    }
+    if (stream->wait || stream->data_pending || chip->write_busy)
+    {
+        return 0;
+    }
+    if (chip->noise_en)
+    {
+        return 0;
+    }
+    for (ch = 0; ch < OPM_CHANNELS; ch++)
+    {
+        if ((chip->lfo_amd && chip->ch_ams[ch]) || (chip->lfo_pmd && chip->ch_pms[ch]))
+        {
+            return 0;
+        }
+    }
+    for (slot = 0; slot < 32; slot++)
+    {
+        if (chip->eg_level[slot] != OPM_EG_SILENT || chip->eg_state[slot] != eg_num_release
+            || chip->mode_kon[slot] || chip->kon[slot])
+        {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/*
+ * One clock of the chip's free-running stages only, in OPM_Clock order:
+ * envelope timer, phase generator, timers, LFO, noise and write port. While
+ * the chip is silent these are the only stages whose state moves on, so
+ * running them keeps the envelope timer, LFO and noise phases exactly where
+ * full emulation would have them.
+ */
+static void OPM_ClockCounters(opm_t *chip)
+{
+    OPM_EnvelopeTimer(chip);
+
+    OPM_PhaseDebug(chip);
+    OPM_PhaseGenerate(chip);
+    OPM_PhaseCalcIncrement(chip);
+    OPM_PhaseCalcFNumBlock(chip);
+
+    OPM_DoTimerIRQ(chip);
+    OPM_DoTimerA(chip);
+    OPM_DoTimerB(chip);
+    OPM_DoLFOMult(chip);
+    OPM_DoLFO1(chip);
+    OPM_Noise(chip);
+    OPM_EnvelopeClock(chip);
+    OPM_NoiseTimer(chip);
+    OPM_DoIO(chip);
+    OPM_DoTimerA2(chip);
+    OPM_DoTimerB2(chip);
+    OPM_DoLFO2(chip);
+    OPM_CSM(chip);
+    OPM_NoiseChannel(chip);
+    chip->cycles = (chip->cycles + 1) % 32;
+}
+
+static uint32_t OPM_RenderLoop(opm_t *chip, opm_stream_t *stream, opm_channels_t *channels,
+                               int32_t *buffer, int32_t *stems, uint32_t num_samples,
+                               uint32_t clocks_per_sample, const opm_event_t *events,
+                               uint32_t num_events, uint32_t *skipped)
+{
+    uint32_t i = 0, j, count;
+    uint32_t next = 0;
+    uint32_t silent_run = 0;
+    uint64_t due;
+    uint8_t sh1, sh2;
+    int32_t output[2] = { 0, 0 };
+
+    while (i < num_samples)
+    {
+        /*
+         * Skip whole slot passes while the chip is silent. The silence has
+         * to hold on two consecutive samples so that nothing is left in
+         * the operator and mixer pipelines. Only the free-running stages
+         * are clocked meanwhile, and the skip stops OPM_SETTLE_SAMPLES
+         * short of the next write (or the end of the block) so that full
+         * samples refresh the rest; the state afterwards is the one full
+         * emulation reaches.
+         */
+        if (skipped && clocks_per_sample % OPM_SLOT_CLOCKS == 0)
+        {
+            silent_run = OPM_IsSilent(chip, stream) ? silent_run + 1 : 0;
+            if (silent_run >= 2)
+            {
+                count = num_samples - i;
+                if (next < num_events)
+                {
+                    due = events[next].cycle > stream->cycle ? events[next].cycle - stream->cycle : 0;
+                    if (due / clocks_per_sample < count)
+                    {
+                        count = (uint32_t)(due / clocks_per_sample);
+                    }
+                }
+                count = count > OPM_SETTLE_SAMPLES ? count - OPM_SETTLE_SAMPLES : 0;
+                if (count)
+                {
+                    if (buffer)
+                    {
+                        memset(buffer + (size_t)i * 2, 0, (size_t)count * 2 * sizeof(int32_t));
+                    }
+                    if (stems)
+                    {
+                        memset(stems + (size_t)i * OPM_CHANNELS * 2, 0,
+                               (size_t)count * OPM_CHANNELS * 2 * sizeof(int32_t));
+                    }
+                    for (j = 0; j < count * clocks_per_sample; j++)
+                    {
+                        OPM_ClockCounters(chip);
+                    }
+                    stream->cycle += (uint64_t)count * clocks_per_sample;
+                    *skipped += count;
+                    i += count;
+                    silent_run = 0;
+                    continue;
+                }
+            }
+        }
+
+        if (channels)
+        {
+            for (j = 0; j < clocks_per_sample; j++)
+            {
+                next = OPM_StreamWrite(chip, stream, events, num_events, next);
+                OPM_ChannelsMix(chip, channels);
+                sh1 = chip->smp_sh1;
+                sh2 = chip->smp_sh2;
+                OPM_StreamClock(chip, stream, output);
+                OPM_ChannelsLatch(chip, channels, sh1, sh2);
+            }
+            if (stems)
+            {
+                memcpy(stems + (size_t)i * OPM_CHANNELS * 2, channels->output,
+                       sizeof(channels->output));
+            }
+        }
+        else
+        {
+            for (j = 0; j < clocks_per_sample; j++)
+            {
+                next = OPM_StreamWrite(chip, stream, events, num_events, next);
+                OPM_StreamClock(chip, stream, output);
+            }
+        }
+        if (buffer)
+        {
+            buffer[i * 2] = output[0];
+            buffer[i * 2 + 1] = output[1];
+        }
+        i++;
+    }
+    return next;
+}
+
+/*
+ * Render num_samples stereo frames while applying register writes from
+ * events (sorted by absolute cycle) at their scheduled clock. buffer may
+ * be NULL to only advance the chip. Returns the number of events
+ * consumed; the rest are left for the next call.
+ */
+uint32_t OPM_RenderEvents(opm_t *chip, opm_stream_t *stream, int32_t *buffer, uint32_t num_samples,
+                          uint32_t clocks_per_sample, const opm_event_t *events, uint32_t num_events)
+{
+    return OPM_RenderLoop(chip, stream, NULL, buffer, NULL, num_samples, clocks_per_sample, events,
+                          num_events, NULL);
+}
+
+/*
+ * Like OPM_RenderEvents, but fills stretches where OPM_IsSilent() holds
+ * with zeros instead of clocking the chip, up to the next scheduled write.
+ * Only whole passes over the 32 slots are skipped, so clocks_per_sample
+ * must be a multiple of 32 for anything to be skipped. The number of
+ * skipped samples is added to *skipped.
+ */
+uint32_t OPM_RenderEventsSkipSilence(opm_t *chip, opm_stream_t *stream, int32_t *buffer,
+                                     uint32_t num_samples, uint32_t clocks_per_sample,
+                                     const opm_event_t *events, uint32_t num_events,
+                                     uint32_t *skipped)
+{
+    return OPM_RenderLoop(chip, stream, NULL, buffer, NULL, num_samples, clocks_per_sample, events,
+                          num_events, skipped);
+}
+
+/*
+ * Like OPM_RenderEvents, but also writes the contribution of each channel
+ * to stems: num_samples frames of 8 channels x (left, right) int32, aligned
+ * with buffer. The contributions are the channel sums that enter the DAC,
+ * so they add up to the chip's mix before its floating-point conversion.
+ * channels carries the capture state between calls. skipped may be NULL;
+ * otherwise silence is skipped as in OPM_RenderEventsSkipSilence.
+ */
+uint32_t OPM_RenderEventsChannels(opm_t *chip, opm_stream_t *stream, opm_channels_t *channels,
+                                  int32_t *buffer, int32_t *stems, uint32_t num_samples,
+                                  uint32_t clocks_per_sample, const opm_event_t *events,
+                                  uint32_t num_events, uint32_t *skipped)
+{
+    return OPM_RenderLoop(chip, stream, channels, buffer, stems, num_samples, clocks_per_sample,
+                          events, num_events, skipped);
+}
+
+/* Timer status bits as returned by OPM_Read: bit 0 timer A, bit 1 timer B. */
+static uint32_t OPM_TimerStatus(const opm_t *chip)
+{
+    return chip->timer_a_status | (chip->timer_b_status << 1);
+}
+
+/*
+ * Like OPM_RenderEvents, but stop at the end of the first sample in which
+ * a timer status flag was raised, i.e. at the emulated timer interrupt.
+ * The flags are checked on every clock, so an overflow is caught even if
+ * a write clears its flag again within the same sample. *rendered
+ * receives the number of samples rendered and *raised the flags that
+ * were raised in the last one (0 if all num_samples were rendered without
+ * an interrupt). Returns the number of events consumed.
+ */
+uint32_t OPM_RenderUntilIRQ(opm_t *chip, opm_stream_t *stream, int32_t *buffer,
+                            uint32_t num_samples, uint32_t clocks_per_sample,
+                            const opm_event_t *events, uint32_t num_events, uint32_t *rendered,
+                            uint32_t *raised)
+{
+    uint32_t i, j;
+    uint32_t next = 0;
+    uint32_t status = OPM_TimerStatus(chip);
+    uint32_t flags = 0;
+    int32_t output[2] = { 0, 0 };
+
+    for (i = 0; i < num_samples && !flags; i++)
+    {
+        for (j = 0; j < clocks_per_sample; j++)
+        {
+            next = OPM_StreamWrite(chip, stream, events, num_events, next);
+            OPM_StreamClock(chip, stream, output);
+            flags |= OPM_TimerStatus(chip) & ~status;
+            status = OPM_TimerStatus(chip);
+        }
+        if (buffer)
+        {
+            buffer[i * 2] = output[0];
+            buffer[i * 2 + 1] = output[1];
+        }
+    }
+    *rendered = i;
+    *raised = flags;
+    return next;
+}
+
+/*
+ * Write count (address, data) pairs from pairs, clocking the chip until
+ * every write has reached the register file. A write in progress from the
+ * event scheduler is finished first. Output produced meanwhile is
+ * discarded. Returns the number of clocks run.
+ */
+uint32_t OPM_WriteRegisters(opm_t *chip, opm_stream_t *stream, const uint8_t *pairs,
+                            uint32_t count)
+{
+    uint32_t i = 0;
+    uint32_t clocks = 0;
+
+    while (i < count || stream->wait || stream->data_pending || chip->write_busy)
+    {
+        if (OPM_StreamReady(chip, stream) && i < count)
+        {
+            OPM_StreamStart(chip, stream, pairs[i * 2], pairs[i * 2 + 1]);
+            i++;
+        }
+        OPM_StreamClock(chip, stream, NULL);
+        clocks++;
+    }
+    return clocks;
+}
+
+/*
+ * Render num_samples stereo frames into buffer (interleaved L/R, int32).
+ * Each frame is taken after clocks_per_sample calls to OPM_Clock.
+ */
+void OPM_RenderSamples(opm_t *chip, int32_t *buffer, uint32_t num_samples,
+                       uint32_t clocks_per_sample)
+{
+    uint32_t i, j;
+    int32_t output[2] = { 0, 0 };
+
+    for (i = 0; i < num_samples; i++)
+    {
+        for (j = 0; j < clocks_per_sample; j++)
+        {
+            OPM_Clock(chip, output, NULL, NULL, NULL);
+        }
+        buffer[i * 2] = output[0];
+        buffer[i * 2 + 1] = output[1];
+    }
+}
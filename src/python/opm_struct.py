@@ -0,0 +1,295 @@
+"""
+ctypes and numpy layouts of the Nuked-OPM chip state (opm_t in opm.h)
+and of the structures shared with opm_render.c.
+
+The field list mirrors opm.h one-to-one so that the state can be inspected
+from Python without writing C. Keep it in sync with opm.h when updating
+Nuked-OPM; nuked_opm.py checks the size against the native library at
+import time.
+"""
+import ctypes
+
+import numpy as np
+
+
+class OPM_t(ctypes.Structure):
+    """OPM chip state structure (mirrors opm_t in opm.h)"""
+    _fields_ = [
+        ('cycles', ctypes.c_uint32),
+        ('ic', ctypes.c_uint8),
+        ('ic2', ctypes.c_uint8),
+        # IO
+        ('write_data', ctypes.c_uint8),
+        ('write_a', ctypes.c_uint8),
+        ('write_a_en', ctypes.c_uint8),
+        ('write_d', ctypes.c_uint8),
+        ('write_d_en', ctypes.c_uint8),
+        ('write_busy', ctypes.c_uint8),
+        ('write_busy_cnt', ctypes.c_uint8),
+        ('mode_address', ctypes.c_uint8),
+        ('io_ct1', ctypes.c_uint8),
+        ('io_ct2', ctypes.c_uint8),
+
+        # LFO
+        ('lfo_am_lock', ctypes.c_uint8),
+        ('lfo_pm_lock', ctypes.c_uint8),
+        ('lfo_counter1', ctypes.c_uint8),
+        ('lfo_counter1_of1', ctypes.c_uint8),
+        ('lfo_counter1_of2', ctypes.c_uint8),
+        ('lfo_counter2', ctypes.c_uint16),
+        ('lfo_counter2_load', ctypes.c_uint8),
+        ('lfo_counter2_of', ctypes.c_uint8),
+        ('lfo_counter2_of_lock', ctypes.c_uint8),
+        ('lfo_counter2_of_lock2', ctypes.c_uint8),
+        ('lfo_counter3_clock', ctypes.c_uint8),
+        ('lfo_counter3', ctypes.c_uint16),
+        ('lfo_counter3_step', ctypes.c_uint8),
+        ('lfo_frq_update', ctypes.c_uint8),
+        ('lfo_clock', ctypes.c_uint8),
+        ('lfo_clock_lock', ctypes.c_uint8),
+        ('lfo_clock_test', ctypes.c_uint8),
+        ('lfo_test', ctypes.c_uint8),
+        ('lfo_val', ctypes.c_uint32),
+        ('lfo_val_carry', ctypes.c_uint8),
+        ('lfo_out1', ctypes.c_uint32),
+        ('lfo_out2', ctypes.c_uint32),
+        ('lfo_out2_b', ctypes.c_uint32),
+        ('lfo_mult_carry', ctypes.c_uint8),
+        ('lfo_trig_sign', ctypes.c_uint8),
+        ('lfo_saw_sign', ctypes.c_uint8),
+        ('lfo_bit_counter', ctypes.c_uint8),
+
+        # Env Gen
+        ('eg_state', ctypes.c_uint8 * 32),
+        ('eg_level', ctypes.c_uint16 * 32),
+        ('eg_rate', ctypes.c_uint8 * 2),
+        ('eg_sl', ctypes.c_uint8 * 2),
+        ('eg_tl', ctypes.c_uint8 * 3),
+        ('eg_zr', ctypes.c_uint8 * 2),
+        ('eg_timershift_lock', ctypes.c_uint8),
+        ('eg_timer_lock', ctypes.c_uint8),
+        ('eg_inchi', ctypes.c_uint8),
+        ('eg_shift', ctypes.c_uint8),
+        ('eg_clock', ctypes.c_uint8),
+        ('eg_clockcnt', ctypes.c_uint8),
+        ('eg_clockquotinent', ctypes.c_uint8),
+        ('eg_inc', ctypes.c_uint8),
+        ('eg_ratemax', ctypes.c_uint8 * 2),
+        ('eg_instantattack', ctypes.c_uint8),
+        ('eg_inclinear', ctypes.c_uint8),
+        ('eg_incattack', ctypes.c_uint8),
+        ('eg_mute', ctypes.c_uint8),
+        ('eg_outtemp', ctypes.c_uint16 * 2),
+        ('eg_out', ctypes.c_uint16 * 2),
+        ('eg_am', ctypes.c_uint16),
+        ('eg_ams', ctypes.c_uint8 * 2),
+        ('eg_timercarry', ctypes.c_uint8),
+        ('eg_timer', ctypes.c_uint32),
+        ('eg_timer2', ctypes.c_uint32),
+        ('eg_timerbstop', ctypes.c_uint8),
+        ('eg_serial', ctypes.c_uint32),
+        ('eg_serial_bit', ctypes.c_uint8),
+        ('eg_test', ctypes.c_uint8),
+
+        # Phase Gen
+        ('pg_fnum', ctypes.c_uint16 * 32),
+        ('pg_kcode', ctypes.c_uint8 * 32),
+        ('pg_inc', ctypes.c_uint32 * 32),
+        ('pg_phase', ctypes.c_uint32 * 32),
+        ('pg_reset', ctypes.c_uint8 * 32),
+        ('pg_reset_latch', ctypes.c_uint8 * 32),
+        ('pg_serial', ctypes.c_uint32),
+
+        # Operator
+        ('op_phase_in', ctypes.c_uint16),
+        ('op_mod_in', ctypes.c_uint16),
+        ('op_phase', ctypes.c_uint16),
+        ('op_logsin', ctypes.c_uint16 * 3),
+        ('op_atten', ctypes.c_uint16),
+        ('op_exp', ctypes.c_uint16 * 2),
+        ('op_pow', ctypes.c_uint8 * 2),
+        ('op_sign', ctypes.c_uint32),
+        ('op_out', ctypes.c_int16 * 6),
+        ('op_connect', ctypes.c_uint32),
+        ('op_counter', ctypes.c_uint8),
+        ('op_fbupdate', ctypes.c_uint8),
+        ('op_fbshift', ctypes.c_uint8),
+        ('op_c1update', ctypes.c_uint8),
+        ('op_modtable', ctypes.c_uint8 * 5),
+        ('op_m1', (ctypes.c_int16 * 2) * 8),
+        ('op_c1', ctypes.c_int16 * 8),
+        ('op_mod', ctypes.c_int16 * 3),
+        ('op_fb', ctypes.c_int16 * 2),
+        ('op_mixl', ctypes.c_uint8),
+        ('op_mixr', ctypes.c_uint8),
+
+        # Mixer
+
+        ('mix', ctypes.c_int32 * 2),
+        ('mix2', ctypes.c_int32 * 2),
+        ('mix_op', ctypes.c_int32),
+        ('mix_serial', ctypes.c_uint32 * 2),
+        ('mix_bits', ctypes.c_uint32),
+        ('mix_top_bits_lock', ctypes.c_uint32),
+        ('mix_sign_lock', ctypes.c_uint8),
+        ('mix_sign_lock2', ctypes.c_uint8),
+        ('mix_exp_lock', ctypes.c_uint8),
+        ('mix_clamp_low', ctypes.c_uint8 * 2),
+        ('mix_clamp_high', ctypes.c_uint8 * 2),
+        ('mix_out_bit', ctypes.c_uint8),
+
+        # Output
+        ('smp_so', ctypes.c_uint8),
+        ('smp_sh1', ctypes.c_uint8),
+        ('smp_sh2', ctypes.c_uint8),
+
+        # Noise
+        ('noise_lfsr', ctypes.c_uint32),
+        ('noise_timer', ctypes.c_uint32),
+        ('noise_timer_of', ctypes.c_uint8),
+        ('noise_update', ctypes.c_uint8),
+        ('noise_temp', ctypes.c_uint8),
+
+        # Register set
+        ('mode_test', ctypes.c_uint8 * 8),
+        ('mode_kon_operator', ctypes.c_uint8 * 4),
+        ('mode_kon_channel', ctypes.c_uint8),
+
+        ('reg_address', ctypes.c_uint8),
+        ('reg_address_ready', ctypes.c_uint8),
+        ('reg_data', ctypes.c_uint8),
+        ('reg_data_ready', ctypes.c_uint8),
+
+        ('ch_rl', ctypes.c_uint8 * 8),
+        ('ch_fb', ctypes.c_uint8 * 8),
+        ('ch_connect', ctypes.c_uint8 * 8),
+        ('ch_kc', ctypes.c_uint8 * 8),
+        ('ch_kf', ctypes.c_uint8 * 8),
+        ('ch_pms', ctypes.c_uint8 * 8),
+        ('ch_ams', ctypes.c_uint8 * 8),
+
+        ('sl_dt1', ctypes.c_uint8 * 32),
+        ('sl_mul', ctypes.c_uint8 * 32),
+        ('sl_tl', ctypes.c_uint8 * 32),
+        ('sl_ks', ctypes.c_uint8 * 32),
+        ('sl_ar', ctypes.c_uint8 * 32),
+        ('sl_am_e', ctypes.c_uint8 * 32),
+        ('sl_d1r', ctypes.c_uint8 * 32),
+        ('sl_dt2', ctypes.c_uint8 * 32),
+        ('sl_d2r', ctypes.c_uint8 * 32),
+        ('sl_d1l', ctypes.c_uint8 * 32),
+        ('sl_rr', ctypes.c_uint8 * 32),
+
+        ('noise_en', ctypes.c_uint8),
+        ('noise_freq', ctypes.c_uint8),
+
+        # Timer
+        ('timer_a_reg', ctypes.c_uint16),
+        ('timer_b_reg', ctypes.c_uint8),
+        ('timer_a_temp', ctypes.c_uint8),
+        ('timer_a_do_reset', ctypes.c_uint8),
+        ('timer_a_do_load', ctypes.c_uint8),
+        ('timer_a_inc', ctypes.c_uint8),
+        ('timer_a_val', ctypes.c_uint16),
+        ('timer_a_of', ctypes.c_uint8),
+        ('timer_a_load', ctypes.c_uint8),
+        ('timer_a_status', ctypes.c_uint8),
+
+        ('timer_b_sub', ctypes.c_uint8),
+        ('timer_b_sub_of', ctypes.c_uint8),
+        ('timer_b_inc', ctypes.c_uint8),
+        ('timer_b_val', ctypes.c_uint16),
+        ('timer_b_of', ctypes.c_uint8),
+        ('timer_b_do_reset', ctypes.c_uint8),
+        ('timer_b_do_load', ctypes.c_uint8),
+        ('timer_b_temp', ctypes.c_uint8),
+        ('timer_b_status', ctypes.c_uint8),
+        ('timer_irq', ctypes.c_uint8),
+
+        ('lfo_freq_hi', ctypes.c_uint8),
+        ('lfo_freq_lo', ctypes.c_uint8),
+        ('lfo_pmd', ctypes.c_uint8),
+        ('lfo_amd', ctypes.c_uint8),
+        ('lfo_wave', ctypes.c_uint8),
+
+        ('timer_irqa', ctypes.c_uint8),
+        ('timer_irqb', ctypes.c_uint8),
+        ('timer_loada', ctypes.c_uint8),
+        ('timer_loadb', ctypes.c_uint8),
+        ('timer_reseta', ctypes.c_uint8),
+        ('timer_resetb', ctypes.c_uint8),
+        ('mode_csm', ctypes.c_uint8),
+
+        ('nc_active', ctypes.c_uint8),
+        ('nc_active_lock', ctypes.c_uint8),
+        ('nc_sign', ctypes.c_uint8),
+        ('nc_sign_lock', ctypes.c_uint8),
+        ('nc_sign_lock2', ctypes.c_uint8),
+        ('nc_bit', ctypes.c_uint8),
+        ('nc_out', ctypes.c_uint16),
+        ('op_mix', ctypes.c_int16),
+
+        ('kon_csm', ctypes.c_uint8),
+        ('kon_csm_lock', ctypes.c_uint8),
+        ('kon_do', ctypes.c_uint8),
+        ('kon_chanmatch', ctypes.c_uint8),
+        ('kon', ctypes.c_uint8 * 32),
+        ('kon2', ctypes.c_uint8 * 32),
+        ('mode_kon', ctypes.c_uint8 * 32),
+
+        # DAC
+        ('dac_osh1', ctypes.c_uint8),
+        ('dac_osh2', ctypes.c_uint8),
+        ('dac_bits', ctypes.c_uint16),
+        ('dac_output', ctypes.c_int32 * 2),
+    ]
+
+
+# numpy structured dtype with the same layout as OPM_t
+OPM_DTYPE = np.dtype(OPM_t)
+
+
+class OPM_Stream(ctypes.Structure):
+    """Register write scheduler state (mirrors opm_stream_t in opm_render.c)"""
+    _fields_ = [
+        ('cycle', ctypes.c_uint64),
+        ('wait', ctypes.c_uint32),
+        ('data_pending', ctypes.c_uint8),
+        ('data', ctypes.c_uint8),
+    ]
+
+
+# Number of FM channels
+NUM_CHANNELS = 8
+
+
+class OPM_Channels(ctypes.Structure):
+    """Per-channel capture state (mirrors opm_channels_t in opm_render.c)"""
+    _fields_ = [
+        ('sum', (ctypes.c_int32 * 2) * NUM_CHANNELS),
+        ('done', (ctypes.c_int32 * 2) * NUM_CHANNELS),
+        ('serial', (ctypes.c_int32 * 2) * NUM_CHANNELS),
+        ('output', (ctypes.c_int32 * 2) * NUM_CHANNELS),
+    ]
+
+
+# Register write at an absolute chip cycle (mirrors opm_event_t in opm_render.c)
+EVENT_DTYPE = np.dtype([
+    ('cycle', np.uint64),
+    ('address', np.uint8),
+    ('data', np.uint8),
+], align=True)
+
+
+def state_view(chip: OPM_t) -> np.ndarray:
+    """
+    Create a zero-copy numpy view of a chip state
+    
+    Args:
+        chip: OPM_t instance
+        
+    Returns:
+        0-d structured array sharing memory with chip; fields such as
+        view['eg_level'] are writable array views into the live state
+    """
+    return np.frombuffer(chip, dtype=OPM_DTYPE).reshape(())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Pitch tables: frequency <-> KC/KF conversion.
+
+A channel's pitch is set by KC (register 0x28+ch: octave in bits 6-4,
+note code in bits 3-0) and KF (register 0x30+ch: 1/64 key fraction in
+bits 7-2). The chip does not compute the frequency with a formula: it
+looks the key up in pg_freqtable (opm.c) and interpolates between
+entries, so equal temperament is only approximate. PitchTable replays
+that lookup for all 8192 KC/KF pairs once per master clock and answers
+conversions with vectorized searches in the result:
+
+    table = pitch_table(4_000_000)
+    kc, kf = table.from_hz([261.63, 440.0])     # arrays of register values
+    hz = table.to_hz(kc, kf)                    # what the chip will play
+    kc, kf = table.from_note(69 + bend)         # fractional MIDI notes
+
+    python pitch.py 440 --clock 3579545         # print KC/KF for a frequency
+"""
+import argparse
+import sys
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+# Master clock assumed when none is given
+DEFAULT_CLOCK = 4_000_000
+
+# Master clocks per native sample and bits of the phase accumulator: the
+# phase generator adds its increment once per sample and the sine table
+# wraps at 2**PHASE_BITS
+SAMPLE_CLOCKS = 64
+PHASE_BITS = 20
+
+# pg_freqtable from opm.c: (basefreq, approxtype, slope) per KC note code
+# (bits 3-0) and the top two KF bits, i.e. per 16 KF steps
+FREQ_TABLE = np.array([
+    (1299, 1, 19), (1318, 1, 19), (1337, 1, 19), (1356, 1, 20),
+    (1376, 1, 20), (1396, 1, 20), (1416, 1, 21), (1437, 1, 20),
+    (1458, 1, 21), (1479, 1, 21), (1501, 1, 22), (1523, 1, 22),
+    (0, 0, 16), (0, 0, 16), (0, 0, 16), (0, 0, 16),
+    (1545, 1, 22), (1567, 1, 22), (1590, 1, 23), (1613, 1, 23),
+    (1637, 1, 23), (1660, 1, 24), (1685, 1, 24), (1709, 1, 24),
+    (1734, 1, 25), (1759, 1, 25), (1785, 1, 26), (1811, 1, 26),
+    (0, 0, 16), (0, 0, 16), (0, 0, 16), (0, 0, 16),
+    (1837, 1, 26), (1864, 1, 27), (1891, 1, 27), (1918, 1, 28),
+    (1946, 1, 28), (1975, 1, 28), (2003, 1, 29), (2032, 1, 30),
+    (2062, 1, 30), (2092, 1, 30), (2122, 1, 31), (2153, 1, 31),
+    (0, 0, 16), (0, 0, 16), (0, 0, 16), (0, 0, 16),
+    (2185, 1, 31), (2216, 0, 31), (2249, 0, 31), (2281, 0, 31),
+    (2315, 0, 31), (2348, 0, 31), (2382, 0, 30), (2417, 0, 30),
+    (2452, 0, 30), (2488, 0, 30), (2524, 0, 30), (2561, 0, 30),
+    (0, 0, 16), (0, 0, 16), (0, 0, 16), (0, 0, 16),
+], dtype=np.int64)
+
+# KC/KF pairs: 8 octaves x 16 note codes x 64 key fractions
+NUM_CODES = 8 * 16 * 64
+
+# Reference pitch of MIDI note 69 (A4)
+A4_HZ = 440.0
+
+
+def _key_codes() -> np.ndarray:
+    """
+    Key code the chip uses for every (KC << 6 | KF >> 2) value
+
+    Follows OPM_CalcKCode without LFO or DT2: note codes 3, 7, 11 and 15
+    do not exist and play as the next code up (the highest clamps).
+    """
+    kcf = np.arange(NUM_CODES, dtype=np.int64)
+    kcode = kcf + np.where((kcf >> 6) & 3 == 3, 64, 0)
+    return np.where(kcode >= NUM_CODES, NUM_CODES - 65, kcode)
+
+
+def _fnum(kcode: np.ndarray) -> np.ndarray:
+    """OPM_KCToFNum for an array of key codes"""
+    base, approx, slope = FREQ_TABLE[(kcode >> 4) & 63].T
+    low = kcode & 15
+    bit = [(low >> i) & 1 for i in range(4)]
+    # approxtype 1: sum of slope >> (3 - i) for each set bit i
+    linear = sum(bit[i] * (slope >> (3 - i)) for i in range(4))
+    # approxtype 0: the chip's corrected interpolation for the top octave
+    odd = slope | 1
+    corrected = (bit[0] * ((odd >> 3) + 2) + bit[1] * 8 + bit[2] * (odd >> 1)
+                 + bit[3] * (odd + 1) + (bit[2] & bit[3] & (1 - (slope & 1))) * 4)
+    return base + (np.where(approx == 1, linear, corrected) >> 1)
+
+
+@lru_cache(maxsize=None)
+def phase_increments() -> np.ndarray:
+    """
+    Phase increment per native sample for every KC/KF pair
+
+    Returns:
+        Read-only int64 array indexed by (KC << 6 | KF >> 2), for an
+        operator with MUL 1 and no detune
+    """
+    kcode = _key_codes()
+    block = kcode >> 10
+    increments = ((_fnum(kcode) << block) >> 2) & 0x1FFFF
+    increments.flags.writeable = False
+    return increments
+
+
+def note_hz(note, a4: float = A4_HZ) -> np.ndarray:
+    """Equal-tempered frequency of (fractional) MIDI notes"""
+    return a4 * 2.0 ** ((np.asarray(note, dtype=np.float64) - 69) / 12)
+
+
+class PitchTable:
+    """
+    KC/KF <-> Hz for one master clock
+
+    Attributes:
+        clock: Master clock in Hz
+        hz: Frequency of every KC/KF pair, indexed by (KC << 6 | KF >> 2)
+    """
+
+    def __init__(self, clock: float = DEFAULT_CLOCK):
+        self.clock = clock
+        self.hz = phase_increments() * (clock / SAMPLE_CLOCKS / 2 ** PHASE_BITS)
+        self.hz.flags.writeable = False
+        # Real note codes, in pitch order (a KC octave runs from C# up to
+        # the next C, and no step up lowers the increment; low octaves
+        # repeat values, and a search then picks the lowest code)
+        codes = np.arange(NUM_CODES)
+        self._codes = codes[(codes >> 6) & 3 != 3]
+        self._log2 = np.log2(self.hz[self._codes])
+        # Midpoints between neighbours, so that a search finds the nearest
+        self._bounds = (self._log2[1:] + self._log2[:-1]) / 2
+
+    def to_hz(self, kc, kf=0) -> np.ndarray:
+        """
+        Frequency the chip plays for KC/KF register values
+
+        Args:
+            kc: KC register values (0x28+ch)
+            kf: KF register values (0x30+ch, fraction in bits 7-2)
+        """
+        kc = np.asarray(kc, dtype=np.int64) & 0x7F
+        kf = np.asarray(kf, dtype=np.int64) & 0xFC
+        return self.hz[(kc << 6) | (kf >> 2)]
+
+    def _from_log2(self, log2_hz: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        codes = self._codes[np.searchsorted(self._bounds, log2_hz)]
+        return (codes >> 6).astype(np.uint8), ((codes & 63) << 2).astype(np.uint8)
+
+    def from_hz(self, hz) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest KC/KF register values for frequencies
+
+        Frequencies outside the chip's range clamp to its lowest or highest
+        pitch.
+
+        Returns:
+            (KC, KF) uint8 arrays of the input's shape
+        """
+        with np.errstate(divide='ignore'):
+            return self._from_log2(np.log2(np.asarray(hz, dtype=np.float64)))
+
+    def from_note(self, note, a4: float = A4_HZ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest KC/KF register values for (fractional) MIDI notes
+
+        Pitch bends are fractional notes, e.g. note + bend in semitones.
+        """
+        note = np.asarray(note, dtype=np.float64)
+        return self._from_log2(np.log2(a4) + (note - 69) / 12)
+
+
+@lru_cache(maxsize=8)
+def pitch_table(clock: float = DEFAULT_CLOCK) -> PitchTable:
+    """Shared PitchTable for a master clock"""
+    return PitchTable(clock)
+
+
+def hz_to_kc_kf(hz, clock: float = DEFAULT_CLOCK) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest (KC, KF) register values for frequencies at a master clock"""
+    return pitch_table(clock).from_hz(hz)
+
+
+def kc_kf_to_hz(kc, kf=0, clock: float = DEFAULT_CLOCK) -> np.ndarray:
+    """Frequency the chip plays for KC/KF register values at a master clock"""
+    return pitch_table(clock).to_hz(kc, kf)
+
+
+def note_to_kc_kf(note, clock: float = DEFAULT_CLOCK) -> Tuple[int, int]:
+    """(KC, KF) register values for one MIDI note"""
+    kc, kf = pitch_table(clock).from_note(note)
+    return int(kc), int(kf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a frequency to YM2151 KC/KF")
+    parser.add_argument("hz", type=float, nargs="+", help="Frequencies in Hz")
+    parser.add_argument("--clock", type=float, default=DEFAULT_CLOCK,
+                        help=f"Master clock in Hz (default: {DEFAULT_CLOCK})")
+    args = parser.parse_args()
+
+    table = pitch_table(args.clock)
+    kc, kf = table.from_hz(args.hz)
+    for hz, code, fraction, actual in zip(args.hz, kc, kf, table.to_hz(kc, kf)):
+        cents = 1200 * np.log2(actual / hz)
+        print(f"{hz:10.3f} Hz -> KC 0x{code:02X} KF 0x{fraction:02X} "
+              f"({actual:.3f} Hz, {cents:+.1f} cents)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Register-write capture for NukedOPM sessions.
+
+A WriteRecorder attached to a chip logs every register write the chip is
+given (write_register(), write_registers(), schedule() and everything
+built on them, such as voice banks and the MIDI and timer drivers) with
+its chip time. The log is a preallocated structured numpy array that
+grows by doubling, so recording costs a few array assignments per call
+and can stay on during real-time playback. The log exports as a VGM file
+that replays through the offline VGM renderer:
+
+    recorder = WriteRecorder().attach(chip)
+    ...                                    # interactive session
+    recorder.save_vgm("session.vgz")       # python vgm.py session.vgz
+"""
+from typing import Optional
+
+import numpy as np
+
+from nuked_opm import CLOCKS_PER_SAMPLE, NukedOPM
+from vgm import VGM_EVENT_DTYPE, VGM_SAMPLE_RATE, encode_vgm, write_vgm
+
+# Master clock assumed when none is given
+DEFAULT_CLOCK = 4_000_000
+
+# Writes the log has room for before it first grows
+DEFAULT_CAPACITY = 65536
+
+# One logged write: chip cycles since recording started
+RECORD_DTYPE = np.dtype([
+    ('cycle', np.int64),
+    ('address', np.uint8),
+    ('data', np.uint8),
+])
+
+
+class WriteRecorder:
+    """
+    Log of register writes with their chip time
+
+    Times are chip cycles (OPM_Clock calls) since the recorder was
+    attached. They stay continuous when the chip is reset or restored:
+    the timeline simply goes on from where it was. Writes are logged when
+    the chip is given them, so scheduled writes dropped by a later reset
+    are still in the log.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        Args:
+            capacity: Writes to preallocate room for
+        """
+        self._log = np.empty(max(capacity, 1), dtype=RECORD_DTYPE)
+        self._count = 0
+        self._base = 0   # chip cycle at which recording time is 0
+        self.chip: Optional[NukedOPM] = None
+
+    def attach(self, chip: NukedOPM) -> 'WriteRecorder':
+        """Start recording a chip's writes, at time 0 from its current cycle"""
+        if chip.recorder is not None and chip.recorder is not self:
+            raise ValueError("The chip already has a recorder attached")
+        self.detach()
+        # A log that already has writes continues after the last one
+        self._base = chip.cycle - self.end_cycle
+        chip.recorder = self
+        self.chip = chip
+        return self
+
+    def detach(self):
+        """Stop recording; the log is kept"""
+        if self.chip is not None:
+            self.chip.recorder = None
+            self.chip = None
+
+    def _reserve(self, count: int) -> int:
+        """Make room for count more writes; returns the first free index"""
+        start = self._count
+        if start + count > len(self._log):
+            size = len(self._log)
+            while size < start + count:
+                size *= 2
+            log = np.empty(size, dtype=RECORD_DTYPE)
+            log[:start] = self._log[:start]
+            self._log = log
+        self._count = start + count
+        return start
+
+    def record_pairs(self, cycle: int, pairs: np.ndarray):
+        """Log (address, data) pairs written at a chip cycle (uint8 array (n, 2))"""
+        start = self._reserve(len(pairs))
+        log = self._log[start:self._count]
+        log['cycle'] = cycle - self._base
+        log['address'] = pairs[:, 0]
+        log['data'] = pairs[:, 1]
+
+    def record(self, events: np.ndarray):
+        """Log scheduled writes (EVENT_DTYPE with absolute chip cycles)"""
+        start = self._reserve(len(events))
+        log = self._log[start:self._count]
+        log['cycle'] = events['cycle'].astype(np.int64) - self._base
+        log['address'] = events['address']
+        log['data'] = events['data']
+
+    def rebase(self, old_cycle: int, new_cycle: int):
+        """Keep the timeline continuous when the chip's cycle counter jumps"""
+        self._base += new_cycle - old_cycle
+
+    @property
+    def end_cycle(self) -> int:
+        """Recording time now (the attached chip's time, else the last write)"""
+        if self.chip is not None:
+            return self.chip.cycle - self._base
+        return int(self.writes['cycle'].max()) if self._count else 0
+
+    @property
+    def writes(self) -> np.ndarray:
+        """The log in recording order (a view; RECORD_DTYPE)"""
+        return self._log[:self._count]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self):
+        """Drop the log and restart the time at the chip's current cycle"""
+        self._count = 0
+        if self.chip is not None:
+            self._base = self.chip.cycle
+
+    def events(self) -> np.ndarray:
+        """
+        The log in time order as (cycle, address, data) rows
+
+        Suitable for NukedOPM.schedule() on another chip to replay the
+        session exactly.
+        """
+        writes = self.writes[np.argsort(self.writes['cycle'], kind='stable')]
+        events = np.empty((len(writes), 3), dtype=np.int64)
+        events[:, 0] = writes['cycle']
+        events[:, 1] = writes['address']
+        events[:, 2] = writes['data']
+        return events
+
+    def vgm_events(self, clock: float = DEFAULT_CLOCK) -> np.ndarray:
+        """The log in time order as VGM_EVENT_DTYPE (44.1 kHz sample times)"""
+        writes = self.writes[np.argsort(self.writes['cycle'], kind='stable')]
+        events = np.empty(len(writes), dtype=VGM_EVENT_DTYPE)
+        events['time'] = self._to_vgm(writes['cycle'], clock)
+        events['address'] = writes['address']
+        events['data'] = writes['data']
+        return events
+
+    @staticmethod
+    def _to_vgm(cycles, clock: float):
+        """Chip cycles to VGM samples, rounded to the nearest"""
+        # One cycle is 64 / CLOCKS_PER_SAMPLE master clocks
+        scale = VGM_SAMPLE_RATE * 64 / (CLOCKS_PER_SAMPLE * clock)
+        return np.rint(np.asarray(cycles, dtype=np.float64) * scale).astype(np.int64)
+
+    def to_vgm(self, clock: float = DEFAULT_CLOCK) -> bytes:
+        """
+        Encode the log as a VGM file
+
+        Args:
+            clock: Master clock of the session in Hz (the chip itself has
+                no notion of it)
+
+        Returns:
+            VGM file contents lasting until end_cycle
+        """
+        return encode_vgm(self.vgm_events(clock), int(clock), self._vgm_length(clock))
+
+    def _vgm_length(self, clock: float) -> int:
+        return int(self._to_vgm(max(self.end_cycle, 0), clock))
+
+    def save_vgm(self, path: str, clock: float = DEFAULT_CLOCK):
+        """Write the log as a .vgm file (gzip-compressed for .vgz)"""
+        write_vgm(path, self.vgm_events(clock), int(clock), self._vgm_length(clock))
@@ -0,0 +1,258 @@
+"""
+Content-addressed cache of rendered jobs.
+
+A job's key is a SHA-256 of everything that determines its output: the
+chip state it starts from, its register writes and length, the master
+clock, the output rate and resampler settings, and the emulator build
+(nuked_opm.library_digest()). The PCM is stored as a raw file named
+after the key, so a hit is a dictionary lookup and a numpy.memmap of the
+file, with nothing to decode or copy. The directory is kept under a size
+limit by evicting the least recently used entries; recency is the file
+modification time, which hits refresh, so it survives restarts and is
+shared by processes using the same directory.
+
+    cache = RenderCache("cache/", max_bytes=256 * 1024 * 1024)
+    pcm = cache.render(RenderJob(num_samples, registers, events))
+    pcm = cache.render(job, sample_rate=48000)    # resampled output
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from batch_render import RenderJob, render_job_from
+from nuked_opm import ChipPool, library_digest
+from resampler import DEFAULT_BETA, DEFAULT_CUTOFF, DEFAULT_PHASES, DEFAULT_TAPS, Resampler
+
+# Master clock assumed when none is given
+DEFAULT_CLOCK = 4_000_000
+
+# Directory size limit used when none is given
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Changes whenever the key layout or file format changes
+CACHE_FORMAT = b'ym2151-render-cache/1'
+
+# File suffix per stored dtype: native int32 output, resampled float32
+SUFFIXES = {'.i32': np.dtype('<i4'), '.f32': np.dtype('<f4')}
+
+
+class ResamplerSettings:
+    """Resampler parameters that affect the output (see Resampler)"""
+
+    def __init__(self, taps: int = DEFAULT_TAPS, phases: int = DEFAULT_PHASES,
+                 cutoff: float = DEFAULT_CUTOFF, beta: float = DEFAULT_BETA):
+        self.taps = taps
+        self.phases = phases
+        self.cutoff = cutoff
+        self.beta = beta
+
+    def key(self) -> str:
+        return f"{self.taps},{self.phases},{self.cutoff!r},{self.beta!r}"
+
+
+def _suffix(dtype) -> str:
+    """File suffix for a PCM dtype"""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    for suffix, stored in SUFFIXES.items():
+        if stored == dtype:
+            return suffix
+    raise ValueError(f"Unsupported PCM dtype: {dtype}")
+
+
+def render_key(job: RenderJob, clock: float = DEFAULT_CLOCK, sample_rate: Optional[float] = None,
+               resampler: Optional[ResamplerSettings] = None,
+               snapshot: Optional[bytes] = None) -> str:
+    """
+    Cache key of a render
+
+    Args:
+        job: Job to render
+        clock: Master clock in Hz
+        sample_rate: Output rate in Hz (None for the native rate)
+        resampler: Resampler settings (ignored at the native rate)
+        snapshot: Chip state to start from (None for a reset chip)
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256(CACHE_FORMAT)
+    digest.update(library_digest().encode())
+    digest.update(b'reset' if snapshot is None else hashlib.sha256(snapshot).digest())
+    registers = np.asarray(job.registers, dtype=np.int64).reshape(-1, 2)
+    events = np.asarray(job.events, dtype=np.int64).reshape(-1, 3)
+    digest.update(f"{job.num_samples};{len(registers)};{len(events)};{clock!r};".encode())
+    digest.update(registers.tobytes())
+    digest.update(events.tobytes())
+    if sample_rate is not None:
+        settings = resampler or ResamplerSettings()
+        digest.update(f"{sample_rate!r};{settings.key()}".encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Size-bounded on-disk LRU cache of rendered PCM
+
+    Thread-safe. Several processes may share a directory: entries are
+    written to a temporary file and renamed into place, and each process
+    picks up entries written by the others on lookup.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory: Cache directory (created if missing)
+            max_bytes: Size limit of the stored PCM
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pool = ChipPool(max_idle=1)
+        # key -> (path, size), least recently used first
+        self._entries: 'OrderedDict[str, Tuple[str, int]]' = OrderedDict()
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            key, suffix = os.path.splitext(name)
+            if suffix in SUFFIXES:
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, key + suffix, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = (os.path.join(directory, name), size)
+            self.size += size
+
+    def _lookup(self, name: str) -> Optional[str]:
+        """Path of an entry, refreshing its recency; None if absent"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                path = os.path.join(self.directory, name)
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    return None
+                entry = self._entries[name] = (path, size)
+                self.size += size
+            self._entries.move_to_end(name)
+        try:
+            os.utime(entry[0])
+        except FileNotFoundError:
+            with self._lock:
+                if self._entries.pop(name, None) is not None:
+                    self.size -= entry[1]
+            return None
+        return entry[0]
+
+    def get(self, key: str, dtype=np.int32) -> Optional[np.ndarray]:
+        """
+        Look up a render
+
+        Returns:
+            Read-only numpy.memmap of shape (n, 2), or None on a miss
+        """
+        suffix = _suffix(dtype)
+        path = self._lookup(key + suffix)
+        if path is None:
+            return None
+        return np.memmap(path, dtype=SUFFIXES[suffix], mode='r').reshape(-1, 2)
+
+    def put(self, key: str, pcm: np.ndarray):
+        """
+        Store a render (int32 or float32, shape (n, 2))
+
+        Renders larger than max_bytes and empty renders are not stored.
+        """
+        suffix = _suffix(pcm.dtype)
+        data = np.ascontiguousarray(pcm, dtype=SUFFIXES[suffix])
+        if not 0 < data.nbytes <= self.max_bytes:
+            return
+        name = key + suffix
+        path = os.path.join(self.directory, name)
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data.tofile(f)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[name] = (path, data.nbytes)
+            self.size += data.nbytes
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the size limit holds"""
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, (path, size) = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                # Already gone, or still mapped on a platform that forbids
+                # removing mapped files; it no longer counts either way
+                pass
+
+    def render(self, job: RenderJob, clock: float = DEFAULT_CLOCK,
+               sample_rate: Optional[float] = None,
+               resampler: Optional[ResamplerSettings] = None,
+               snapshot: Optional[bytes] = None) -> np.ndarray:
+        """
+        Render a job, or return the cached render
+
+        Args:
+            job: Job to render
+            clock: Master clock in Hz
+            sample_rate: Output rate in Hz (None for int32 output at the
+                native rate; otherwise float32 output)
+            resampler: Resampler settings for sample_rate
+            snapshot: Chip state to start from (None for a reset chip)
+
+        Returns:
+            (n, 2) PCM; a read-only memmap on a hit
+        """
+        key = render_key(job, clock, sample_rate, resampler, snapshot)
+        dtype = np.int32 if sample_rate is None else np.float32
+        cached = self.get(key, dtype)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        pcm = np.empty((job.num_samples, 2), dtype=np.int32)
+        # Pooled chips come back reset
+        with self._pool.chip() as chip:
+            if snapshot is not None:
+                chip.restore(snapshot)
+            render_job_from(chip, job, pcm)
+        if sample_rate is not None:
+            settings = resampler or ResamplerSettings()
+            pcm = Resampler(clock / 64, sample_rate, taps=settings.taps, phases=settings.phases,
+                            cutoff=settings.cutoff, beta=settings.beta).process(pcm)
+        self.put(key, pcm)
+        return pcm
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            while self._entries:
+                _, (path, _) = self._entries.popitem()
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,146 @@
+"""
+Band-limited sample rate conversion from the chip's native rate.
+
+The YM2151 produces samples at clock / 64 (62.5 kHz at 4 MHz, about
+55.93 kHz at 3.579545 MHz). Resampler converts blocks of that output to a
+device rate with a Kaiser-windowed sinc filter evaluated as a polyphase
+table. All work is vectorized with numpy, and the filter history and
+fractional read position carry across blocks so it can be used while
+streaming.
+"""
+from fractions import Fraction
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Filter defaults: taps per output sample, table phases, Kaiser beta, and
+# the cutoff as a fraction of the lower Nyquist frequency.
+DEFAULT_TAPS = 64
+DEFAULT_PHASES = 512
+DEFAULT_BETA = 9.0
+DEFAULT_CUTOFF = 0.88
+
+
+def design_polyphase(taps: int, phases: int, cutoff: float, beta: float) -> np.ndarray:
+    """
+    Build the polyphase coefficient table
+
+    Args:
+        taps: Filter length in input samples
+        phases: Number of fractional positions in the table
+        cutoff: Cutoff relative to the input Nyquist frequency (0-1]
+        beta: Kaiser window beta
+
+    Returns:
+        float64 array of shape (phases + 1, taps); row p holds the taps for
+        an output position p / phases of an input sample past the centre
+    """
+    half = taps // 2
+    frac = np.arange(phases + 1)[:, None] / phases
+    # Distance from the output position to each input sample
+    offset = frac - (np.arange(taps)[None, :] - half + 1)
+    window = np.i0(beta * np.sqrt(np.clip(1.0 - (offset / half) ** 2, 0.0, None))) / np.i0(beta)
+    table = cutoff * np.sinc(cutoff * offset) * window
+    # Unity DC gain for every phase
+    table /= table.sum(axis=1, keepdims=True)
+    return table
+
+
+class Resampler:
+    """Streaming polyphase FIR resampler for multi-channel blocks"""
+
+    def __init__(self, input_rate: float, output_rate: float, channels: int = 2,
+                 taps: int = DEFAULT_TAPS, phases: int = DEFAULT_PHASES,
+                 cutoff: float = DEFAULT_CUTOFF, beta: float = DEFAULT_BETA):
+        """
+        Create a resampler
+
+        Args:
+            input_rate: Input sample rate in Hz (may be fractional)
+            output_rate: Output sample rate in Hz
+            channels: Number of channels per frame
+            taps: Filter length in input samples (even)
+            phases: Fractional positions in the coefficient table
+            cutoff: Passband edge as a fraction of the lower Nyquist rate
+            beta: Kaiser window beta (stopband attenuation)
+        """
+        if taps % 2:
+            raise ValueError("taps must be even")
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self.taps = taps
+        self.phases = phases
+
+        # Exact step between output samples in input samples: step_num / step_den
+        step = Fraction(input_rate) / Fraction(output_rate)
+        self._step_num = step.numerator
+        self._step_den = step.denominator
+
+        # When the ratio has few distinct output positions (e.g. 62.5 kHz to
+        # 48 kHz has 96), use one exact table row per position; otherwise
+        # interpolate between neighbouring rows of a finer table.
+        band = min(1.0, float(Fraction(output_rate) / Fraction(input_rate)))
+        self._exact = self._step_den <= phases
+        table_phases = self._step_den if self._exact else phases
+        self._table = design_polyphase(taps, table_phases, cutoff * band, beta).astype(np.float32)
+        self.reset()
+
+    @property
+    def ratio(self) -> float:
+        """Output samples per input sample"""
+        return self._step_den / self._step_num
+
+    def reset(self):
+        """Clear the filter history"""
+        # Zero history so that the first output sample is centred on input 0.
+        # Stored channel-major so each tap window is contiguous.
+        self._buffer = np.zeros((self.channels, self.taps // 2 - 1), dtype=np.float32)
+        # Position of the next output sample in the buffer, times _step_den
+        self._pos = (self.taps // 2 - 1) * self._step_den
+
+    def output_length(self, num_input: int) -> int:
+        """Number of output samples the next process() call will return"""
+        available = self._buffer.shape[1] + num_input - self.taps // 2
+        remaining = available * self._step_den - self._pos
+        if remaining <= 0:
+            return 0
+        return -(-remaining // self._step_num)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Resample a block
+
+        Args:
+            block: Input array of shape (n, channels)
+
+        Returns:
+            float32 array of shape (m, channels); m varies by block so that
+            the total output tracks the rate ratio exactly
+        """
+        num_out = self.output_length(len(block))
+        buffer = np.concatenate((self._buffer, np.asarray(block, dtype=np.float32).T), axis=1)
+        if num_out == 0:
+            self._buffer = buffer
+            return np.empty((0, self.channels), dtype=np.float32)
+
+        pos = self._pos + np.arange(num_out, dtype=np.int64) * self._step_num
+        index = pos // self._step_den
+        if self._exact:
+            coeffs = self._table[pos % self._step_den]
+        else:
+            phase = (pos % self._step_den) * (self.phases / self._step_den)
+            row = np.minimum(phase.astype(np.int64), self.phases - 1)
+            weight = (phase - row).astype(np.float32)[:, None]
+            coeffs = self._table[row] * (1.0 - weight) + self._table[row + 1] * weight
+
+        # windows[c, n] holds the taps input samples around output n
+        windows = sliding_window_view(buffer, self.taps, axis=1)[:, index - (self.taps // 2 - 1)]
+        result = np.einsum('nk,cnk->nc', coeffs, windows)
+
+        # Keep only the history needed by the next output sample
+        next_pos = self._pos + num_out * self._step_num
+        drop = next_pos // self._step_den - (self.taps // 2 - 1)
+        self._buffer = buffer[:, drop:]
+        self._pos = next_pos - drop * self._step_den
+        return result
@@ -0,0 +1,81 @@
+"""
+Single-producer / single-consumer ring buffer for streaming audio.
+
+The producer (render thread) and the consumer (audio callback) each own one
+position counter and only read the other's, so no lock is needed: in
+CPython an attribute assignment is atomic, and a frame becomes visible to
+the consumer only after its data has been copied in.
+"""
+import numpy as np
+
+
+class RingBuffer:
+    """Preallocated ring buffer of multi-channel float32 frames"""
+
+    def __init__(self, capacity: int, channels: int = 2):
+        """
+        Create a ring buffer
+
+        Args:
+            capacity: Maximum number of frames held
+            channels: Number of channels per frame
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.channels = channels
+        self._data = np.zeros((capacity, channels), dtype=np.float32)
+        # Total frames written / read since creation; only the producer
+        # updates _write_pos and only the consumer updates _read_pos.
+        self._write_pos = 0
+        self._read_pos = 0
+
+    @property
+    def available(self) -> int:
+        """Number of frames ready to be read"""
+        return self._write_pos - self._read_pos
+
+    @property
+    def free(self) -> int:
+        """Number of frames that can be written without overwriting"""
+        return self.capacity - self.available
+
+    def write(self, frames: np.ndarray) -> int:
+        """
+        Append frames (producer side)
+
+        Args:
+            frames: Array of shape (n, channels)
+
+        Returns:
+            Number of frames written (less than n when the buffer is full)
+        """
+        count = min(len(frames), self.free)
+        if count == 0:
+            return 0
+        start = self._write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = frames[:first]
+        self._data[:count - first] = frames[first:count]
+        self._write_pos += count
+        return count
+
+    def read_into(self, out: np.ndarray) -> int:
+        """
+        Copy frames into out (consumer side)
+
+        Args:
+            out: Array of shape (n, channels) to fill
+
+        Returns:
+            Number of frames copied; the rest of out is left untouched
+        """
+        count = min(len(out), self.available)
+        if count == 0:
+            return 0
+        start = self._read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:count] = self._data[:count - first]
+        self._read_pos += count
+        return count
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Headless render of a register script to raw PCM.
+
+This is the Python side of the cross-language comparison run by
+build_and_run.py --bench. Every front end reads the same script format
+and writes the same output format, so the results can be compared
+bit for bit.
+
+Script format (text, one write per line, '#' starts a comment):
+
+    <sample> <address> <data>
+
+sample is the native sample (clock / 64) at which the write is issued,
+in decimal; address and data are hexadecimal. Writes are applied in file
+order at their scheduled clock with the chip's write timing.
+
+Output: interleaved stereo little-endian int32 at the native rate, as
+returned by OPM_Clock. The render time (excluding startup and script
+parsing) is printed as "elapsed: <seconds>".
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from nuked_opm import CLOCKS_PER_SAMPLE, NukedOPM
+
+# Native samples rendered per block
+RENDER_BLOCK = 8192
+
+
+def load_script(path: str) -> np.ndarray:
+    """
+    Read a register script
+
+    Returns:
+        int64 array of shape (n, 3) with (cycle, address, data) rows
+
+    Raises:
+        ValueError: If a line is malformed
+    """
+    rows = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                sample, address, data = line.split()
+                rows.append((int(sample) * CLOCKS_PER_SAMPLE, int(address, 16), int(data, 16)))
+            except ValueError:
+                raise ValueError(f"{path}:{number}: expected '<sample> <address> <data>'")
+    return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+
+def render_script(events: np.ndarray, num_samples: int, out) -> float:
+    """
+    Render a script into a binary file
+
+    Args:
+        events: (cycle, address, data) rows from load_script()
+        num_samples: Native samples to render
+        out: Binary file object
+
+    Returns:
+        Render time in seconds
+    """
+    chip = NukedOPM()
+    buffer = np.empty((RENDER_BLOCK, 2), dtype=np.int32)
+    start = time.perf_counter()
+    chip.schedule(events)
+    remaining = num_samples
+    while remaining:
+        count = min(remaining, RENDER_BLOCK)
+        block = chip.render(count, out=buffer[:count])
+        out.write(block.astype('<i4', copy=False).tobytes())
+        remaining -= count
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a YM2151 register script to raw PCM")
+    parser.add_argument("script", help="Register script")
+    parser.add_argument("output", help="Output file (raw stereo int32 little-endian)")
+    parser.add_argument("samples", type=int, help="Native samples to render")
+    args = parser.parse_args()
+
+    try:
+        events = load_script(args.script)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    with open(args.output, "wb") as out:
+        elapsed = render_script(events, args.samples, out)
+    print(f"elapsed: {elapsed:.6f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""
+Streaming real-time playback for the YM2151 emulator.
+
+A producer thread renders fixed-size blocks into a preallocated ring
+buffer, and the sounddevice callback only copies frames out of it. Time
+to first sound depends on the buffer depth, not on the song length, and
+memory use stays bounded. For live input the ring buffer can be left out,
+and each block is rendered in the callback that plays it.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # Missing package or PortAudio library: sources still work for
+    # offline rendering, only StreamingPlayer.start() needs a device
+    sd = None
+
+from nuked_opm import NukedOPM
+from resampler import Resampler
+from ring_buffer import RingBuffer
+
+# Scale from chip output (approximately 16-bit range) to float [-1.0, 1.0]
+OUTPUT_SCALE = 1.0 / 32768.0
+
+
+class LatencyStats:
+    """Event latencies in seconds"""
+
+    def __init__(self):
+        self.values: List[float] = []
+
+    def add(self, seconds: float):
+        self.values.append(seconds)
+
+    @property
+    def max(self) -> float:
+        return max(self.values, default=0.0)
+
+    @property
+    def mean(self) -> float:
+        return sum(self.values) / len(self.values) if self.values else 0.0
+
+
+def native_source(render_native: Callable[[int], np.ndarray], total_frames: Optional[int] = None,
+                  resampler: Optional[Resampler] = None) -> Callable[[int], np.ndarray]:
+    """
+    Create a block source from a native-rate int32 renderer
+
+    Args:
+        render_native: Function returning up to n int32 stereo frames at
+            the chip's native rate (fewer at the end of the stream)
+        total_frames: Optional length (in output frames) after which the
+            source ends
+        resampler: Optional Resampler from the chip's native rate to the
+            output rate; without it frames are at the native rate
+
+    Returns:
+        Function taking a frame count and returning float32 stereo frames
+    """
+    pending = np.empty((0, 2), dtype=np.float32)
+    remaining = total_frames
+
+    def to_float(native: np.ndarray) -> np.ndarray:
+        block = native.astype(np.float32)
+        block *= OUTPUT_SCALE
+        np.clip(block, -1.0, 1.0, out=block)
+        return block
+
+    def render_block(num_frames: int) -> np.ndarray:
+        nonlocal pending, remaining
+        if remaining is not None:
+            num_frames = min(num_frames, remaining)
+            remaining -= num_frames
+        if resampler is None:
+            return to_float(render_native(num_frames))
+
+        # The resampler returns a varying number of frames per call, so keep
+        # the surplus for the next block.
+        while len(pending) < num_frames:
+            native = render_native(int((num_frames - len(pending)) / resampler.ratio) + 1)
+            if not len(native):
+                break
+            pending = np.concatenate((pending, resampler.process(to_float(native))))
+        block, pending = pending[:num_frames], pending[num_frames:]
+        return block
+
+    return render_block
+
+
+def chip_source(chip: NukedOPM, total_frames: Optional[int] = None,
+                resampler: Optional[Resampler] = None) -> Callable[[int], np.ndarray]:
+    """
+    Create a block source that renders a chip
+
+    Args:
+        chip: NukedOPM instance
+        total_frames: Optional length (in output frames) after which the
+            source ends
+        resampler: Optional Resampler from the chip's native rate to the
+            output rate; without it frames are at the native rate
+
+    Returns:
+        Function taking a frame count and returning float32 stereo frames
+    """
+    buffer = None
+
+    def render_native(num_frames: int) -> np.ndarray:
+        nonlocal buffer
+        if buffer is None or len(buffer) != num_frames:
+            buffer = np.empty((num_frames, 2), dtype=np.int32)
+        return chip.render(num_frames, out=buffer)
+
+    return native_source(render_native, total_frames, resampler)
+
+
+class StreamingPlayer:
+    """Real-time player fed by a render thread through a ring buffer"""
+
+    def __init__(self, render_block: Callable[[int], Optional[np.ndarray]],
+                 sample_rate: int, block_size: int = 1024, buffer_blocks: int = 8,
+                 device=None):
+        """
+        Create a player
+
+        Args:
+            render_block: Function returning up to n float32 stereo frames,
+                or None / fewer frames at the end of the stream
+            sample_rate: Output sample rate in Hz
+            block_size: Frames per rendered block and per audio callback
+            buffer_blocks: Ring buffer depth in blocks (latency vs. safety);
+                0 renders every block in the audio callback that plays it
+            device: Optional sounddevice output device
+        """
+        self.render_block = render_block
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.buffer_blocks = buffer_blocks
+        self.device = device
+        self.ring = RingBuffer(block_size * buffer_blocks, channels=2) if buffer_blocks else None
+
+        # Number of callbacks that could not be filled completely
+        self.underruns = 0
+        # Frames played / rendered so far
+        self.frames_played = 0
+        self.frames_rendered = 0
+        # Time from each mark()ed event to the callback that played it
+        self.event_latency = LatencyStats()
+        self._marks: Deque[Tuple[int, float]] = deque()
+
+        self._stream = None
+        self._producer = None
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._source_done = False
+        self._error: Optional[BaseException] = None
+
+    @property
+    def latency(self) -> float:
+        """Ring buffer depth in seconds"""
+        return self.ring.capacity / self.sample_rate if self.ring is not None else 0.0
+
+    def _produce(self):
+        """Render thread: keep the ring buffer topped up"""
+        try:
+            self._fill()
+        except BaseException as e:
+            # Reported by prefill() / wait(); ending the source lets the
+            # callback drain what was rendered and stop
+            self._error = e
+            self._source_done = True
+            self._finished.set()
+
+    def _fill(self):
+        idle_sleep = self.block_size / self.sample_rate / 4
+        while not self._stop.is_set():
+            if self.ring.free < self.block_size:
+                time.sleep(idle_sleep)
+                continue
+            block = self.render_block(self.block_size)
+            if block is not None and len(block):
+                self.ring.write(block)
+                self.frames_rendered += len(block)
+            if block is None or len(block) < self.block_size:
+                self._source_done = True
+                return
+
+    def mark(self, frame: int, arrival: float):
+        """
+        Measure an event's latency when its first frame is played
+
+        Args:
+            frame: Output frame where the event is heard (frames count
+                from the start of the stream, in increasing order)
+            arrival: time.perf_counter() when the event arrived
+        """
+        self._marks.append((frame, arrival))
+
+    def pull(self, out: np.ndarray) -> int:
+        """
+        Take the next frames for playback, as the audio callback does
+
+        Copies out of the ring buffer, or renders the block without one.
+        Marked events whose frame is now taken get their latency recorded.
+
+        Args:
+            out: float32 array of shape (n, 2) to fill
+
+        Returns:
+            Number of frames written; the rest of out is left untouched
+
+        Raises:
+            Exception: Whatever the source raised (without a ring buffer)
+        """
+        if self.ring is not None:
+            count = self.ring.read_into(out)
+        elif self._source_done:
+            count = 0
+        else:
+            block = self.render_block(len(out))
+            count = 0
+            if block is not None:
+                count = len(block)
+                out[:count] = block
+            self.frames_rendered += count
+            if count < len(out):
+                self._source_done = True
+        self.frames_played += count
+        now = time.perf_counter()
+        while self._marks and self._marks[0][0] < self.frames_played:
+            self.event_latency.add(now - self._marks.popleft()[1])
+        return count
+
+    def _callback(self, outdata, frames, time_info, status):
+        """Audio callback: take a block from pull()"""
+        try:
+            count = self.pull(outdata)
+        except BaseException as e:
+            # Only without a ring buffer; reported by wait()
+            self._error = e
+            self._source_done = True
+            outdata.fill(0)
+            raise sd.CallbackStop
+        if count < frames:
+            outdata[count:] = 0
+            if self._source_done and (self.ring is None or self.ring.available == 0):
+                raise sd.CallbackStop
+            self.underruns += 1
+
+    def _raise_error(self):
+        """Re-raise an exception from the render thread"""
+        if self._error is not None:
+            raise self._error
+
+    def prefill(self):
+        """
+        Start the render thread and wait for the first block
+
+        start() calls this; it needs no audio device. Without a ring
+        buffer there is nothing to prefill.
+
+        Raises:
+            Exception: Whatever the source raised while rendering
+        """
+        self._stop.clear()
+        self._finished.clear()
+        self._source_done = False
+        self._error = None
+        if self.ring is None:
+            return
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+
+        # Wait for the first block so playback does not start with an underrun
+        while self.ring.available < self.block_size and not self._source_done:
+            time.sleep(0.001)
+        if self._error is not None:
+            self.stop()
+            self._raise_error()
+
+    def start(self):
+        """
+        Prefill the buffer and start playback
+
+        Raises:
+            RuntimeError: If sounddevice / PortAudio is not available
+            Exception: Whatever the source raised while prefilling
+        """
+        if sd is None:
+            raise RuntimeError("Playback requires sounddevice and the PortAudio library")
+        self.prefill()
+
+        self._stream = sd.OutputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.block_size,
+            channels=2,
+            dtype='float32',
+            device=self.device,
+            callback=self._callback,
+            finished_callback=self._finished.set,
+        )
+        self._stream.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the source has been played out or has failed
+
+        Returns:
+            True if playback finished, False on timeout
+
+        Raises:
+            Exception: Whatever the source raised while rendering
+        """
+        finished = self._finished.wait(timeout)
+        self._raise_error()
+        return finished
+
+    def stop(self):
+        """Stop playback and the render thread"""
+        self._stop.set()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        if self._producer is not None:
+            self._producer.join()
+            self._producer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
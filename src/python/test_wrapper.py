@@ -7,9 +7,59 @@ This script tests basic functionality of the YM2151 emulator wrapper:
 - Chip initialization
 - Register writes
 - Clock cycles
+- Batch rendering
+- Chip state view
+- Snapshot / restore, reset image and chip pool
+- Scheduled register writes
+- Streaming ring buffer and render thread errors
+- Resampler
+- Parallel batch rendering
+- Multi-threaded rendering
+- VGM parsing and rendering
+- Rendering to audio files
+- Benchmark harness
+- Golden-output corpus
+- Silence skipping
+- Per-channel stem capture
+- Voice banks and the patch cache
+- MIDI file and live input
+- Pitch tables
+- Timer status and the timer-paced driver loop
+- Register-write recording and VGM export
+- Content-addressed render cache
+- Looping VGM playback and loop replay
 """
 
-from nuked_opm import NukedOPM
+import ctypes
+import gzip
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_file import render_to_file
+import golden
+from bench import BENCHMARKS, run_benchmarks
+from batch_render import RenderJob, render_batch, render_job, render_job_from
+from midi import LiveInput, SmfPlayer, VirtualPort, VoiceAllocator, live_frame, parse_smf
+from nuked_opm import (OPM_DTYPE, OPM_t, TIMER_A, TIMER_B, ChipPool, NukedOPM, SnapshotPool, _lib,
+                       reset_image)
+from pitch import note_to_kc_kf, phase_increments, pitch_table
+from recorder import WriteRecorder
+from render_cache import RenderCache, render_key
+from timer_driver import TimerDriver, timer_a_hz, timer_a_value
+from resampler import Resampler
+from ring_buffer import RingBuffer
+from stream_player import StreamingPlayer, chip_source, native_source
+from vgm import _CYCLE_OFFSET, VGMStream, iter_ym2151_writes, read_header
+from voice_bank import PatchCache, VoiceBank, parse_opm
 
 
 def test_initialization():
@@ -39,6 +89,21 @@ def test_register_write(chip):
     # Write KEY ON/OFF
     chip.write_register(0x08, 0x78)
     print("  ✓ Write to register 0x08 (KEY ON)")
+    
+    # Each write is clocked in until it reaches the register file
+    state = chip.state
+    assert state['ch_connect'][0] == 7 and state['ch_kc'][0] == 0x50
+    print("  ✓ Writes landed in the register file")
+    
+    # Bulk writes give the same state as one write at a time
+    pairs = [(0x40 + slot, slot & 0x0F) for slot in range(32)]
+    bulk, single = NukedOPM(), NukedOPM()
+    clocks = bulk.write_registers(bytes(b for pair in pairs for b in pair))
+    assert clocks == bulk.cycle
+    assert sum(single.write_register(*pair) for pair in pairs) == clocks
+    assert bulk.snapshot() == single.snapshot()
+    assert list(bulk.state['sl_mul']) == [slot & 0x0F for slot in range(32)]
+    print(f"  ✓ write_registers() applied {len(pairs)} writes in {clocks} clocks")
 
 
 def test_clock_cycles(chip):
@@ -64,6 +129,891 @@ def test_sample_generation(chip):
     print(f"  Last sample: L={samples[-1][0]}, R={samples[-1][1]}")
 
 
+def test_render_matches_clock():
+    """Test that batch rendering matches per-cycle clocking"""
+    print("\nTesting batch render...")
+    
+    chip_a = NukedOPM()
+    chip_b = NukedOPM()
+    for chip in (chip_a, chip_b):
+        chip.write_register(0x20, 0xC7)
+        chip.write_register(0x28, 0x4A)
+        chip.write_register(0x08, 0x78)
+    
+    rendered = chip_a.render(256, clocks_per_sample=1)
+    clocked = np.array([chip_b.clock()[:2] for _ in range(256)], dtype=np.int32)
+    assert rendered.shape == (256, 2)
+    assert rendered.dtype == np.int32
+    assert np.array_equal(rendered, clocked)
+    print("  ✓ render() output matches clock() output")
+    
+    samples = chip_a.render(100)
+    assert samples.shape == (100, 2)
+    print(f"  ✓ Rendered {len(samples)} samples")
+
+
+def test_state_view():
+    """Test the typed opm_t mirror and its zero-copy numpy view"""
+    print("\nTesting chip state view...")
+    
+    assert OPM_DTYPE.itemsize == ctypes.sizeof(OPM_t)
+    
+    chip = NukedOPM()
+    chip.write(0, 0x28)
+    chip.render(1, clocks_per_sample=64)
+    chip.write(1, 0x4A)
+    chip.render(1, clocks_per_sample=64)
+    
+    assert chip.state['ch_kc'][0] == 0x4A
+    assert chip.chip.ch_kc[0] == 0x4A
+    print("  ✓ Register shadow visible through state view")
+    
+    eg_level = chip.state['eg_level']
+    assert eg_level.shape == (32,)
+    chip.chip.eg_level[0] = 123
+    assert eg_level[0] == 123
+    print("  ✓ State view shares memory with the chip")
+
+
+def test_snapshot_restore():
+    """Test that restored and forked chips continue identically"""
+    print("\nTesting snapshot / restore...")
+    
+    chip = NukedOPM()
+    chip.write_register(0x20, 0xC7)
+    chip.write_register(0x28, 0x4A)
+    chip.write_register(0x08, 0x78)
+    chip.render(100)
+    
+    saved = chip.snapshot()
+    fork = chip.fork()
+    expected = chip.render(500)
+    
+    assert np.array_equal(fork.render(500), expected)
+    print("  ✓ fork() continues identically")
+    
+    chip.restore(saved)
+    assert np.array_equal(chip.render(500), expected)
+    print("  ✓ restore() rewinds the chip")
+    
+    pool = SnapshotPool()
+    pool.save("prefix", fork)
+    branches = [pool.branch("prefix") for _ in range(2)]
+    assert np.array_equal(branches[0].render(200), branches[1].render(200))
+    print("  ✓ SnapshotPool branches are independent copies")
+    
+    # reset() copies the post-reset image instead of running OPM_Reset
+    chip.reset()
+    _lib.OPM_Reset(fork._chip_ref)
+    image = reset_image()
+    assert chip.snapshot()[:len(image)] == fork.snapshot()[:len(image)] == image
+    print("  ✓ reset() matches OPM_Reset")
+    
+    pool = ChipPool(max_idle=1, prefill=1)
+    with pool.chip() as first:
+        first.render(100)
+        second = pool.checkout(skip_silence=True)
+        assert pool.created == 2 and pool.reused == 1 and len(pool) == 0
+    pool.checkin(second)
+    assert len(pool) == 1   # over max_idle, the second chip is dropped
+    reused = pool.checkout()
+    assert reused is first and not reused.skip_silence
+    assert reused.snapshot() == NukedOPM().snapshot()
+    print("  ✓ ChipPool reuses reset chips and keeps at most max_idle")
+
+
+def test_scheduled_events():
+    """Test that scheduled writes land independently of render chunking"""
+    print("\nTesting scheduled register writes...")
+    
+    events = [
+        (0, 0x20, 0xC7),
+        (0, 0x28, 0x4A),
+        (0, 0x60, 0x00),
+        (0, 0x80, 0x1F),
+        (0, 0x08, 0x08),
+        (3000, 0x28, 0x3A),
+    ]
+    
+    whole = NukedOPM()
+    expected = whole.render(400, events=events)
+    assert whole.state['ch_kc'][0] == 0x3A
+    assert whole.state['sl_tl'][0] == 0x00
+    assert whole.pending_events == 0
+    print("  ✓ All scheduled writes reached the register file")
+    
+    chunked = NukedOPM()
+    chunked.schedule(events)
+    rendered = np.concatenate([chunked.render(n) for n in (1, 7, 150, 42, 200)])
+    assert np.array_equal(rendered, expected)
+    print("  ✓ Output is independent of render chunking")
+
+
+def test_ring_buffer():
+    """Test ring buffer wrap-around and fill levels"""
+    print("\nTesting ring buffer...")
+    
+    ring = RingBuffer(8, channels=2)
+    frames = np.arange(24, dtype=np.float32).reshape(12, 2)
+    
+    assert ring.write(frames[:6]) == 6
+    out = np.zeros((4, 2), dtype=np.float32)
+    assert ring.read_into(out) == 4
+    assert np.array_equal(out, frames[:4])
+    
+    # Wraps around the end of the storage
+    assert ring.write(frames[6:]) == 6
+    assert ring.free == 0
+    out = np.zeros((10, 2), dtype=np.float32)
+    assert ring.read_into(out) == 8
+    assert np.array_equal(out[:8], frames[4:])
+    assert ring.available == 0
+    print("  ✓ Ring buffer wraps and reports fill levels")
+
+
+def test_stream_player_errors():
+    """Test that a failing source is reported instead of hanging playback"""
+    print("\nTesting render thread errors...")
+    
+    def failing(num_frames):
+        raise ValueError("source failed")
+    
+    player = StreamingPlayer(failing, 48000, block_size=64)
+    for call in (player.prefill, lambda: player.wait(5.0)):
+        try:
+            call()
+        except ValueError as e:
+            assert str(e) == "source failed"
+        else:
+            raise AssertionError("The source error was not raised")
+    
+    calls = 0
+    prefilled = threading.Event()
+    
+    def fails_later(num_frames):
+        nonlocal calls
+        calls += 1
+        if calls > 3:
+            prefilled.wait()
+            raise ValueError("source failed later")
+        return np.zeros((num_frames, 2), dtype=np.float32)
+    
+    player = StreamingPlayer(fails_later, 48000, block_size=64, buffer_blocks=8)
+    player.prefill()
+    prefilled.set()
+    try:
+        player.wait(5.0)
+    except ValueError as e:
+        assert str(e) == "source failed later"
+    else:
+        raise AssertionError("The source error was not raised")
+    player.stop()
+    assert player.frames_rendered == 3 * 64
+    print("  ✓ Source errors are re-raised from prefill() and wait()")
+
+
+def test_resampler():
+    """Test resampler accuracy, anti-aliasing and block independence"""
+    print("\nTesting resampler...")
+    
+    input_rate, output_rate = 62500, 48000
+    t = np.arange(input_rate) / input_rate
+    
+    tone = np.sin(2 * np.pi * 1000 * t)
+    resampled = Resampler(input_rate, output_rate).process(np.stack([tone, tone], axis=1))
+    expected = np.sin(2 * np.pi * 1000 * np.arange(len(resampled)) / output_rate)
+    error = resampled[100:-100, 0] - expected[100:-100]
+    assert np.max(np.abs(error)) < 1e-3
+    print("  ✓ 1 kHz tone resampled accurately")
+    
+    # 30 kHz is above the 24 kHz output Nyquist and must be filtered out
+    alias = np.sin(2 * np.pi * 30000 * t)
+    resampled = Resampler(input_rate, output_rate).process(np.stack([alias, alias], axis=1))
+    assert np.max(np.abs(resampled[100:-100])) < 1e-3
+    print("  ✓ Content above output Nyquist is rejected")
+    
+    noise = np.random.default_rng(0).standard_normal((10000, 2)).astype(np.float32)
+    whole = Resampler(3579545 / 64, 44100).process(noise)
+    chunked = Resampler(3579545 / 64, 44100)
+    pieces = np.concatenate([chunked.process(noise[i:i + 777]) for i in range(0, len(noise), 777)])
+    assert np.array_equal(whole, pieces)
+    print("  ✓ Output is independent of block size")
+
+
+def test_batch_render():
+    """Test that parallel batch renders match serial renders"""
+    print("\nTesting parallel batch rendering...")
+    
+    registers = [(0x20, 0xC7), (0x60, 0x00), (0x80, 0x1F), (0x08, 0x08)]
+    jobs = [
+        RenderJob(500 + 100 * i, registers + [(0x28, 0x40 + i)], [(8000, 0x08, 0x00)])
+        for i in range(4)
+    ]
+    
+    chip = NukedOPM()
+    with render_batch(jobs, workers=2) as result:
+        assert len(result) == len(jobs)
+        for job, output in zip(jobs, result.outputs):
+            expected = np.empty((job.num_samples, 2), dtype=np.int32)
+            render_job(chip, job, expected)
+            assert np.array_equal(output, expected)
+    print(f"  ✓ {len(jobs)} jobs rendered in parallel match serial renders")
+
+
+def test_threaded_render():
+    """Test that chips rendered on separate threads stay independent"""
+    print("\nTesting multi-threaded rendering...")
+    
+    def render(kc):
+        chip = NukedOPM()
+        chip.render(300, events=[(0, 0x20, 0xC7), (0, 0x28, kc), (0, 0x60, 0x00),
+                                 (0, 0x80, 0x1F), (0, 0x08, 0x08)])
+        return chip.render(2000)
+    
+    key_codes = [0x30, 0x3A, 0x4A, 0x5E]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        threaded = list(pool.map(render, key_codes))
+    for kc, output in zip(key_codes, threaded):
+        assert np.array_equal(output, render(kc))
+    print(f"  ✓ {len(key_codes)} chips on separate threads match serial renders")
+
+
+def make_vgm(commands: bytes, total_samples: int, clock: int = 4_000_000,
+             loop: tuple = None) -> bytes:
+    """
+    Build a minimal VGM 1.61 file around YM2151 command data
+    
+    loop is (offset into commands, length in VGM samples) of the loop section.
+    """
+    header = bytearray(0x80)
+    header[0:4] = b'Vgm '
+    struct.pack_into('<I', header, 0x08, 0x161)
+    struct.pack_into('<I', header, 0x18, total_samples)
+    if loop is not None:
+        struct.pack_into('<II', header, 0x1C, len(header) + loop[0] - 0x1C, loop[1])
+    struct.pack_into('<I', header, 0x30, clock)
+    struct.pack_into('<I', header, 0x34, len(header) - 0x34)
+    return bytes(header) + commands + b'\x66'
+
+
+def test_vgm_stream():
+    """Test VGM parsing across chunk boundaries and VGZ rendering"""
+    print("\nTesting VGM playback...")
+    
+    writes = [(0x20, 0xC7), (0x28, 0x4A), (0x60, 0x00), (0x80, 0x1F), (0x08, 0x08)]
+    commands = b''.join(bytes([0x54, address, data]) for address, data in writes)
+    commands += b'\x61' + struct.pack('<H', 4410)  # wait 0.1 s
+    commands += b'\x50\x9f'                         # PSG write (ignored)
+    commands += bytes([0x54, 0x28, 0x3A])
+    commands += b'\x62'                              # wait 1/60 s
+    vgm_data = make_vgm(commands, 4410 + 735)
+    
+    def parse(chunk_size):
+        f = io.BytesIO(vgm_data)
+        read_header(f)
+        return np.concatenate(list(iter_ym2151_writes(f, chunk_size)))
+    
+    events = parse(64 * 1024)
+    assert len(events) == 6
+    assert events['time'][-1] == 4410
+    assert np.array_equal(parse(5), events)
+    print("  ✓ Commands parsed identically across chunk boundaries")
+    
+    def parse_commands(commands):
+        f = io.BytesIO(make_vgm(commands, 0))
+        read_header(f)
+        return np.concatenate(list(iter_ym2151_writes(f)))
+    
+    # Operands full of 0x66 (end of data) must not be read as commands
+    pcm_write = b'\x68\x66' + bytes([0x66] * 10)   # PCM RAM write
+    wait_override = b'\x64\x66\x66\x66'           # wait length override
+    events = parse_commands(b'\x54\x28\x4A' + pcm_write + wait_override + b'\x54\x08\x78')
+    assert list(zip(events['address'], events['data'])) == [(0x28, 0x4A), (0x08, 0x78)]
+    try:
+        parse_commands(b'\x54\x28\x4A\x2F\x54\x08\x78')
+        assert False, "Unknown command should raise"
+    except ValueError as e:
+        assert '0x2F' in str(e)
+    print("  ✓ PCM RAM writes and wait overrides are skipped; unknown commands raise")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'test.vgz')
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(vgm_data))
+        with VGMStream(path) as stream:
+            assert stream.clock == 4_000_000
+            blocks = []
+            while True:
+                block = stream.render(1000)
+                if not len(block):
+                    break
+                blocks.append(block)
+            rendered = np.concatenate(blocks)
+            assert len(rendered) == stream.total_samples
+            assert stream.chip.state['ch_kc'][0] == 0x3A
+    
+    expected = NukedOPM()
+    expected.schedule([(0, address, data) for address, data in writes])
+    expected.schedule([(int(stream.vgm_to_cycle(4410)), 0x28, 0x3A)])
+    assert np.array_equal(rendered, expected.render(len(rendered)))
+    print(f"  ✓ VGZ rendered {len(rendered)} samples matching direct scheduling")
+
+
+def test_vgm_loops():
+    """Test looping VGM playback and replay of repeated loop passes"""
+    print("\nTesting VGM loops...")
+    
+    intro = b''.join(bytes([0x54, address, data]) for address, data in
+                     [(0x20, 0xC7), (0x60, 0x00), (0x80, 0x1F), (0xE0, 0x0F)])
+    section = b''.join(bytes([0x54, 0x28, kc]) + b'\x54\x08\x08' + b'\x61' + struct.pack('<H', 1500)
+                       + b'\x54\x08\x00' + b'\x61' + struct.pack('<H', 705)
+                       for kc in (0x4A, 0x3A))
+    vgm_data = make_vgm(intro + b'\x62' + section, 735 + 4410, loop=(len(intro) + 1, 4410))
+    
+    def render_all(stream, hook=None):
+        blocks = []
+        while True:
+            if hook is not None:
+                hook(stream)
+            block = stream.render(3000)
+            if not len(block):
+                return np.concatenate(blocks)
+            blocks.append(block)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'loop.vgm')
+        with open(path, 'wb') as f:
+            f.write(vgm_data)
+        
+        with VGMStream(path) as once, VGMStream(path, loops=4) as looped:
+            single = render_all(once)
+            full = render_all(looped)
+            assert len(single) == once.total_samples == looped.loop_start
+            assert len(full) == looped.loop_start + 3 * looped.loop_length
+            assert np.array_equal(full[:len(single)], single)
+            assert looped.replayed_samples == 0   # the envelope timer moved on
+            for repeat in range(3):
+                start = looped.loop_start + repeat * looped.loop_length
+                assert np.abs(full[start:start + 1000]).max() > 0
+        print(f"  ✓ 4 passes render {len(full)} samples; the envelope timer differs, so all are emulated")
+        
+        def rewind(field=None, once=False):
+            """
+            Start every later repeat from the state at the start of repeat 1,
+            making the output periodic; with field, flip that field in the
+            restored state, and with once, only rewind at the first boundary
+            """
+            saved = {}
+            
+            def hook(stream):
+                repeat_end = stream.position - stream.loop_start
+                if repeat_end == 0:
+                    saved['start'] = stream.chip.snapshot()
+                elif (repeat_end > 0 and repeat_end % stream.loop_length == 0
+                      and (not once or repeat_end == stream.loop_length)):
+                    snapshot = saved['start']
+                    stream.chip.restore(snapshot[:_CYCLE_OFFSET]
+                                        + struct.pack('<Q', stream.chip.cycle)
+                                        + snapshot[_CYCLE_OFFSET + 8:])
+                    if field is not None:
+                        stream.chip.state[field] ^= 1
+            return hook
+        
+        size = ctypes.sizeof(OPM_t)
+        with VGMStream(path, loops=5) as cached, \
+                VGMStream(path, loops=5, cache_loops=False) as emulated:
+            replayed = render_all(cached, rewind())
+            expected = render_all(emulated, rewind())
+            assert np.array_equal(replayed, expected)
+            assert cached.replayed_samples == 3 * cached.loop_length
+            assert cached.chip.snapshot()[:size] == emulated.chip.snapshot()[:size]
+            assert cached.chip.cycle == emulated.chip.cycle
+        print(f"  ✓ Repeated state replays {cached.replayed_samples} samples identical to emulation")
+        
+        # Noise is off and the LFO modulates nothing, so their state is
+        # left out of the comparison; the envelope timer never is
+        for field in ('noise_lfsr', 'lfo_val', 'pg_phase'):
+            with VGMStream(path, loops=5) as cached, \
+                    VGMStream(path, loops=5, cache_loops=False) as emulated:
+                assert np.array_equal(render_all(cached, rewind(field)),
+                                      render_all(emulated, rewind(field)))
+                assert cached.replayed_samples == 3 * cached.loop_length
+        print("  ✓ A different noise LFSR, LFO phase or silent operator phase still replays")
+        
+        with VGMStream(path, loops=5) as cached, \
+                VGMStream(path, loops=5, cache_loops=False) as emulated:
+            assert np.array_equal(render_all(cached, rewind('eg_timer', once=True)),
+                                  render_all(emulated, rewind('eg_timer', once=True)))
+            assert cached.replayed_samples == 0
+        print("  ✓ A different envelope timer falls back to emulation")
+        
+        # A section that ends in silence and lasts one envelope timer period
+        # (3 * 65536 samples) repeats on its own: the noise LFSR, the LFO and
+        # the released operators' phases differ, but none reaches the output.
+        # At 64 * 44100 Hz one VGM sample is one native sample.
+        period = 3 * 65536
+        
+        def wait(samples):
+            return b''.join(b'\x61' + struct.pack('<H', step)
+                            for step in [0xFFFF] * (samples // 0xFFFF) + [samples % 0xFFFF])
+        
+        section = b'\x54\x08\x08' + wait(6000) + b'\x54\x08\x00' + wait(period - 6000)
+        path = os.path.join(tmp, 'natural.vgm')
+        with open(path, 'wb') as f:
+            f.write(make_vgm(intro + wait(100) + section, 100 + period, clock=64 * 44100,
+                             loop=(len(intro) + 3, period)))
+        with VGMStream(path, NukedOPM(skip_silence=True), loops=3) as cached, \
+                VGMStream(path, NukedOPM(skip_silence=True), loops=3,
+                          cache_loops=False) as emulated:
+            assert cached.loop_length == period
+            assert np.array_equal(render_all(cached), render_all(emulated))
+            assert cached.replayed_samples == period
+            assert cached.chip.state['noise_lfsr'] != emulated.chip.state['noise_lfsr']
+        print(f"  ✓ A natural loop replays {cached.replayed_samples} samples identical to emulation")
+
+def test_render_to_file():
+    """Test incremental WAV rendering against an in-memory render"""
+    print("\nTesting render to file...")
+    
+    events = [(0, 0x20, 0xC7), (0, 0x28, 0x4A), (0, 0x60, 0x00), (0, 0x80, 0x1F), (0, 0x08, 0x08)]
+    reference = NukedOPM()
+    reference.schedule(events)
+    expected = np.clip(reference.render(10000), -32768, 32767).astype('<i2')
+    
+    chip = NukedOPM()
+    chip.schedule(events)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'out.wav')
+        # Block size deliberately does not divide the length
+        frames = render_to_file(chip_source(chip, 10000), path, 62500, block_size=3000)
+        assert frames == 10000
+        with wave.open(path, 'rb') as f:
+            assert f.getnchannels() == 2
+            assert f.getframerate() == 62500
+            data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').reshape(-1, 2)
+    
+    assert np.array_equal(data, expected)
+    assert np.abs(data).max() > 0
+    print(f"  ✓ {frames} frames written in blocks match the direct render")
+
+
+def test_benchmarks():
+    """Test that every benchmark runs and reports JSON-serializable results"""
+    print("\nTesting benchmark harness...")
+    
+    report = run_benchmarks(BENCHMARKS, seconds=0.01, repeat=1, thread_counts=[1, 2],
+                            clock_cycles=100, register_writes=100, resets=20)
+    assert list(report["results"]) == BENCHMARKS
+    assert report["results"]["render"]["realtime_factor"] > 0
+    assert report["results"]["generate_audio"]["peak_memory_bytes"] > 0
+    assert [row["threads"] for row in report["results"]["threads"]] == [1, 2]
+    json.loads(json.dumps(report))
+    print(f"  ✓ {len(BENCHMARKS)} benchmarks reported")
+
+
+def test_golden_corpus():
+    """Test the rendered audio against the recorded golden corpus"""
+    print("\nTesting golden-output corpus...")
+    
+    results = golden.check_corpus()
+    failures = {name: mismatch for name, mismatch in results.items() if mismatch}
+    assert not failures, f"Output changed: {failures}"
+    print(f"  ✓ {len(results)} cases match their golden hashes")
+    
+    # A single changed sample is pinpointed to its block
+    pcm, state = golden.render_case("algorithm_0", golden.DEFAULT_SAMPLES)
+    expected = golden.fingerprint(pcm, state)
+    pcm = pcm.copy()
+    pcm[3000, 1] += 1
+    assert golden.compare(expected, golden.fingerprint(pcm, state)).startswith(
+        "first divergent block 2")
+    print("  ✓ Mismatch reported at the first divergent block")
+
+
+def test_silence_skip():
+    """Test silence skipping against full emulation"""
+    print("\nTesting silence skipping...")
+    
+    chip = NukedOPM()
+    assert chip.is_silent()
+    # Channel 0 note from the golden corpus with the fastest release rate:
+    # released at 2000, keyed on again at 20000 after the envelopes have
+    # died out
+    events = golden.load_script(os.path.join(golden.GOLDEN_DIR, "algorithm_0.txt"))
+    events = events[events[:, 0] == 0]
+    events[np.isin(events[:, 1], [0xE0, 0xE8, 0xF0, 0xF8]), 2] |= 0x0F
+    events = np.concatenate((events, [[2000 * 32, 0x08, 0x00], [20000 * 32, 0x08, 0x78]]))
+    chip.schedule(events)
+    
+    result = chip.compare_silence_skip(24000)
+    assert chip.cycle == 0 and chip.pending_events == len(events)
+    assert result["skipped"] > 0
+    assert result["first_difference"] is None, result
+    print(f"  ✓ {result['skipped']} of {result['samples']} samples skipped, "
+          f"identical to full emulation")
+    
+    # LFO running (AM and PM depth set, wave triangle) through the gap
+    lfo = [[0, 0x18, 0xC0], [0, 0x19, 0x7F], [0, 0x19, 0xFF], [0, 0x1B, 0x02]]
+    skipped = []
+    for late in ([[0, 0x38, 0x77]], [[19990 * 32, 0x38, 0x77]]):
+        lfo_chip = NukedOPM()
+        lfo_chip.schedule(np.concatenate((events, lfo, late)))
+        lfo_result = lfo_chip.compare_silence_skip(24000)
+        assert lfo_result["first_difference"] is None, lfo_result
+        skipped.append(lfo_result["skipped"])
+    # A modulated channel is never skipped; a channel modulated only after
+    # the gap is, and the LFO phase is still where full emulation has it
+    assert skipped[0] == 0 and skipped[1] > 0
+    print("  ✓ With the LFO enabled the output is identical as well")
+    
+    chip.skip_silence = True
+    out = chip.render(24000)
+    assert chip.skipped_samples == result["skipped"]
+    assert chip.cycle == 24000 * 32 and chip.pending_events == 0
+    assert not out[19000:20000].any() and out[20100:].any()
+    print("  ✓ Chip cycle and scheduled writes advance across skipped samples")
+
+
+def test_channel_stems():
+    """Test per-channel capture against single-channel renders"""
+    print("\nTesting per-channel stems...")
+    
+    single = golden.load_script(os.path.join(golden.GOLDEN_DIR, "algorithm_0.txt"))
+    # The same part on channel 3, starting at sample 1000
+    moved = single.copy()
+    moved[:, 0] += 1000 * 32
+    moved[moved[:, 1] >= 0x20, 1] += 3
+    moved[moved[:, 1] == 0x08, 2] |= 3
+    
+    alone_mix, alone = NukedOPM().render_stems(8192, events=single)
+    mix, stems = NukedOPM().render_stems(8192, events=np.concatenate((single, moved)))
+    assert stems.shape == (8192, 8, 2)
+    assert np.array_equal(alone_mix, golden.render_case("algorithm_0", 8192)[0])
+    assert np.array_equal(stems[:, 0], alone[:, 0])
+    assert stems[:, 3].any()
+    assert not stems[:, [1, 2, 4, 5, 6, 7]].any()
+    print("  ✓ Each channel captured separately in one pass")
+    
+    # The stems add up to what the DAC converts. Its resolution is
+    # 2 ** (exp - 1) for the smallest exponent whose 10-bit mantissa holds
+    # the sum, and the output is rounded down to it. Both channels play
+    # on both sides, so the left is converted right after the same value
+    # on the right and is only rounded; the right takes its four lowest
+    # mantissa bits with the previous left exponent (see render_stems),
+    # which can cost up to 15 more steps.
+    total = stems.sum(axis=1, dtype=np.int64)
+    step = np.ones_like(total)
+    for _ in range(6):
+        wide = (total // step < -512) | (total // step >= 512)
+        step[wide] *= 2
+    error = total - mix
+    assert np.all((0 <= error[:, 0]) & (error[:, 0] < step[:, 0]))
+    assert np.all(np.abs(error[:, 1]) < 16 * step[:, 1])
+    assert np.abs(error[:, 1]).max() > step[:, 1].max()   # the right side quirk is real
+    print(f"  ✓ Sum of stems matches the mix: left within the DAC step, right within "
+          f"{int((np.abs(error[:, 1]) / step[:, 1]).max())} steps")
+    
+    chip = NukedOPM()
+    chip.schedule(np.concatenate((single, moved)))
+    parts = [chip.render_stems(count)[1] for count in (1000, 3000, 4192)]
+    assert np.array_equal(np.concatenate(parts), stems)
+    print("  ✓ Chunked capture matches a single pass")
+
+
+def test_voice_bank():
+    """Test .opm parsing, patch compilation and the LRU cache"""
+    print("\nTesting voice banks...")
+    
+    bank = VoiceBank.load(os.path.join(os.path.dirname(__file__), "voices", "basic.opm"),
+                          PatchCache(maxsize=2))
+    assert len(bank) == 3 and bank[1].name == "Electric Piano"
+    
+    registers = bank.registers(1, channel=3)
+    writes = dict(map(tuple, registers.tolist()))
+    assert len(registers) == 26 and not registers.flags.writeable
+    assert writes[0x23] == 0xC0 | (5 << 3) | 4           # PAN, FL, CON
+    assert writes[0x40 + 3 + 8] == (7 << 4) | 14         # M2: DT1, MUL
+    assert writes[0x60 + 3 + 16] == 0                    # C1: TL
+    assert bank.registers(1, 3) is registers
+    print("  ✓ Patch compiled to channel registers")
+    
+    bank.registers(0, 3)
+    bank.registers(2, 3)                                  # evicts patch 1
+    assert bank.registers(1, 3) is not registers
+    assert (bank.cache.hits, bank.cache.misses, len(bank.cache)) == (1, 4, 2)
+    print("  ✓ LRU cache hits and evictions")
+    
+    chip = NukedOPM()
+    bank.apply(chip, 2, channel=5)
+    chip.render(100)
+    state = chip.state
+    assert state['ch_connect'][5] == 2 and state['ch_pms'][5] == 3
+    slots = [5 + offset for offset in (0, 16, 8, 24)]       # M1, C1, M2, C2
+    assert list(state['sl_tl'][slots]) == [28, 35, 38, 4]
+    assert list(state['sl_ar'][slots]) == [18, 14, 16, 16]
+    print("  ✓ Patch applied with one scheduled bulk write")
+    
+    for text, message in (("CH: 192 0 4 0 0 120 0", "before the first"),
+                          ("@:0 x\nLFO: 0 0 0 0 0\nCH: 192 0 4 0 0 120 0\n"
+                           "M1: 32 0 0 0 0 0 0 0 0 0 0", "AR must be 0-31"),
+                          ("@:0 x\nLFO: 0 0 0 0 0", "missing CH")):
+        try:
+            parse_opm(text, "bank.opm")
+        except ValueError as e:
+            assert message in str(e) and "bank.opm:" in str(e), e
+        else:
+            raise AssertionError(f"accepted invalid bank: {text!r}")
+    print("  ✓ Invalid banks rejected with the offending line")
+
+
+def make_smf(tracks, division: int = 480) -> bytes:
+    """Build a format 1 MIDI file from (delta ticks, event bytes) lists"""
+    def varlen(value):
+        out = [value & 0x7F]
+        while value > 0x7F:
+            value >>= 7
+            out.insert(0, 0x80 | (value & 0x7F))
+        return bytes(out)
+    
+    data = b'MThd' + struct.pack('>IHHH', 6, 1, len(tracks), division)
+    for events in tracks:
+        body = b''.join(varlen(delta) + bytes(event) for delta, event in events)
+        body += b'\x00\xff\x2f\x00'
+        data += b'MTrk' + struct.pack('>I', len(body)) + body
+    return data
+
+
+def test_midi():
+    """Test MIDI parsing, voice allocation and sample-accurate playback"""
+    print("\nTesting MIDI front end...")
+    
+    allocator = VoiceAllocator(voices=2)
+    assert allocator.note_on(0, 60) == (0, None)
+    assert allocator.note_on(0, 64) == (1, None)
+    assert allocator.note_on(0, 67) == (0, (0, 60))   # steals the oldest note
+    assert allocator.note_off(0, 64) == 1
+    assert allocator.note_on(1, 72) == (1, None)      # the free voice
+    print("  ✓ Voice allocation with note stealing")
+    
+    # Tempo 480 -> 240 BPM after one beat; note with running status
+    smf = make_smf([
+        [(0, [0xFF, 0x51, 0x03, 0x01, 0xE8, 0x48]), (480, [0xFF, 0x51, 0x03, 0x03, 0xD0, 0x90])],
+        [(0, [0xC0, 0x01]), (240, [0x90, 69, 100]), (480, [64, 90]), (480, [69, 0]),
+         (0, [0x80, 64, 0])],
+    ])
+    events = parse_smf(smf)
+    assert list(events['status']) == [0xC0, 0x90, 0x90, 0x90, 0x80]
+    assert np.allclose(events['time'], [0.0, 0.0625, 0.25, 0.5, 0.5])
+    print("  ✓ SMF parsed with running status and tempo changes")
+    
+    bank = VoiceBank.load(os.path.join(os.path.dirname(__file__), "voices", "basic.opm"))
+    outputs = []
+    for block in (1024, 333):
+        player = SmfPlayer(events, bank, tail=0.1)
+        outputs.append(np.concatenate([player.render(block)
+                                       for _ in range(player.total_samples // block + 1)]))
+    assert np.array_equal(outputs[0], outputs[1])
+    assert len(outputs[0]) == player.total_samples
+    onset = int(np.flatnonzero(outputs[0].any(axis=1))[0])
+    assert int(0.0625 * player.sample_rate) <= onset < int(0.0625 * player.sample_rate) + 64
+    assert player.chip.state['ch_connect'][0] == 4 and player.driver.notes_on == 2
+    print(f"  ✓ Playback independent of block size, first note audible at sample {onset}")
+    
+    # Drive the player the way the audio callback does: every note must be
+    # in the first block taken after it arrives, and its latency is
+    # measured when that block is taken
+    port = VirtualPort()
+    live = LiveInput(port, bank)
+    resampler = Resampler(live.sample_rate, 48000)
+    player = StreamingPlayer(native_source(live.render, resampler=resampler), 48000,
+                             block_size=256, buffer_blocks=0)
+    live.on_note = lambda sample, arrival: player.mark(live_frame(sample, resampler), arrival)
+    player.prefill()
+    block = np.zeros((256, 2), dtype=np.float32)
+    assert player.pull(block) == 256 and not block.any()
+    for count, note in enumerate((60, 64, 67), 1):
+        start = player.frames_played
+        sent = time.perf_counter()
+        port.send([0x90, note, 127])
+        player.pull(block)
+        taken = time.perf_counter()
+        assert len(player.event_latency.values) == count
+        assert player.event_latency.values[-1] <= taken - sent
+        onset = int(np.flatnonzero(np.abs(block).max(axis=1) > 1e-3)[0])
+        assert onset < 64, f"note {note} starts at frame {start + onset}"
+    assert live.chip.state['ch_kc'][2] == note_to_kc_kf(67)[0]
+    print(f"  ✓ Live notes heard in the first block taken after they arrive "
+          f"(max {player.event_latency.max * 1000:.2f} ms)")
+
+
+def test_pitch():
+    """Test KC/KF <-> Hz conversion against the chip"""
+    print("\nTesting pitch tables...")
+    
+    increments = phase_increments()
+    for kcf in (0, 0x1C5, 0x1234, 0x1FFF):
+        chip = NukedOPM()
+        chip.write_registers([(0x28, kcf >> 6), (0x30, (kcf & 63) << 2), (0x40, 0x01)])
+        chip.render(4)
+        assert chip.state['pg_inc'][0] == increments[kcf]
+    print("  ✓ Phase increments match the chip")
+    
+    assert note_to_kc_kf(69, 3_579_545) == (0x4A, 0x00)
+    assert note_to_kc_kf(69, 4_000_000) == (0x48, 0x14)
+    print("  ✓ A4 maps to KC 0x4A at 3.58 MHz and 0x48 + KF at 4 MHz")
+    
+    table = pitch_table(4_000_000)
+    notes = np.arange(24, 109, 0.25).reshape(-1, 4)
+    kc, kf = table.from_note(notes)
+    assert kc.shape == notes.shape and kf.dtype == np.uint8
+    cents = 1200 * np.log2(table.to_hz(kc, kf) / (440 * 2 ** ((notes - 69) / 12)))
+    assert np.abs(cents).max() < 3
+    hz = table.to_hz(*table.from_hz(table.hz[::7]))
+    assert np.array_equal(hz, table.hz[::7])
+    assert table.to_hz(*table.from_hz([1.0, 1e6])).tolist() == [table.hz.min(), table.hz.max()]
+    print(f"  ✓ Notes C1-C8 within {np.abs(cents).max():.2f} cents, round trip exact")
+
+
+def test_timer_driver():
+    """Test timer status reads and ticks at every timer overflow"""
+    print("\nTesting timer driver loop...")
+    
+    chip = NukedOPM()
+    chip.write_registers([(0x10, 0xFA), (0x11, 0x00), (0x14, 0x05)])   # NA = 1000, IRQ A
+    assert chip.read_status() == 0 and not chip.irq()
+    block, raised = chip.render_until_irq(1000)
+    assert raised == TIMER_A and len(block) < 1000
+    assert chip.read_status() & TIMER_A and chip.irq()
+    block, raised = chip.render_until_irq(100)   # the flag is still set
+    assert raised == 0 and len(block) == 100
+    print("  ✓ render_until_irq() stops at the overflow, status and IRQ read back")
+    
+    times = []
+    def tick(driver, raised):
+        times.append((driver.chip.cycle // 32, raised))
+        driver.write(0x28, len(times) & 0x7F)
+    
+    driver = TimerDriver(tick)
+    driver.start_timer_a(timer_a_value(timer_a_hz(1000)))
+    out = driver.render(2400)
+    assert out.shape == (2400, 2) and driver.ticks == len(times) == 99
+    assert set(np.diff([time for time, _ in times])) == {24}   # 1024 - 1000 samples
+    assert {raised for _, raised in times} == {TIMER_A}
+    assert driver.chip.state['ch_kc'][0] == len(times) & 0x7F
+    print(f"  ✓ {driver.ticks} ticks, one per {1024 - 1000} samples")
+    
+    driver.stop()
+    driver.render(200)
+    assert driver.ticks == 99 and not driver.chip.read_status() & (TIMER_A | TIMER_B)
+    print("  ✓ stop() halts the timers and clears the flags")
+
+
+def test_recorder():
+    """Test write capture, exact replay and VGM export"""
+    print("\nTesting register-write recorder...")
+    
+    chip = NukedOPM()
+    chip.render(10)
+    start = chip.snapshot()
+    recorder = WriteRecorder(capacity=4).attach(chip)
+    chip.write_registers([(0x20, 0xC7), (0x28, 0x4A), (0x60, 0x00), (0x80, 0x1F),
+                          (0xE0, 0x0F), (0x08, 0x08)])
+    chip.render(1000)
+    chip.schedule([(100, 0x08, 0x00), (300, 0x28, 0x3A), (300, 0x08, 0x08)],
+                  clocks_per_tick=32)
+    chip.render(1000)
+    assert len(recorder) == 9 and recorder.writes['cycle'][0] == 0
+    assert recorder.end_cycle == chip.cycle - 320
+    print(f"  ✓ {len(recorder)} writes logged (log grew from 4 to {len(recorder._log)})")
+    
+    replay = NukedOPM(start)
+    replay.schedule(recorder.events())
+    replay.render(recorder.end_cycle, clocks_per_sample=1)
+    size = ctypes.sizeof(OPM_t)
+    assert replay.snapshot()[:size] == chip.snapshot()[:size]
+    print("  ✓ Replaying the log reproduces the chip state exactly")
+    
+    end = recorder.end_cycle
+    chip.reset()
+    chip.write_register(0x28, 0x40)
+    assert recorder.writes['cycle'][-1] == end and recorder.end_cycle >= end
+    recorder.detach()
+    chip.write_register(0x28, 0x41)
+    assert chip.recorder is None and len(recorder) == 10
+    print("  ✓ Time stays continuous across reset(); detach() stops logging")
+    
+    vgm_data = recorder.to_vgm(4_000_000)
+    f = io.BytesIO(vgm_data)
+    header = read_header(f)
+    events = np.concatenate(list(iter_ym2151_writes(f)))
+    expected = recorder.vgm_events(4_000_000)
+    assert header.ym2151_clock == 4_000_000 and header.total_samples >= expected['time'][-1]
+    assert np.array_equal(events, expected)
+    assert len(set(expected['time'])) == 4   # writes at one time share a position
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "session.vgz")
+        recorder.save_vgm(path)
+        with VGMStream(path) as stream:
+            assert stream.render(4096).any()
+    print(f"  ✓ VGM export ({len(vgm_data)} bytes) parses back to the same writes")
+
+
+def test_render_cache():
+    """Test render cache hits, keys and the size bound"""
+    print("\nTesting render cache...")
+    
+    registers = [(0x20, 0xC7), (0x28, 0x4A), (0x60, 0x00), (0x80, 0x1F), (0xE0, 0x0F),
+                 (0x08, 0x08)]
+    job = RenderJob(4000, registers, [(1000 * 32, 0x08, 0x00)])
+    reference = np.empty((job.num_samples, 2), dtype=np.int32)
+    render_job(NukedOPM(), job, reference)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RenderCache(tmp, max_bytes=3 * reference.nbytes)
+        first = cache.render(job)
+        second = cache.render(job)
+        assert np.array_equal(first, reference) and np.array_equal(second, reference)
+        assert isinstance(second, np.memmap) and cache.hits == 1 and cache.misses == 1
+        print("  ✓ A hit maps the stored render, identical to a fresh one")
+        
+        keys = {
+            render_key(job),
+            render_key(job._replace(num_samples=4001)),
+            render_key(job._replace(registers=registers[:-1])),
+            render_key(job._replace(events=[(1001 * 32, 0x08, 0x00)])),
+            render_key(job, clock=3_579_545),
+            render_key(job, sample_rate=48000),
+            render_key(job, snapshot=NukedOPM().snapshot()),
+        }
+        assert len(keys) == 7 and render_key(job) == render_key(RenderJob(*job))
+        resampled = cache.render(job, sample_rate=48000)
+        assert resampled.dtype == np.float32 and cache.misses == 2
+        assert np.array_equal(cache.render(job, sample_rate=48000), resampled)
+        print("  ✓ Keys cover length, writes, clock, output rate and start state")
+        
+        start = NukedOPM()
+        start.write_registers(registers)
+        start.render(500)
+        snapshot = start.snapshot()
+        later = RenderJob(3000, [(0x28, 0x3A)], [(700 * 32, 0x08, 0x00)])
+        direct = np.empty((later.num_samples, 2), dtype=np.int32)
+        render_job_from(NukedOPM(snapshot), later, direct)
+        assert np.array_equal(cache.render(later, snapshot=snapshot), direct)
+        assert np.array_equal(cache.render(later, snapshot=snapshot), direct)
+        assert not np.array_equal(cache.render(later)[:600], direct[:600])
+        assert cache.hits == 3 and cache.misses == 4
+        print("  ✓ Renders from a snapshot match a direct render from that state")
+        
+        for n in range(4):
+            cache.render(RenderJob(4000, registers + [(0x28, 0x30 + n)]))
+        assert cache.size <= cache.max_bytes and len(cache) == len(os.listdir(tmp))
+        assert render_key(job) + '.i32' not in os.listdir(tmp)
+        reopened = RenderCache(tmp, max_bytes=cache.max_bytes)
+        assert len(reopened) == len(cache) and reopened.size == cache.size
+        print(f"  ✓ LRU eviction keeps {cache.size} bytes within {cache.max_bytes}")
+
+
 def main():
     """Main test function"""
     print("=" * 60)
@@ -77,6 +1027,28 @@ def main():
         test_register_write(chip)
         test_clock_cycles(chip)
         test_sample_generation(chip)
+        test_render_matches_clock()
+        test_state_view()
+        test_snapshot_restore()
+        test_scheduled_events()
+        test_ring_buffer()
+        test_stream_player_errors()
+        test_resampler()
+        test_batch_render()
+        test_threaded_render()
+        test_vgm_stream()
+        test_vgm_loops()
+        test_render_to_file()
+        test_benchmarks()
+        test_golden_corpus()
+        test_silence_skip()
+        test_channel_stems()
+        test_voice_bank()
+        test_midi()
+        test_pitch()
+        test_timer_driver()
+        test_recorder()
+        test_render_cache()
         
         print()
         print("=" * 60)
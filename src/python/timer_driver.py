@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Timer-paced music driver loop.
+
+YM2151 sound drivers run from the chip's timer interrupts: Timer A or B
+overflows at a programmed rate and the interrupt handler advances the
+song by one tick. TimerDriver emulates that loop. render() runs the chip
+in native spans that end at the next timer interrupt
+(NukedOPM.render_until_irq), calls a Python tick function there with the
+chip at that exact sample, then acknowledges the flag. Python work
+therefore scales with the tick rate (hundreds per second), not with the
+number of chip cycles.
+
+    python timer_driver.py                   # play the demo arpeggio
+    python timer_driver.py -o arpeggio.wav   # render it to a file
+"""
+import argparse
+import sys
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from audio_file import render_to_file
+from midi import DEFAULT_BANK
+from nuked_opm import TIMER_A, TIMER_B, NukedOPM
+from pitch import pitch_table
+from resampler import Resampler
+from stream_player import StreamingPlayer, native_source
+from voice_bank import VoiceBank
+
+# Master clock assumed when none is given
+DEFAULT_CLOCK = 4_000_000
+
+# Master clocks per timer A step and per timer B step (one native sample
+# and 16 native samples)
+TIMER_A_CLOCKS = 64
+TIMER_B_CLOCKS = 1024
+
+# Register 0x14 bits
+CONTROL_LOAD_A = 0x01
+CONTROL_LOAD_B = 0x02
+CONTROL_IRQ_A = 0x04
+CONTROL_IRQ_B = 0x08
+CONTROL_RESET_SHIFT = 4  # flag reset bits are the timer flags shifted by this
+CONTROL_RESET = (TIMER_A | TIMER_B) << CONTROL_RESET_SHIFT
+
+
+def timer_a_hz(value: int, clock: float = DEFAULT_CLOCK) -> float:
+    """Overflow rate of timer A for a 10-bit NA value"""
+    return clock / (TIMER_A_CLOCKS * (1024 - value))
+
+
+def timer_b_hz(value: int, clock: float = DEFAULT_CLOCK) -> float:
+    """Overflow rate of timer B for an 8-bit NB value"""
+    return clock / (TIMER_B_CLOCKS * (256 - value))
+
+
+def timer_a_value(hz: float, clock: float = DEFAULT_CLOCK) -> int:
+    """Timer A value (NA) closest to an overflow rate, clamped to 0-1023"""
+    return min(max(1024 - round(clock / (TIMER_A_CLOCKS * hz)), 0), 1023)
+
+
+def timer_b_value(hz: float, clock: float = DEFAULT_CLOCK) -> int:
+    """Timer B value (NB) closest to an overflow rate, clamped to 0-255"""
+    return min(max(256 - round(clock / (TIMER_B_CLOCKS * hz)), 0), 255)
+
+
+class TimerDriver:
+    """
+    Calls a tick function on every emulated timer interrupt
+
+    The tick function receives the driver and the raised flags (TIMER_A,
+    TIMER_B or both) and queues register writes with write(); they are
+    scheduled at the interrupt's sample in one call after it returns.
+    Writes to register 0x14 update control, which the driver reuses to
+    acknowledge flags.
+    """
+
+    def __init__(self, tick: Callable[['TimerDriver', int], None],
+                 chip: Optional[NukedOPM] = None):
+        """
+        Args:
+            tick: Function called with the driver and the raised timer flags
+            chip: Chip to drive (default: a new NukedOPM)
+        """
+        self.tick = tick
+        self.chip = chip if chip is not None else NukedOPM()
+        self.control = 0  # register 0x14 without the flag reset bits
+        self.ticks = 0
+        self._writes: List[Tuple[int, int, int]] = []
+
+    def write(self, address: int, data: int):
+        """Queue a register write at the current sample"""
+        if address == 0x14:
+            self.control = data & ~CONTROL_RESET
+        self._writes.append((0, address, data))
+
+    def flush(self):
+        """Schedule the writes queued since the last flush"""
+        if self._writes:
+            self.chip.schedule(self._writes)
+            self._writes = []
+
+    def start_timer_a(self, value: int):
+        """Load timer A with NA (0-1023) and enable its interrupt"""
+        self.write(0x10, value >> 2)
+        self.write(0x11, value & 0x03)
+        self.write(0x14, self.control | CONTROL_LOAD_A | CONTROL_IRQ_A)
+        self.flush()
+
+    def start_timer_b(self, value: int):
+        """Load timer B with NB (0-255) and enable its interrupt"""
+        self.write(0x12, value)
+        self.write(0x14, self.control | CONTROL_LOAD_B | CONTROL_IRQ_B)
+        self.flush()
+
+    def stop(self, timers: int = TIMER_A | TIMER_B):
+        """Stop timers (a mask of TIMER_A and TIMER_B) and clear their flags"""
+        mask = (CONTROL_LOAD_A | CONTROL_IRQ_A if timers & TIMER_A else 0) | (
+            CONTROL_LOAD_B | CONTROL_IRQ_B if timers & TIMER_B else 0)
+        self.write(0x14, (self.control & ~mask) | (timers << CONTROL_RESET_SHIFT))
+        self.flush()
+
+    def render(self, num_samples: int) -> np.ndarray:
+        """
+        Render samples, ticking the driver at every timer interrupt
+
+        Returns:
+            int32 array of shape (num_samples, 2)
+        """
+        out = np.empty((num_samples, 2), dtype=np.int32)
+        position = 0
+        while position < num_samples:
+            block, raised = self.chip.render_until_irq(num_samples - position,
+                                                       out=out[position:])
+            position += len(block)
+            if raised:
+                self.ticks += 1
+                # Acknowledge first so that the flag clears as early as the
+                # chip's write timing allows
+                self._writes.append((0, 0x14, self.control | (raised << CONTROL_RESET_SHIFT)))
+                self.tick(self, raised)
+                self.flush()
+        return out
+
+
+class Arpeggio:
+    """Demo tick function: a looping arpeggio, one note per step"""
+
+    NOTES = (60, 64, 67, 72, 76, 72, 67, 64)
+
+    def __init__(self, bank: VoiceBank, clock: float, ticks_per_step: int):
+        self.bank = bank
+        self.pitch = pitch_table(clock)
+        self.ticks_per_step = ticks_per_step
+        self.count = 0
+        self.patch = bank[next(iter(bank.patches))]
+
+    def __call__(self, driver: TimerDriver, raised: int):
+        if self.count == 0:
+            for address, data in self.bank.registers(self.patch.number, 0).tolist():
+                driver.write(address, data)
+        if self.count % self.ticks_per_step == 0:
+            note = self.NOTES[self.count // self.ticks_per_step % len(self.NOTES)]
+            kc, kf = self.pitch.from_note(note)
+            driver.write(0x08, 0)
+            driver.write(0x28, int(kc))
+            driver.write(0x30, int(kf))
+            driver.write(0x08, self.patch.key_on(0))
+        self.count += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timer B paced arpeggio demo")
+    parser.add_argument("-o", "--output", help="Write a WAV or FLAC file instead of playing")
+    parser.add_argument("--bank", default=DEFAULT_BANK, help="Voice bank (.opm)")
+    parser.add_argument("--bpm", type=float, default=120.0, help="Tempo (default: 120)")
+    parser.add_argument("--seconds", type=float, default=4.0, help="Length (default: 4)")
+    parser.add_argument("--rate", type=int, default=48000,
+                        help="Playback sample rate (default: 48000)")
+    args = parser.parse_args()
+
+    try:
+        bank = VoiceBank.load(args.bank)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    # 48 ticks per quarter note, 16th-note steps
+    ticks_per_quarter = 48
+    value = timer_b_value(args.bpm / 60 * ticks_per_quarter)
+    driver = TimerDriver(Arpeggio(bank, DEFAULT_CLOCK, ticks_per_quarter // 4))
+    driver.start_timer_b(value)
+
+    sample_rate = DEFAULT_CLOCK / 64
+    remaining = int(args.seconds * sample_rate)
+
+    def render(n: int) -> np.ndarray:
+        nonlocal remaining
+        n = min(n, remaining)
+        remaining -= n
+        return driver.render(n)
+
+    print(f"Timer B = {value} ({timer_b_hz(value):.1f} ticks/s)")
+    if args.output:
+        render_to_file(render, args.output, sample_rate)
+        print(f"Wrote {args.output}")
+    else:
+        source = native_source(render, resampler=Resampler(sample_rate, args.rate))
+        try:
+            with StreamingPlayer(source, args.rate) as player:
+                player.wait()
+        except KeyboardInterrupt:
+            print("\nPlayback interrupted by user")
+    print(f"{driver.ticks} ticks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
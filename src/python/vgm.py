@@ -0,0 +1,727 @@
+#!/usr/bin/env python3
+"""
+VGM / VGZ player for YM2151 streams.
+
+The file is decoded as a stream (gzip for .vgz), parsed in fixed-size
+chunks into numpy arrays of YM2151 register writes, and fed to NukedOPM
+as scheduled events ahead of each natively rendered block. Memory use is
+bounded by the chunk size regardless of file length.
+
+Looping files can be played for several passes over their loop section.
+Every repeat starts at a whole native sample and sees the same writes at
+the same offsets, so when the chip state at the start of a repeat
+equals the state at the start of an earlier one, the output from there
+on is a copy of what was already rendered. The stream keeps the
+recent repeats and replays them instead of clocking the chip. The
+comparison leaves out state that cannot reach the output during the loop:
+the noise generator while noise stays off, the LFO while it modulates no
+channel, and the phase of operators that have fully released. The
+envelope timer paces every envelope and is always compared, so a repeat
+is only found when the loop length lines up with its period.
+"""
+import argparse
+import ctypes
+import gzip
+import hashlib
+import struct
+import sys
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from audio_file import render_stems_to_files, render_to_file
+from nuked_opm import CLOCKS_PER_SAMPLE, NukedOPM
+from opm_struct import OPM_DTYPE, OPM_Stream, OPM_t
+from resampler import Resampler
+from stream_player import StreamingPlayer, native_source
+
+# VGM timing base: all waits are in samples at 44.1 kHz
+VGM_SAMPLE_RATE = 44100
+
+# YM2151 clock used when the header does not specify one
+DEFAULT_YM2151_CLOCK = 3579545
+
+# Bytes of command data parsed per chunk
+READ_CHUNK = 64 * 1024
+
+# Native samples rendered per block
+RENDER_BLOCK = 4096
+
+# Loop passes kept for replay when the chip state repeats
+LOOP_HISTORY = 4
+
+# Offset of the stream cycle counter in NukedOPM.snapshot()
+_CYCLE_OFFSET = ctypes.sizeof(OPM_t) + OPM_Stream.cycle.offset
+
+# Envelope state and level of an operator that has fully released
+_EG_RELEASE = 3
+_EG_SILENT = 0x3FF
+
+# Noise generator state; only reaches the output with noise enabled or
+# through the LFO noise waveform
+_NOISE_FIELDS = ('noise_lfsr', 'noise_timer', 'noise_timer_of', 'noise_update', 'noise_temp',
+                 'nc_active', 'nc_active_lock', 'nc_sign', 'nc_sign_lock', 'nc_sign_lock2',
+                 'nc_bit', 'nc_out')
+
+# LFO phase and output; only reach the output when a nonzero depth meets a
+# channel with nonzero sensitivity
+_LFO_FIELDS = ('lfo_am_lock', 'lfo_pm_lock', 'lfo_counter1', 'lfo_counter1_of1',
+               'lfo_counter1_of2', 'lfo_counter2', 'lfo_counter2_load', 'lfo_counter2_of',
+               'lfo_counter2_of_lock', 'lfo_counter2_of_lock2', 'lfo_counter3_clock',
+               'lfo_counter3', 'lfo_counter3_step', 'lfo_frq_update', 'lfo_clock',
+               'lfo_clock_lock', 'lfo_clock_test', 'lfo_val', 'lfo_val_carry', 'lfo_out1',
+               'lfo_out2', 'lfo_out2_b', 'lfo_mult_carry', 'lfo_trig_sign', 'lfo_saw_sign',
+               'lfo_bit_counter')
+
+# Operator pipeline derived from the phase of the slots it holds at a
+# sample boundary (slots 24-31); a silent slot outputs 0 whatever its phase
+_OPERATOR_PHASE_FIELDS = ('op_phase_in', 'op_phase', 'op_logsin', 'op_sign', 'op_atten',
+                          'op_exp', 'op_pow')
+_PIPELINE_SLOTS = slice(24, 32)
+
+# Padding bytes of OPM_t, which the emulator never writes
+_PADDING = np.ones(OPM_DTYPE.itemsize, dtype=bool)
+for _name in OPM_DTYPE.names:
+    _field, _offset = OPM_DTYPE.fields[_name][:2]
+    _PADDING[_offset:_offset + _field.itemsize] = False
+
+# Register write in VGM time (samples at 44.1 kHz since the start of data)
+VGM_EVENT_DTYPE = np.dtype([
+    ('time', np.int64),
+    ('address', np.uint8),
+    ('data', np.uint8),
+])
+
+# Operand byte counts for commands that are skipped (0x64 overrides a wait
+# length, 0x68 copies PCM data); any other command is an error
+_SKIP_LENGTHS = {0x4F: 1, 0x50: 1, 0x64: 3, 0x68: 11,
+                 0x90: 4, 0x91: 4, 0x92: 5, 0x93: 10, 0x94: 1, 0x95: 4}
+for _cmd in range(0x30, 0x40):
+    _SKIP_LENGTHS[_cmd] = 1
+for _cmd in list(range(0x40, 0x4F)) + list(range(0x51, 0x60)) + list(range(0xA0, 0xC0)):
+    _SKIP_LENGTHS.setdefault(_cmd, 2)
+for _cmd in range(0xC0, 0xE0):
+    _SKIP_LENGTHS[_cmd] = 3
+for _cmd in range(0xE0, 0x100):
+    _SKIP_LENGTHS[_cmd] = 4
+
+
+class VGMHeader(NamedTuple):
+    """Fields of the VGM header used by the player"""
+    version: int
+    total_samples: int
+    loop_offset: int  # absolute file offset of the loop point, 0 if none
+    loop_samples: int
+    ym2151_clock: int
+    data_offset: int  # absolute file offset of the command data
+
+
+def open_vgm(path: str) -> BinaryIO:
+    """Open a .vgm or .vgz file as a decompressed binary stream"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_header(f: BinaryIO) -> VGMHeader:
+    """
+    Read the VGM header and position f at the start of the command data
+
+    Raises:
+        ValueError: If the stream is not a VGM file
+    """
+    head = f.read(0x40)
+    if len(head) < 0x40 or head[:4] != b'Vgm ':
+        raise ValueError("Not a VGM file")
+
+    version = struct.unpack_from('<I', head, 0x08)[0]
+    total_samples, loop_offset, loop_samples = struct.unpack_from('<III', head, 0x18)
+    ym2151_clock = struct.unpack_from('<I', head, 0x30)[0] if version >= 0x110 else 0
+    data_offset = 0x40
+    if version >= 0x150:
+        relative = struct.unpack_from('<I', head, 0x34)[0]
+        if relative:
+            data_offset = 0x34 + relative
+
+    # Skip the rest of the (extended) header
+    if data_offset > 0x40:
+        f.read(data_offset - 0x40)
+
+    return VGMHeader(
+        version=version,
+        total_samples=total_samples,
+        loop_offset=0x1C + loop_offset if loop_offset else 0,
+        loop_samples=loop_samples,
+        # Bit 30 selects dual chip mode, bit 31 is reserved
+        ym2151_clock=ym2151_clock & 0x3FFFFFFF,
+        data_offset=data_offset,
+    )
+
+
+def iter_ym2151_writes(f: BinaryIO, chunk_size: int = READ_CHUNK) -> Iterator[np.ndarray]:
+    """
+    Parse VGM command data into YM2151 register writes
+
+    Commands for other chips and the second YM2151 are skipped.
+
+    Args:
+        f: Stream positioned at the start of the command data
+        chunk_size: Bytes read per chunk
+
+    Yields:
+        VGM_EVENT_DTYPE arrays in time order; the final array may be empty
+        and carries no special meaning
+
+    Raises:
+        ValueError: On a command whose length is unknown
+    """
+    time = 0
+    pending = b''
+    finished = False
+    while not finished:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        data = pending + chunk
+        size = len(data)
+        times = []
+        addresses = []
+        values = []
+        pos = 0
+        while pos < size:
+            cmd = data[pos]
+            if cmd == 0x54:
+                if pos + 3 > size:
+                    break
+                times.append(time)
+                addresses.append(data[pos + 1])
+                values.append(data[pos + 2])
+                pos += 3
+            elif 0x70 <= cmd <= 0x7F:
+                time += (cmd & 0x0F) + 1
+                pos += 1
+            elif cmd == 0x61:
+                if pos + 3 > size:
+                    break
+                time += data[pos + 1] | (data[pos + 2] << 8)
+                pos += 3
+            elif cmd == 0x62:
+                time += 735
+                pos += 1
+            elif cmd == 0x63:
+                time += 882
+                pos += 1
+            elif cmd == 0x66:
+                finished = True
+                break
+            elif cmd == 0x67:
+                # Data block: 0x67 0x66 tt ssssssss <data>
+                if pos + 7 > size:
+                    break
+                block_size = struct.unpack_from('<I', data, pos + 3)[0] & 0x7FFFFFFF
+                if pos + 7 + block_size > size:
+                    break
+                pos += 7 + block_size
+            elif 0x80 <= cmd <= 0x8F:
+                time += cmd & 0x0F
+                pos += 1
+            else:
+                if cmd not in _SKIP_LENGTHS:
+                    raise ValueError(f"Unknown VGM command 0x{cmd:02X}")
+                length = 1 + _SKIP_LENGTHS[cmd]
+                if pos + length > size:
+                    break
+                pos += length
+        pending = data[pos:]
+
+        events = np.empty(len(times), dtype=VGM_EVENT_DTYPE)
+        events['time'] = times
+        events['address'] = addresses
+        events['data'] = values
+        yield events
+
+
+def _wait_commands(samples: int) -> bytes:
+    """Shortest wait commands for a delay in VGM samples"""
+    commands = bytearray()
+    while samples > 0xFFFF:
+        commands += b'\x61\xff\xff'
+        samples -= 0xFFFF
+    if samples == 0:
+        pass
+    elif samples <= 16:
+        commands.append(0x70 + samples - 1)
+    elif samples == 735:
+        commands.append(0x62)
+    elif samples == 882:
+        commands.append(0x63)
+    elif samples <= 32:
+        commands += bytes((0x7F, 0x70 + samples - 17))
+    else:
+        commands += b'\x61' + struct.pack('<H', samples)
+    return bytes(commands)
+
+
+def encode_vgm(events: np.ndarray, clock: int = DEFAULT_YM2151_CLOCK,
+               total_samples: int = 0) -> bytes:
+    """
+    Build a VGM 1.61 file from YM2151 register writes
+
+    Writes at the same time share one position; the delay between
+    consecutive times becomes a single run of wait commands.
+
+    Args:
+        events: VGM_EVENT_DTYPE array in time order
+        clock: YM2151 master clock for the header in Hz
+        total_samples: Length in VGM samples (at least the last write time)
+
+    Returns:
+        File contents (uncompressed)
+    """
+    times = events['time']
+    if len(times) and (times[0] < 0 or (np.diff(times) < 0).any()):
+        raise ValueError("Event times must be non-negative and in order")
+    total_samples = max(total_samples, int(times[-1]) if len(times) else 0)
+
+    commands = bytearray()
+    now = 0
+    for time, address, data in zip(times.tolist(), events['address'].tolist(),
+                                   events['data'].tolist()):
+        if time != now:
+            commands += _wait_commands(time - now)
+            now = time
+        commands += bytes((0x54, address, data))
+    commands += _wait_commands(total_samples - now)
+    commands.append(0x66)
+
+    header = bytearray(0x80)
+    header[0:4] = b'Vgm '
+    struct.pack_into('<I', header, 0x04, len(header) + len(commands) - 0x04)
+    struct.pack_into('<I', header, 0x08, 0x161)
+    struct.pack_into('<I', header, 0x18, total_samples)
+    struct.pack_into('<I', header, 0x30, clock)
+    struct.pack_into('<I', header, 0x34, len(header) - 0x34)
+    return bytes(header) + bytes(commands)
+
+
+def write_vgm(path: str, events: np.ndarray, clock: int = DEFAULT_YM2151_CLOCK,
+              total_samples: int = 0):
+    """Write register writes as a .vgm file, or gzip-compressed for .vgz"""
+    data = encode_vgm(events, clock, total_samples)
+    opener = gzip.open if path.lower().endswith('.vgz') else open
+    with opener(path, 'wb') as f:
+        f.write(data)
+
+
+class LoopWrites(NamedTuple):
+    """What the writes of the loop section can switch on"""
+    noise: bool             # noise enable (0x0F bit 7)
+    lfo_depth: bool         # nonzero AMD or PMD (0x19)
+    lfo_sensitivity: bool   # nonzero PMS or AMS (0x38-0x3F)
+
+
+def scan_loop_writes(f: BinaryIO) -> LoopWrites:
+    """
+    Find what the writes from the current position to the end can switch on
+
+    Args:
+        f: Stream positioned at the loop point
+    """
+    noise = lfo_depth = lfo_sensitivity = False
+    for events in iter_ym2151_writes(f):
+        address = events['address']
+        data = events['data']
+        noise |= bool(np.any((address == 0x0F) & (data & 0x80 != 0)))
+        lfo_depth |= bool(np.any((address == 0x19) & (data & 0x7F != 0)))
+        lfo_sensitivity |= bool(np.any((address >= 0x38) & (address < 0x40)
+                                       & (data & 0x73 != 0)))
+    return LoopWrites(noise, lfo_depth, lfo_sensitivity)
+
+
+class LoopPass(NamedTuple):
+    """A rendered repeat of the loop section"""
+    key: bytes        # _state_key() of state
+    state: bytes      # _output_state() at its start
+    snapshot: bytes   # NukedOPM.snapshot() at its start
+    pcm: np.ndarray   # its output
+
+
+def _output_state(snapshot: bytes, writes: LoopWrites) -> bytes:
+    """
+    The part of a snapshot that can affect the output of the loop section
+
+    The cycle counter is dropped, and state that cannot reach the output
+    while the section plays is zeroed. Which state that is depends only on
+    fields that are kept, so equal results mean equal output.
+
+    Args:
+        snapshot: NukedOPM.snapshot() at the start of a repeat
+        writes: What the writes of the section can switch on
+    """
+    size = ctypes.sizeof(OPM_t)
+    data = np.frombuffer(snapshot, dtype=np.uint8, count=size).copy()
+    data[_PADDING] = 0
+    state = data.view(OPM_DTYPE).reshape(())
+
+    lfo = ((state['lfo_amd'] != 0 or state['lfo_pmd'] != 0 or writes.lfo_depth)
+           and (state['ch_ams'].any() or state['ch_pms'].any() or writes.lfo_sensitivity))
+    if not lfo:
+        for name in _LFO_FIELDS:
+            state[name] = 0
+    if not lfo and not state['noise_en'] and not writes.noise:
+        for name in _NOISE_FIELDS:
+            state[name] = 0
+
+    # A released slot stays silent until a key-on, which resets its phase
+    silent = (state['eg_state'] == _EG_RELEASE) & (state['eg_level'] == _EG_SILENT)
+    state['pg_phase'][silent] = 0
+    if silent[_PIPELINE_SLOTS].all():
+        for name in _OPERATOR_PHASE_FIELDS:
+            state[name] = 0
+
+    return (data.tobytes() + snapshot[size:_CYCLE_OFFSET]
+            + snapshot[_CYCLE_OFFSET + 8:])
+
+
+def _state_key(state: bytes) -> bytes:
+    """Hash of an _output_state()"""
+    return hashlib.blake2b(state, digest_size=16).digest()
+
+
+class VGMStream:
+    """Renders a VGM file through NukedOPM in native-rate blocks"""
+
+    def __init__(self, path: str, chip: Optional[NukedOPM] = None, loops: int = 1,
+                 cache_loops: bool = True, loop_history: int = LOOP_HISTORY):
+        """
+        Open a VGM / VGZ file
+
+        Args:
+            path: File path
+            chip: Chip to render with (default: a new NukedOPM)
+            loops: Passes through the loop section, counting the one in
+                the file (ignored for files without a loop)
+            cache_loops: Replay earlier repeats once the chip state repeats
+            loop_history: Repeats kept for replay (their output is held in
+                memory)
+        """
+        self._file = open_vgm(path)
+        self.header = read_header(self._file)
+        self.clock = self.header.ym2151_clock or DEFAULT_YM2151_CLOCK
+        self.chip = chip if chip is not None else NukedOPM()
+
+        self._chunks = iter_ym2151_writes(self._file)
+        self._events = np.empty(0, dtype=VGM_EVENT_DTYPE)
+        self._exhausted = False
+        self._start_cycle = self.chip.cycle
+        self._base_cycle = 0  # cycle of VGM time 0 of the current source
+
+        # Length in native samples; 0 if the header does not give one, in
+        # which case the stream ends after the last register write
+        self.total_samples = self.vgm_to_native(self.header.total_samples)
+        self.position = 0
+
+        # Repeats of the loop section follow the file's own data, each
+        # loop_length samples long (rounded down to whole samples)
+        self.loop_start = self.total_samples
+        self.loop_length = self.vgm_to_native(self.header.loop_samples)
+        self.loops = 1
+        if (loops > 1 and self.total_samples and self.loop_length
+                and self.header.loop_offset >= self.header.data_offset):
+            self.loops = loops
+            self.total_samples += (loops - 1) * self.loop_length
+        self.cache_loops = cache_loops
+        self.loop_history = loop_history
+        self.replayed_samples = 0  # samples copied from earlier repeats
+        self._history: List[LoopPass] = []
+        self._recording: Optional[Tuple[bytes, bytes, bytes, list]] = None
+        self._replay: Optional[List[LoopPass]] = None
+        self._replay_from = 0  # repeat index where the replay starts
+        self._loop_writes: Optional[LoopWrites] = None
+
+    @property
+    def sample_rate(self) -> float:
+        """Native chip sample rate in Hz"""
+        return self.clock / 64
+
+    def vgm_to_cycle(self, vgm_samples):
+        """Convert VGM sample times (44.1 kHz) to chip cycles"""
+        return (np.asarray(vgm_samples, dtype=np.int64) * (self.clock * CLOCKS_PER_SAMPLE)
+                // (64 * VGM_SAMPLE_RATE))
+
+    def vgm_to_native(self, vgm_samples: int) -> int:
+        """Convert a VGM sample count to native chip samples"""
+        return int(vgm_samples * self.clock // (64 * VGM_SAMPLE_RATE))
+
+    def _schedule_until(self, end_cycle: int):
+        """Hand every write before end_cycle (relative to the start) to the chip"""
+        while not self._exhausted and (
+                not len(self._events)
+                or self._base_cycle + self.vgm_to_cycle(self._events['time'][-1]) < end_cycle):
+            try:
+                self._events = np.concatenate((self._events, next(self._chunks)))
+            except StopIteration:
+                self._exhausted = True
+
+        if not len(self._events):
+            return
+        cycles = self._base_cycle + self.vgm_to_cycle(self._events['time'])
+        count = int(np.searchsorted(cycles, end_cycle, side='left'))
+        if count == 0:
+            return
+        now = self.chip.cycle - self._start_cycle
+        batch = np.empty((count, 3), dtype=np.int64)
+        batch[:, 0] = np.maximum(cycles[:count] - now, 0)
+        batch[:, 1] = self._events['address'][:count]
+        batch[:, 2] = self._events['data'][:count]
+        self.chip.schedule(batch)
+        self._events = self._events[count:]
+
+    def _repeat(self, position: int) -> int:
+        """Index of the repeat containing a position (0 before the first)"""
+        if self.loops == 1 or position < self.loop_start:
+            return 0
+        return (position - self.loop_start) // self.loop_length + 1
+
+    def _repeat_start(self, repeat: int) -> int:
+        """Position where a repeat (1 or more) starts"""
+        return self.loop_start + (repeat - 1) * self.loop_length
+
+    def _begin_repeat(self):
+        """Rewind the writes to the loop point and look for a repeated state"""
+        if self._replay is not None:
+            return
+        if self._loop_writes is None and self.cache_loops:
+            self._file.seek(self.header.loop_offset)
+            self._loop_writes = scan_loop_writes(self._file)
+        self._file.seek(self.header.loop_offset)
+        self._chunks = iter_ym2151_writes(self._file)
+        self._events = np.empty(0, dtype=VGM_EVENT_DTYPE)
+        self._exhausted = False
+        self._base_cycle = self.position * CLOCKS_PER_SAMPLE
+
+        if self._recording is not None:
+            key, state, snapshot, blocks = self._recording
+            self._history.append(LoopPass(key, state, snapshot, np.concatenate(blocks)))
+            del self._history[:-self.loop_history]
+            self._recording = None
+        # Writes still queued in Python are not part of the snapshot
+        if not self.cache_loops or self.loop_history <= 0 or self.chip.pending_events:
+            return
+        snapshot = self.chip.snapshot()
+        state = _output_state(snapshot, self._loop_writes)
+        key = _state_key(state)
+        for index, earlier in enumerate(self._history):
+            if earlier.key == key and earlier.state == state:
+                self._replay = self._history[index:]
+                self._replay_from = self._repeat(self.position)
+                self._history = []
+                return
+        self._recording = (key, state, snapshot, [])
+
+    def _sync_chip(self):
+        """
+        Put the chip in the state emulation would reach at this position
+
+        State left out of the comparison comes from the earlier repeat, so
+        it may differ from emulation; it cannot affect the loop section.
+        """
+        repeat = self._repeat(self.position)
+        cycle = self._start_cycle + self.position * CLOCKS_PER_SAMPLE
+        snapshot = self._replay[(repeat - self._replay_from) % len(self._replay)].snapshot
+        self.chip.restore(snapshot[:_CYCLE_OFFSET] + struct.pack('<Q', cycle)
+                          + snapshot[_CYCLE_OFFSET + 8:])
+
+    def _next_block(self, num_samples: int) -> int:
+        """Clamp a block to the stream end and schedule the writes it covers"""
+        if self.total_samples:
+            num_samples = min(num_samples, self.total_samples - self.position)
+        elif self._exhausted and not len(self._events) and not self.chip.pending_events:
+            num_samples = 0
+        if num_samples <= 0:
+            return 0
+        if self.loops > 1:
+            # Blocks end at repeat boundaries
+            repeat = self._repeat(self.position)
+            num_samples = min(num_samples, self._repeat_start(repeat + 1) - self.position)
+            if repeat and self.position == self._repeat_start(repeat):
+                self._begin_repeat()
+        if self._replay is None:
+            self._schedule_until((self.position + num_samples) * CLOCKS_PER_SAMPLE)
+        self.position += num_samples
+        return num_samples
+
+    def render(self, num_samples: int) -> np.ndarray:
+        """
+        Render the next block at the native rate
+
+        Args:
+            num_samples: Maximum number of native samples
+
+        Returns:
+            int32 array of shape (n, 2); shorter than num_samples (possibly
+            empty) at the end of the stream. Replayed blocks are read-only
+            views of earlier output.
+        """
+        start = self.position
+        num_samples = self._next_block(num_samples)
+        if self._replay is None:
+            block = self.chip.render(num_samples)
+            if self._recording is not None and num_samples:
+                self._recording[3].append(block.copy())
+            return block
+
+        # The chip is not clocked while replaying; it is brought to the
+        # matching state at every repeat boundary
+        repeat = self._repeat(start)
+        offset = start - self._repeat_start(repeat)
+        earlier = self._replay[(repeat - self._replay_from) % len(self._replay)]
+        block = earlier.pcm[offset:offset + num_samples]
+        block.flags.writeable = False
+        self.replayed_samples += num_samples
+        if num_samples and (self.position == self.total_samples
+                            or self._repeat(self.position) != repeat):
+            self._sync_chip()
+        return block
+
+    def render_stems(self, num_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Render the next block with per-channel output
+
+        Loop caching covers the mix only, so it stops for the rest of the
+        stream; use cache_loops=False for streams rendered this way.
+
+        Returns:
+            (mix, stems) as from NukedOPM.render_stems(), shorter than
+            num_samples (possibly empty) at the end of the stream
+
+        Raises:
+            RuntimeError: If render() is already replaying a repeat
+        """
+        if self._replay is not None:
+            raise RuntimeError("render_stems() cannot follow a replayed loop; "
+                               "open the stream with cache_loops=False")
+        self.cache_loops = False
+        self._history = []
+        self._recording = None
+        return self.chip.render_stems(self._next_block(num_samples))
+
+    def close(self):
+        """Close the underlying file"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def render_vgm_file(stream: VGMStream, path: str, block_size: int = RENDER_BLOCK) -> int:
+    """Render a VGM stream to a 16-bit WAV or FLAC file at the native chip rate"""
+    return render_to_file(stream.render, path, stream.sample_rate, block_size=block_size)
+
+
+def render_vgm_stems(stream: VGMStream, path: str, block_size: int = RENDER_BLOCK) -> list:
+    """Render one 16-bit WAV or FLAC file per YM2151 channel (see stem_paths())"""
+    return render_stems_to_files(stream.render_stems, path, stream.sample_rate,
+                                 block_size=block_size)
+
+
+def compare_silence_skip(path: str, block_size: int = RENDER_BLOCK) -> dict:
+    """
+    Render a VGM file with and without silence skipping and compare
+
+    Returns:
+        Dict like NukedOPM.compare_silence_skip()
+    """
+    with VGMStream(path) as full, VGMStream(path, NukedOPM(skip_silence=True)) as fast:
+        samples = 0
+        first_difference = None
+        max_difference = 0
+        while True:
+            expected = full.render(block_size)
+            actual = fast.render(block_size)
+            if not len(expected):
+                break
+            difference = np.abs(expected.astype(np.int64) - actual)
+            mismatched = np.flatnonzero(difference.any(axis=1))
+            if first_difference is None and len(mismatched):
+                first_difference = samples + int(mismatched[0])
+            max_difference = max(max_difference, int(difference.max()))
+            samples += len(expected)
+        return {
+            "samples": samples,
+            "skipped": fast.chip.skipped_samples,
+            "first_difference": first_difference,
+            "max_difference": max_difference,
+        }
+
+
+def play(stream: VGMStream, sample_rate: int):
+    """Play a VGM stream on the default sound device"""
+    resampler = Resampler(stream.sample_rate, sample_rate)
+    source = native_source(lambda n: stream.render(max(n, RENDER_BLOCK)), resampler=resampler)
+    with StreamingPlayer(source, sample_rate) as player:
+        player.wait()
+    if player.underruns:
+        print(f"Buffer underruns: {player.underruns}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YM2151 VGM/VGZ player")
+    parser.add_argument("path", help="VGM or VGZ file")
+    parser.add_argument("-o", "--output", help="Write a WAV or FLAC file instead of playing")
+    parser.add_argument("--rate", type=int, default=48000,
+                        help="Playback sample rate (default: 48000)")
+    parser.add_argument("--stems", action="store_true",
+                        help="With -o, write one file per channel (NAME_ch1.wav ...)")
+    parser.add_argument("--skip-silence", action="store_true",
+                        help="Skip emulation while the chip is silent")
+    parser.add_argument("--loops", type=int, default=1,
+                        help="Passes through the loop section (default: 1)")
+    parser.add_argument("--no-loop-cache", action="store_true",
+                        help="Emulate every loop pass even if the chip state repeats")
+    parser.add_argument("--verify-skip", action="store_true",
+                        help="Compare --skip-silence against full emulation and exit")
+    args = parser.parse_args()
+
+    if args.verify_skip:
+        result = compare_silence_skip(args.path)
+        print(f"Skipped {result['skipped']} of {result['samples']} samples")
+        if result["first_difference"] is None:
+            print("✓ Identical to full emulation")
+            return 0
+        print(f"✗ First difference at sample {result['first_difference']}, "
+              f"max {result['max_difference']}")
+        return 1
+
+    chip = NukedOPM(skip_silence=args.skip_silence)
+    cache_loops = not (args.no_loop_cache or args.stems)
+    with VGMStream(args.path, chip, loops=args.loops, cache_loops=cache_loops) as stream:
+        seconds = stream.total_samples / stream.sample_rate
+        print(f"VGM {stream.header.version >> 8:x}.{stream.header.version & 0xFF:02x}, "
+              f"YM2151 clock {stream.clock} Hz, length {seconds:.1f} s")
+        if args.output:
+            if args.stems:
+                for path in render_vgm_stems(stream, args.output):
+                    print(f"Wrote {path}")
+            else:
+                render_vgm_file(stream, args.output)
+                print(f"Wrote {args.output}")
+            if args.skip_silence:
+                print(f"Skipped {stream.chip.skipped_samples} silent samples")
+            if stream.replayed_samples:
+                print(f"Replayed {stream.replayed_samples} samples of repeated loop passes")
+        else:
+            try:
+                play(stream, args.rate)
+            except KeyboardInterrupt:
+                print("\nPlayback interrupted by user")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Voice (patch) banks in the VOPM .opm text format.
+
+A bank holds numbered patches:
+
+    @:0 Name
+    LFO: LFRQ AMD PMD WF NFRQ
+    CH:  PAN FL CON AMS PMS SLOT NE
+    M1:  AR D1R D2R RR D1L TL KS MUL DT1 DT2 AMS-EN
+    C1:  ...
+    M2:  ...
+    C2:  ...
+
+'//' starts a comment. Patches are validated on load and compiled into
+flat (address, data) register arrays for a given channel. Compiled arrays
+are kept in an LRU cache, so switching voices costs one scheduled bulk
+write instead of a Python loop over registers.
+
+    python voice_bank.py voices/basic.opm     # list and validate a bank
+"""
+import argparse
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from nuked_opm import NukedOPM
+
+# Operator lines in file order, with their slot offset from the channel
+# (slot = channel + 8 * index in the chip's M1, M2, C1, C2 order)
+OPERATOR_NAMES = ('M1', 'C1', 'M2', 'C2')
+OPERATOR_OFFSETS = {'M1': 0, 'M2': 8, 'C1': 16, 'C2': 24}
+
+# Compiled patches kept by the default cache
+DEFAULT_CACHE_SIZE = 256
+
+
+class Operator(NamedTuple):
+    """One operator line (field order as in the file)"""
+    ar: int
+    d1r: int
+    d2r: int
+    rr: int
+    d1l: int
+    tl: int
+    ks: int
+    mul: int
+    dt1: int
+    dt2: int
+    ams_en: int
+
+
+class Patch(NamedTuple):
+    """One voice; operators are in file order (M1, C1, M2, C2)"""
+    number: int
+    name: str
+    lfo: Tuple[int, int, int, int, int]  # LFRQ, AMD, PMD, WF, NFRQ
+    pan: int
+    fl: int
+    con: int
+    ams: int
+    pms: int
+    slot: int
+    ne: int
+    operators: Tuple[Operator, Operator, Operator, Operator]
+
+    def key_on(self, channel: int) -> int:
+        """Key on register (0x08) value for this patch's operators on channel"""
+        return (self.slot & 0x78) | channel
+
+
+# Field name -> largest valid value
+OPERATOR_LIMITS = {'ar': 31, 'd1r': 31, 'd2r': 31, 'rr': 15, 'd1l': 15, 'tl': 127,
+                   'ks': 3, 'mul': 15, 'dt1': 7, 'dt2': 3, 'ams_en': 128}
+CHANNEL_LIMITS = {'pan': 192, 'fl': 7, 'con': 7, 'ams': 3, 'pms': 7, 'slot': 120, 'ne': 128}
+LFO_LIMITS = {'lfrq': 255, 'amd': 127, 'pmd': 127, 'wf': 3, 'nfrq': 31}
+
+# Fields that VOPM writes as 0 / 128 but some banks write as 0 / 1
+FLAG_FIELDS = ('ams_en', 'ne')
+
+_LINE = re.compile(r'^(@|LFO|CH|M1|C1|M2|C2)\s*:\s*(.*)$', re.IGNORECASE)
+
+
+def _values(fields: str, limits: Dict[str, int], where: str) -> Dict[str, int]:
+    """Parse and range-check the numbers of one line"""
+    names = list(limits)
+    try:
+        numbers = [int(value) for value in fields.split()]
+    except ValueError:
+        raise ValueError(f"{where}: expected {len(names)} integers")
+    if len(numbers) != len(names):
+        raise ValueError(f"{where}: expected {len(names)} values "
+                         f"({' '.join(name.upper() for name in names)}), got {len(numbers)}")
+    values = dict(zip(names, numbers))
+    for name, value in values.items():
+        if name in FLAG_FIELDS:
+            if value not in (0, 1, 128):
+                raise ValueError(f"{where}: {name.upper()} must be 0 or 128, got {value}")
+            values[name] = int(value != 0)
+        elif not 0 <= value <= limits[name]:
+            raise ValueError(f"{where}: {name.upper()} must be 0-{limits[name]}, got {value}")
+    if 'pan' in values and values['pan'] & 0x3F:
+        raise ValueError(f"{where}: PAN must be 0, 64, 128 or 192, got {values['pan']}")
+    if 'slot' in values and values['slot'] & ~0x78:
+        raise ValueError(f"{where}: SLOT must be a mask of 8, 16, 32 and 64, got {values['slot']}")
+    return values
+
+
+def parse_opm(text: str, source: str = '<string>') -> List[Patch]:
+    """
+    Parse a .opm bank
+
+    Args:
+        text: File contents
+        source: Name used in error messages
+
+    Returns:
+        Patches in file order
+
+    Raises:
+        ValueError: If a line is malformed, a value is out of range or a
+            patch is incomplete
+    """
+    patches = []
+    current = None
+
+    def finish():
+        missing = [key for key in ('LFO', 'CH') + OPERATOR_NAMES if key not in current['lines']]
+        if missing:
+            raise ValueError(f"{source}:{current['line']}: patch @{current['number']} "
+                             f"is missing {', '.join(missing)}")
+        lines = current['lines']
+        patches.append(Patch(
+            number=current['number'],
+            name=current['name'],
+            lfo=tuple(lines['LFO'].values()),
+            operators=tuple(Operator(**lines[name]) for name in OPERATOR_NAMES),
+            **lines['CH'],
+        ))
+
+    for number, raw in enumerate(text.splitlines(), 1):
+        line = raw.split('//', 1)[0].strip()
+        if not line:
+            continue
+        where = f"{source}:{number}"
+        match = _LINE.match(line)
+        if not match:
+            raise ValueError(f"{where}: unexpected line {line!r}")
+        key, fields = match.group(1).upper(), match.group(2)
+        if key == '@':
+            if current is not None:
+                finish()
+            number_text, _, name = fields.partition(' ')
+            try:
+                patch_number = int(number_text)
+            except ValueError:
+                raise ValueError(f"{where}: expected '@:<number> <name>'")
+            current = {'number': patch_number, 'name': name.strip(), 'line': number, 'lines': {}}
+            continue
+        if current is None:
+            raise ValueError(f"{where}: {key} line before the first '@:' header")
+        if key in current['lines']:
+            raise ValueError(f"{where}: duplicate {key} line in patch @{current['number']}")
+        limits = {'LFO': LFO_LIMITS, 'CH': CHANNEL_LIMITS}.get(key, OPERATOR_LIMITS)
+        current['lines'][key] = _values(fields, limits, where)
+    if current is not None:
+        finish()
+    return patches
+
+
+def compile_patch(patch: Patch, channel: int, lfo: bool = False) -> np.ndarray:
+    """
+    Compile a patch into register writes for one channel
+
+    Args:
+        patch: Patch to compile
+        channel: Target channel (0-7)
+        lfo: Also write the global LFO and noise registers
+
+    Returns:
+        Read-only uint8 array of shape (n, 2) with (address, data) rows
+    """
+    if not 0 <= channel <= 7:
+        raise ValueError(f"Channel must be 0-7, got {channel}")
+    writes = []
+    if lfo:
+        lfrq, amd, pmd, wf, nfrq = patch.lfo
+        writes += [(0x18, lfrq), (0x19, amd), (0x19, 0x80 | pmd), (0x1B, wf),
+                   (0x0F, (patch.ne << 7) | nfrq)]
+    writes += [(0x20 + channel, patch.pan | (patch.fl << 3) | patch.con),
+               (0x38 + channel, (patch.pms << 4) | patch.ams)]
+    for name, op in zip(OPERATOR_NAMES, patch.operators):
+        slot = channel + OPERATOR_OFFSETS[name]
+        writes += [(0x40 + slot, (op.dt1 << 4) | op.mul),
+                   (0x60 + slot, op.tl),
+                   (0x80 + slot, (op.ks << 6) | op.ar),
+                   (0xA0 + slot, (op.ams_en << 7) | op.d1r),
+                   (0xC0 + slot, (op.dt2 << 6) | op.d2r),
+                   (0xE0 + slot, (op.d1l << 4) | op.rr)]
+    registers = np.array(writes, dtype=np.uint8)
+    registers.flags.writeable = False
+    return registers
+
+
+class PatchCache:
+    """
+    LRU cache of compiled patches
+
+    Keys are (patch, channel, lfo); Patch is an immutable NamedTuple, so an
+    edited patch gets a new entry instead of a stale one.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, np.ndarray]' = OrderedDict()
+
+    def get(self, patch: Patch, channel: int, lfo: bool = False) -> np.ndarray:
+        """Compiled registers for a patch, compiling on a miss"""
+        key = (patch, channel, lfo)
+        registers = self._entries.get(key)
+        if registers is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return registers
+        self.misses += 1
+        registers = compile_patch(patch, channel, lfo)
+        self._entries[key] = registers
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return registers
+
+    def clear(self):
+        """Drop every entry and reset the statistics"""
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class VoiceBank:
+    """Patches by number, with compiled registers from a shared cache"""
+
+    def __init__(self, patches: List[Patch], cache: PatchCache = None):
+        self.patches: Dict[int, Patch] = {}
+        for patch in patches:
+            if patch.number in self.patches:
+                raise ValueError(f"Duplicate patch number {patch.number}")
+            self.patches[patch.number] = patch
+        self.cache = cache if cache is not None else PatchCache()
+
+    @classmethod
+    def load(cls, path: str, cache: PatchCache = None) -> 'VoiceBank':
+        """Load a .opm file"""
+        with open(path, encoding='utf-8', errors='replace') as f:
+            return cls(parse_opm(f.read(), path), cache)
+
+    def __getitem__(self, number: int) -> Patch:
+        return self.patches[number]
+
+    def __iter__(self) -> Iterator[Patch]:
+        return iter(self.patches.values())
+
+    def __len__(self) -> int:
+        return len(self.patches)
+
+    def registers(self, number: int, channel: int, lfo: bool = False) -> np.ndarray:
+        """Compiled (address, data) rows for a patch on a channel"""
+        return self.cache.get(self.patches[number], channel, lfo)
+
+    def apply(self, chip: NukedOPM, number: int, channel: int, lfo: bool = False):
+        """
+        Load a patch into a channel
+
+        The writes are scheduled at the chip's current cycle and applied
+        by the next render() with the chip's write timing.
+        """
+        registers = self.registers(number, channel, lfo)
+        events = np.zeros((len(registers), 3), dtype=np.int64)
+        events[:, 1:] = registers
+        chip.schedule(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List and validate a .opm voice bank")
+    parser.add_argument("path", help=".opm bank file")
+    args = parser.parse_args()
+
+    try:
+        bank = VoiceBank.load(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for patch in bank:
+        print(f"@{patch.number:3d} {patch.name} (CON {patch.con}, FL {patch.fl})")
+    print(f"{len(bank)} patches OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,8 @@
 use cpal::traits::{DeviceTrait, HostTrait, StreamTrait};
 use cpal::{FromSample, SizedSample};
 
+mod render;
+
 // YM2151 clock configuration
 const CLOCKS_PER_SAMPLE: usize = 64; // Number of chip clocks per audio sample
 
@@ -41,6 +43,7 @@ extern "C" {
         so: *mut u8,
     );
     fn OPM_Write(chip: *mut OpmChip, port: u32, data: u8);
+    fn OPM_Read(chip: *mut OpmChip, port: u32) -> u8;
     fn OPM_Reset(chip: *mut OpmChip);
 }
 
@@ -76,6 +79,34 @@ impl Ym2151 {
         }
     }
 
+    /// Write one byte to a chip port (0 = address, 1 = data)
+    fn write_port(&mut self, port: u32, data: u8) {
+        unsafe {
+            OPM_Write(self.chip_ptr(), port, data);
+        }
+    }
+
+    /// Whether the chip is still processing the last data write
+    fn is_busy(&mut self) -> bool {
+        unsafe { OPM_Read(self.chip_ptr(), 0) & 0x80 != 0 }
+    }
+
+    /// Advance the chip by one clock, updating the raw stereo output
+    fn clock(&mut self, output: &mut [i32; 2]) {
+        let mut sh1 = 0u8;
+        let mut sh2 = 0u8;
+        let mut so = 0u8;
+        unsafe {
+            OPM_Clock(
+                self.chip_ptr(),
+                output.as_mut_ptr(),
+                &mut sh1,
+                &mut sh2,
+                &mut so,
+            );
+        }
+    }
+
     /// Generate one sample from the chip
     fn generate_sample(&mut self) -> (i16, i16) {
         let mut output = [0i32, 0i32];
@@ -147,6 +178,16 @@ impl Ym2151 {
 }
 
 fn main() {
+    // Headless mode for build_and_run.py --bench
+    let args: Vec<String> = std::env::args().collect();
+    if args.len() > 1 && args[1] == "--render" {
+        if let Err(e) = render::run(&args[2..]) {
+            eprintln!("Error: {}", e);
+            std::process::exit(1);
+        }
+        return;
+    }
+
     println!("🎵 YM2151 (Nuked-OPM) Example");
     println!("Playing a 440Hz tone using real YM2151 emulator...");
 
@@ -0,0 +1,119 @@
+//! Headless render of a register script to raw PCM.
+//!
+//! Used by `build_and_run.py --bench` to compare the front ends. The script
+//! and output formats are shared with `src/python/script_render.py`:
+//!
+//! - script: one `<sample> <address> <data>` write per line (decimal native
+//!   sample, hexadecimal address and data), `#` starts a comment
+//! - output: interleaved stereo little-endian i32 at the native rate
+//!   (clock / 64), exactly as returned by OPM_Clock
+
+use std::fs::File;
+use std::io::{BufWriter, Write};
+use std::time::Instant;
+
+use crate::Ym2151;
+
+// OPM_Clock calls per native sample (one sample every 64 master clocks)
+const NATIVE_CLOCKS_PER_SAMPLE: u64 = 32;
+
+// Clocks between two port writes: the address byte must be latched before
+// the data byte overwrites the shared data bus
+const WRITE_DELAY: u32 = 2;
+
+/// Register write scheduled at an absolute chip clock
+struct Event {
+    cycle: u64,
+    address: u8,
+    data: u8,
+}
+
+fn load_script(path: &str) -> Result<Vec<Event>, String> {
+    let text = std::fs::read_to_string(path).map_err(|e| format!("{}: {}", path, e))?;
+    let mut events = Vec::new();
+    for (index, line) in text.lines().enumerate() {
+        let line = line.split('#').next().unwrap_or("").trim();
+        if line.is_empty() {
+            continue;
+        }
+        let fields: Vec<&str> = line.split_whitespace().collect();
+        let parsed = match fields.as_slice() {
+            [sample, address, data] => sample.parse::<u64>().ok().and_then(|sample| {
+                let address = u8::from_str_radix(address, 16).ok()?;
+                let data = u8::from_str_radix(data, 16).ok()?;
+                Some(Event {
+                    cycle: sample * NATIVE_CLOCKS_PER_SAMPLE,
+                    address,
+                    data,
+                })
+            }),
+            _ => None,
+        };
+        match parsed {
+            Some(event) => events.push(event),
+            None => {
+                return Err(format!(
+                    "{}:{}: expected '<sample> <address> <data>'",
+                    path,
+                    index + 1
+                ))
+            }
+        }
+    }
+    Ok(events)
+}
+
+/// Render `samples` native samples of the script; returns the render time
+fn render_script(
+    events: &[Event],
+    samples: u64,
+    out: &mut impl Write,
+) -> std::io::Result<f64> {
+    let mut chip = Ym2151::new();
+    let mut output = [0i32; 2];
+    let mut cycle = 0u64;
+    let mut wait = 0u32;
+    let mut pending: Option<u8> = None;
+    let mut next = 0usize;
+
+    let start = Instant::now();
+    for _ in 0..samples {
+        for _ in 0..NATIVE_CLOCKS_PER_SAMPLE {
+            // Same write timing as the Python scheduler (opm_render.c)
+            if wait == 0 {
+                if let Some(data) = pending.take() {
+                    chip.write_port(1, data);
+                    wait = WRITE_DELAY;
+                } else if next < events.len() && events[next].cycle <= cycle && !chip.is_busy() {
+                    chip.write_port(0, events[next].address);
+                    pending = Some(events[next].data);
+                    wait = WRITE_DELAY;
+                    next += 1;
+                }
+            }
+            chip.clock(&mut output);
+            cycle += 1;
+            wait = wait.saturating_sub(1);
+        }
+        out.write_all(&output[0].to_le_bytes())?;
+        out.write_all(&output[1].to_le_bytes())?;
+    }
+    out.flush()?;
+    Ok(start.elapsed().as_secs_f64())
+}
+
+/// Entry point for `ym2151-example --render <script> <output> <samples>`
+pub fn run(args: &[String]) -> Result<(), String> {
+    let [script, output, samples] = args else {
+        return Err("usage: ym2151-example --render <script> <output> <samples>".to_string());
+    };
+    let samples: u64 = samples
+        .parse()
+        .map_err(|_| format!("invalid sample count: {}", samples))?;
+    let events = load_script(script)?;
+    let file = File::create(output).map_err(|e| format!("{}: {}", output, e))?;
+    let mut out = BufWriter::new(file);
+    let elapsed = render_script(&events, samples, &mut out).map_err(|e| e.to_string())?;
+    println!("elapsed: {:.6}", elapsed);
+    Ok(())
+}
@@ -0,0 +1,121 @@
+/**
+ * YM2151 headless render of a register script to raw PCM
+ *
+ * Used by build_and_run.py --bench to compare the front ends. The script
+ * and output formats are shared with src/python/script_render.py:
+ *
+ * - script: one "<sample> <address> <data>" write per line (decimal native
+ *   sample, hexadecimal address and data), '#' starts a comment
+ * - output: interleaved stereo little-endian int32 at the native rate
+ *   (clock / 64)
+ *
+ * libymfm.wasm emulates the chip with ymfm rather than Nuked-OPM, so its
+ * output is compared by SNR instead of bit for bit.
+ *
+ * Usage: node dist/index-render.js <script> <output> <samples>
+ */
+
+import { closeSync, openSync, readFileSync, writeSync } from 'fs';
+import { Libymfm, SoundChipType } from './libymfm.js';
+
+// Configuration
+const SOUND_SLOT_INDEX = 0;
+const YM2151_CLOCK = 4000000;
+// Native chip rate (clock / 64); one driver tick per sample so that
+// writes land on the sample they are scheduled for
+const SAMPLING_RATE = YM2151_CLOCK / 64;
+const SOUND_DRIVER_TICK_RATE = SAMPLING_RATE;
+const SAMPLE_CHUNK_SIZE = 4096;
+
+interface ScriptEvent {
+  sample: number;
+  address: number;
+  data: number;
+}
+
+/**
+ * Parse a register script
+ */
+function loadScript(path: string): ScriptEvent[] {
+  const events: ScriptEvent[] = [];
+  readFileSync(path, 'utf8').split('\n').forEach((rawLine, index) => {
+    const line = rawLine.split('#')[0].trim();
+    if (line === '') {
+      return;
+    }
+    const fields = line.split(/\s+/);
+    const sample = Number.parseInt(fields[0], 10);
+    const address = Number.parseInt(fields[1], 16);
+    const data = Number.parseInt(fields[2], 16);
+    if (fields.length !== 3 || [sample, address, data].some(Number.isNaN)) {
+      throw new Error(`${path}:${index + 1}: expected '<sample> <address> <data>'`);
+    }
+    events.push({ sample, address, data });
+  });
+  return events;
+}
+
+/**
+ * Render the script and return the render time in seconds
+ */
+function renderScript(chip: Libymfm, events: ScriptEvent[], samples: number, fd: number): number {
+  const out = new Int32Array(SAMPLE_CHUNK_SIZE * 2);
+  let next = 0;
+  let written = 0;
+
+  const start = process.hrtime.bigint();
+  for (let tick = 0; written < samples; tick++) {
+    while (next < events.length && events[next].sample <= tick) {
+      chip.soundSlotWrite(SOUND_SLOT_INDEX, SoundChipType.YM2151, 0, events[next].address, events[next].data);
+      next++;
+    }
+    chip.soundSlotUpdate(SOUND_SLOT_INDEX, 1);
+    if (!chip.soundSlotIsStreamFilled(SOUND_SLOT_INDEX)) {
+      continue;
+    }
+
+    chip.soundSlotStream(SOUND_SLOT_INDEX);
+    const buffer = chip.soundSlotGetSamplingRef(SOUND_SLOT_INDEX, SAMPLE_CHUNK_SIZE);
+    const count = Math.min(SAMPLE_CHUNK_SIZE, samples - written);
+    for (let i = 0; i < count * 2; i++) {
+      out[i] = buffer[i];
+    }
+    // Int32Array uses the platform byte order, which is little-endian on
+    // every platform Node.js supports
+    writeSync(fd, out, 0, count * 8);
+    written += count;
+  }
+  return Number(process.hrtime.bigint() - start) / 1e9;
+}
+
+/**
+ * Main function
+ */
+async function main() {
+  const [scriptPath, outputPath, samplesArg] = process.argv.slice(2);
+  const samples = Number.parseInt(samplesArg, 10);
+  if (!scriptPath || !outputPath || Number.isNaN(samples)) {
+    console.error('usage: node dist/index-render.js <script> <output> <samples>');
+    process.exit(1);
+  }
+  const events = loadScript(scriptPath);
+
+  const chip = new Libymfm();
+  await chip.init();
+  chip.soundSlotCreate(SOUND_SLOT_INDEX, SOUND_DRIVER_TICK_RATE, SAMPLING_RATE, SAMPLE_CHUNK_SIZE);
+  chip.soundSlotAddSoundDevice(SOUND_SLOT_INDEX, SoundChipType.YM2151, 1, YM2151_CLOCK);
+
+  const fd = openSync(outputPath, 'w');
+  try {
+    const elapsed = renderScript(chip, events, samples, fd);
+    console.log(`elapsed: ${elapsed.toFixed(6)}`);
+  } finally {
+    closeSync(fd);
+    chip.soundSlotDrop(SOUND_SLOT_INDEX);
+  }
+}
+
+main().catch(error => {
+  console.error('Error:', error);
+  process.exit(1);
+});
@@ -113,6 +113,9 @@ export class Libymfm {
     
     this.instance = await WebAssembly.instantiate(wasmModule, importObject);
     this.exports = this.instance.exports as unknown as LibymfmExports;
+    // The module defines and exports its own memory; sampling buffers
+    // returned by *_ref() point into it, not into the imported one
+    this.memory = this.exports.memory;
   }
 
   /**